@@ -6,9 +6,11 @@
 DROP TABLE IF EXISTS referral_bonuses CASCADE;
 DROP TABLE IF EXISTS menu_views CASCADE;
 DROP TABLE IF EXISTS user_actions CASCADE;
+DROP TABLE IF EXISTS broadcast_deliveries CASCADE;
 DROP TABLE IF EXISTS broadcasts CASCADE;
 DROP TABLE IF EXISTS staff_calls CASCADE;
 DROP TABLE IF EXISTS reservations CASCADE;
+DROP TABLE IF EXISTS restaurant_tables CASCADE;
 DROP TABLE IF EXISTS delivery_orders CASCADE;
 DROP TABLE IF EXISTS payment_receipts CASCADE;
 DROP TABLE IF EXISTS bonus_transactions CASCADE;
@@ -19,6 +21,8 @@ DROP TABLE IF EXISTS users CASCADE;
 
 -- Удаляем функцию обновления updated_at
 DROP FUNCTION IF EXISTS update_updated_at_column CASCADE;
+DROP FUNCTION IF EXISTS notify_menu_changed CASCADE;
+DROP FUNCTION IF EXISTS notify_tables_changed CASCADE;
 
 -- =============================================
 -- СОЗДАНИЕ ТАБЛИЦ
@@ -34,6 +38,10 @@ CREATE TABLE users (
     major VARCHAR(50) CHECK (major IN ('student', 'entrepreneur', 'hire', 'frilans', 'other', 'unknown')),
     language_code VARCHAR(10) DEFAULT 'ru',
     is_blocked BOOLEAN DEFAULT FALSE,
+    -- Доставка из Telegram: пользователь заблокировал бота или чат не найден
+    is_reachable BOOLEAN DEFAULT TRUE,
+    unreachable_reason VARCHAR(20) CHECK (unreachable_reason IN ('blocked', 'chat_not_found')),
+    unreachable_since TIMESTAMP WITH TIME ZONE,
     
     -- Реферальные поля
     referrer_id BIGINT,
@@ -64,6 +72,7 @@ CREATE TABLE staff_users (
     user_id BIGINT PRIMARY KEY,
     username VARCHAR(255),
     full_name VARCHAR(255),
+    zone VARCHAR(50), -- Зона зала официанта (restaurant_tables.zone), NULL - любая
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
 );
@@ -90,11 +99,25 @@ CREATE TABLE reservations (
     customer_name VARCHAR(255) NOT NULL,
     customer_phone VARCHAR(20) NOT NULL,
     status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'confirmed', 'cancelled', 'completed')),
+    table_numbers INTEGER[], -- Столы, назначенные брони (restaurant_tables.table_number)
+    reminder_24h_sent_at TIMESTAMP WITH TIME ZONE, -- Когда отправлено напоминание за 24 часа
+    reminder_3h_sent_at TIMESTAMP WITH TIME ZONE, -- Когда отправлено напоминание за 3 часа
     notes TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Схема зала: столы и количество мест
+CREATE TABLE restaurant_tables (
+    id SERIAL PRIMARY KEY,
+    table_number INTEGER UNIQUE NOT NULL CHECK (table_number > 0 AND table_number <= 99),
+    seats INTEGER NOT NULL CHECK (seats > 0),
+    zone VARCHAR(50), -- Зона зала (сдвигать можно только столы одной зоны)
+    can_join BOOLEAN DEFAULT FALSE,
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Таблица вызовов персонала
 CREATE TABLE staff_calls (
     id SERIAL PRIMARY KEY,
@@ -105,6 +128,12 @@ CREATE TABLE staff_calls (
     accepted_by_name VARCHAR(255),  -- Имя официанта
     accepted_by BIGINT,             -- ID официанта
     message_ids JSONB,
+    -- Задержка уведомления каждого официанта, мс: {"staff_id": ms}
+    notify_latencies JSONB,
+    notified_at TIMESTAMP WITH TIME ZONE,  -- все официанты уведомлены
+    -- Эскалация непринятого вызова: 0 - нет, 1 - остальной персонал, 2 - повторное уведомление, 3 - администраторам
+    escalation_level SMALLINT NOT NULL DEFAULT 0,
+    escalated_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     accepted_at TIMESTAMP WITH TIME ZONE,
     completed_at TIMESTAMP WITH TIME ZONE,
@@ -121,15 +150,39 @@ CREATE TABLE broadcasts (
     buttons JSONB,
     target_sex VARCHAR(10) CHECK (target_sex IN ('male', 'female', 'all')),
     target_major VARCHAR(50) CHECK (target_major IN ('student', 'entrepreneur', 'hire', 'frilans', 'all')),
+    segment_key VARCHAR(50),
+    -- Свой сегмент администратора (выражение src/database/segments.py)
+    segment_expression TEXT,
     sent_count INTEGER DEFAULT 0,
+    failed_count INTEGER DEFAULT 0,
+    blocked_count INTEGER DEFAULT 0,
+    -- Недоступные пользователи сегмента, исключенные из рассылки
+    pruned_count INTEGER DEFAULT 0,
     total_count INTEGER DEFAULT 0,
     read_count INTEGER DEFAULT 0,
-    status VARCHAR(20) DEFAULT 'draft' CHECK (status IN ('draft', 'sending', 'completed', 'cancelled')),
+    status VARCHAR(20) DEFAULT 'draft' CHECK (status IN ('draft', 'scheduled', 'sending', 'paused', 'completed', 'cancelled')),
+    -- Сообщение администратора с прогрессом (продолжает обновляться после перезапуска)
+    progress_chat_id BIGINT,
+    progress_message_id BIGINT,
+    -- Экземпляр бота, который ведет отправку, и срок его аренды (продлевается, пока он жив)
+    lease_owner VARCHAR(100),
+    lease_until TIMESTAMP WITH TIME ZONE,
     scheduled_at TIMESTAMP WITH TIME ZONE,
+    -- Начало отправки и завершение (задержка старта и длительность рассылки)
+    started_at TIMESTAMP WITH TIME ZONE,
     sent_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Журнал доставки рассылок: по строке на получателя, по нему рассылка продолжается после перезапуска
+CREATE TABLE broadcast_deliveries (
+    broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'sent', 'failed', 'blocked', 'not_found')),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (broadcast_id, user_id)
+);
+
 -- Таблица действий пользователей
 CREATE TABLE user_actions (
     id SERIAL PRIMARY KEY,
@@ -245,6 +298,7 @@ CREATE INDEX idx_users_sex ON users(sex);
 CREATE INDEX idx_users_major ON users(major);
 CREATE INDEX idx_users_created_at ON users(created_at);
 CREATE INDEX idx_users_blocked ON users(is_blocked);
+CREATE INDEX idx_users_unreachable ON users(unreachable_since) WHERE is_reachable = FALSE;
 CREATE INDEX idx_users_referral_code ON users(referral_code);
 CREATE INDEX idx_users_referrer_id ON users(referrer_id);
 
@@ -263,17 +317,26 @@ CREATE INDEX idx_reservations_user_id ON reservations(user_id);
 CREATE INDEX idx_reservations_date ON reservations(reservation_date);
 CREATE INDEX idx_reservations_status ON reservations(status);
 CREATE INDEX idx_reservations_created_at ON reservations(created_at);
+-- Окно начала подтвержденных броней для планировщика напоминаний
+CREATE INDEX idx_reservations_confirmed_start ON reservations((reservation_date + reservation_time))
+    WHERE status = 'confirmed';
 
 -- Индексы для staff_calls
 CREATE INDEX idx_staff_calls_status ON staff_calls(status);
 CREATE INDEX idx_staff_calls_created ON staff_calls(created_at);
 CREATE INDEX idx_staff_calls_user ON staff_calls(user_id);
 CREATE INDEX idx_staff_calls_table ON staff_calls(table_number);
+-- Непринятые вызовы (восстановление таймеров эскалации при запуске)
+CREATE INDEX idx_staff_calls_pending ON staff_calls(created_at) WHERE status = 'pending';
+-- Загрузка официантов при маршрутизации вызовов
+CREATE INDEX idx_staff_calls_accepted_by ON staff_calls(accepted_by, accepted_at);
 
 -- Индексы для user_actions
 CREATE INDEX idx_user_actions_user_id ON user_actions(user_id);
 CREATE INDEX idx_user_actions_type ON user_actions(action_type);
 CREATE INDEX idx_user_actions_created_at ON user_actions(created_at);
+-- Последняя активность пользователя (сегмент inactive_days)
+CREATE INDEX idx_user_actions_user_created ON user_actions(user_id, created_at);
 
 -- Индексы для menu_views
 CREATE INDEX idx_menu_views_user_id ON menu_views(user_id);
@@ -281,13 +344,16 @@ CREATE INDEX idx_menu_views_category ON menu_views(category);
 
 -- Индексы для broadcasts
 CREATE INDEX idx_broadcasts_status ON broadcasts(status);
-CREATE INDEX idx_broadcasts_scheduled ON broadcasts(scheduled_at);
+CREATE INDEX idx_broadcasts_scheduled ON broadcasts(scheduled_at) WHERE status = 'scheduled';
 CREATE INDEX idx_broadcasts_type ON broadcasts(message_type);
 CREATE INDEX idx_broadcasts_created ON broadcasts(created_at);
+CREATE INDEX idx_broadcast_deliveries_queued ON broadcast_deliveries(broadcast_id, user_id) WHERE status = 'queued';
 
 -- Индексы для delivery
 CREATE INDEX idx_delivery_orders_status ON delivery_orders(status);
 CREATE INDEX idx_delivery_orders_created ON delivery_orders(created_at);
+-- Заказы пользователя (сегменты orders, spent)
+CREATE INDEX idx_delivery_orders_user ON delivery_orders(user_id, status);
 CREATE INDEX idx_delivery_menu_category ON delivery_menu(category);
 CREATE INDEX idx_delivery_menu_available ON delivery_menu(is_available);
 
@@ -322,6 +388,34 @@ CREATE TRIGGER update_delivery_orders_updated_at
     FOR EACH ROW 
     EXECUTE FUNCTION update_updated_at_column();
 
+-- Уведомление процессов бота об изменении меню доставки (сброс MenuCatalog)
+CREATE OR REPLACE FUNCTION notify_menu_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('menu_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER delivery_menu_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON delivery_menu
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_menu_changed();
+
+-- Уведомление процессов бота об изменении схемы зала (сброс схемы и рассадок)
+CREATE OR REPLACE FUNCTION notify_tables_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('tables_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER restaurant_tables_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON restaurant_tables
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_tables_changed();
+
 -- =============================================
 -- ТЕСТОВЫЕ ДАННЫЕ
 -- =============================================
@@ -380,6 +474,23 @@ ON CONFLICT (id) DO UPDATE SET
     description = EXCLUDED.description,
     price = EXCLUDED.price;
 
+-- Схема зала: 10 столов, 40 мест
+INSERT INTO restaurant_tables (table_number, seats, zone, can_join) VALUES
+(1, 2, 'window', TRUE),
+(2, 2, 'window', TRUE),
+(3, 2, 'window', TRUE),
+(4, 4, 'hall', TRUE),
+(5, 4, 'hall', TRUE),
+(6, 4, 'hall', TRUE),
+(7, 4, 'hall', TRUE),
+(8, 6, 'lounge', FALSE),
+(9, 6, 'lounge', FALSE),
+(10, 6, 'lounge', FALSE)
+ON CONFLICT (table_number) DO UPDATE SET
+    seats = EXCLUDED.seats,
+    zone = EXCLUDED.zone,
+    can_join = EXCLUDED.can_join;
+
 -- Вставляем текущих админов и стафф (после создания пользователей)
 INSERT INTO admin_users (user_id, username, full_name) 
 VALUES 
@@ -413,6 +524,8 @@ SELECT 'bonus_transactions', COUNT(*) FROM bonus_transactions
 UNION ALL
 SELECT 'reservations', COUNT(*) FROM reservations
 UNION ALL
+SELECT 'restaurant_tables', COUNT(*) FROM restaurant_tables
+UNION ALL
 SELECT 'staff_calls', COUNT(*) FROM staff_calls
 UNION ALL
 SELECT 'user_actions', COUNT(*) FROM user_actions
@@ -421,6 +534,8 @@ SELECT 'menu_views', COUNT(*) FROM menu_views
 UNION ALL
 SELECT 'broadcasts', COUNT(*) FROM broadcasts
 UNION ALL
+SELECT 'broadcast_deliveries', COUNT(*) FROM broadcast_deliveries
+UNION ALL
 SELECT 'delivery_orders', COUNT(*) FROM delivery_orders
 UNION ALL
 SELECT 'delivery_menu', COUNT(*) FROM delivery_menu;
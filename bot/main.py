@@ -12,9 +12,14 @@ from src.utils.config import settings
 from src.utils.logger import setup_logging, get_logger
 from src.handlers import router as main_router
 from src.database.db_manager import DatabaseManager
+from src.database.analytics_writer import AnalyticsWriter
 from src.utils.reminders import start_reminder_system, stop_reminder_system
+from src.utils.broadcast_jobs import start_broadcast_jobs, stop_broadcast_jobs
+from src.utils.telegram_sender import start_outbound_dispatcher, stop_outbound_dispatcher
+from src.utils.staff_call_escalation import start_staff_call_escalation, stop_staff_call_escalation
 from src.utils.rate_limiter import rate_limiter
 from src.middlewares.fsm_middleware import FSMMiddleware
+from src.middlewares.user_context_middleware import UserContextMiddleware
 from src.utils.fsm_cleanup import start_fsm_cleanup
 
 # Инициализация менеджера базы данных
@@ -101,6 +106,21 @@ async def main():
         else:
             # Добавляем администраторов по умолчанию
             await init_default_admins(db_manager)
+
+            # Прогреваем кэши ролей и меню и при необходимости подписываемся на изменения
+            await db_manager.refresh_role_cache(force=True)
+            await db_manager.menu_catalog.ensure_loaded()
+            if settings.CACHE_NOTIFY_LISTEN:
+                await db_manager.start_notify_listener()
+
+            # Аналитика пишется в БД фоновыми пакетами
+            db_manager.analytics_writer = AnalyticsWriter(
+                db_manager,
+                flush_interval_ms=settings.ANALYTICS_FLUSH_INTERVAL_MS,
+                batch_size=settings.ANALYTICS_BATCH_SIZE,
+                max_queue_size=settings.ANALYTICS_MAX_QUEUE_SIZE
+            )
+            await db_manager.analytics_writer.start()
         
         # Логируем информацию о боте
         logger.info("🤖 Initializing bot with token: %s...", settings.BOT_TOKEN[:10] + "..." if settings.BOT_TOKEN else "None")
@@ -117,6 +137,10 @@ async def main():
         # 🔥 ДОБАВЛЯЕМ MIDDLEWARE ДЛЯ FSM
         dp.message.middleware(FSMMiddleware())
         dp.callback_query.middleware(FSMMiddleware())
+
+        # Пользователь и его права загружаются один раз на апдейт
+        dp.message.middleware(UserContextMiddleware())
+        dp.callback_query.middleware(UserContextMiddleware())
         
         # Передаем l10n и db_manager в диспетчер через work_data
         dp.workflow_data.update({
@@ -128,10 +152,22 @@ async def main():
         # Регистрируем роутеры
         dp.include_router(main_router)
 
+        # Единая очередь исходящих сообщений: лимиты Telegram и приоритет вызовов персонала
+        start_outbound_dispatcher(bot)
+        logger.info("📬 Outbound dispatcher started")
+
         # Запускаем систему напоминаний
         await start_reminder_system(bot, db_manager)
         logger.info("🔔 Reminder system started")
 
+        # Таймеры эскалации непринятых вызовов персонала (восстанавливаются из БД)
+        await start_staff_call_escalation(bot, db_manager)
+        logger.info("🚨 Staff call escalation started")
+
+        # Рассылки выполняются в фоне, прерванные продолжаются по журналу доставки
+        await start_broadcast_jobs(bot, db_manager)
+        logger.info("📤 Broadcast jobs started")
+
         # 🆕 ЗАПУСКАЕМ CLEANUP RATE LIMITING (после создания бота)
         asyncio.create_task(cleanup_rate_limits())
         logger.info("🧹 Rate limiting cleanup task started")
@@ -157,6 +193,11 @@ async def main():
         raise
     finally:
         logger.info("🛑 Bot stopped")
+        await stop_broadcast_jobs()  # Дописываем журнал доставки запущенных рассылок
+        await stop_staff_call_escalation()
+        await stop_outbound_dispatcher()  # Отправляем то, что осталось в очереди
+        if db_manager.analytics_writer:
+            await db_manager.analytics_writer.stop()  # Дописываем накопленную аналитику
         await close_database()  # Закрываем соединение с БД
         if 'bot' in locals():
             await bot.session.close()
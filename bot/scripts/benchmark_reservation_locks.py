@@ -0,0 +1,127 @@
+"""
+Бенчмарк конкурентного создания броней.
+
+Сравнивает старую схему (SERIALIZABLE + LOCK TABLE reservations) с текущей
+(READ COMMITTED + pg_advisory_xact_lock на дату): N клиентов одновременно
+бронируют столы на несколько дат, замеряется время и пропускная способность.
+
+Запуск из каталога bot (нужна тестовая БД, брони создаются и удаляются
+от имени отдельного служебного пользователя):
+
+    python -m scripts.benchmark_reservation_locks --bookers 100 --dates 7
+"""
+import argparse
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+import asyncpg
+
+from src.database.reservation_manager import ReservationManager
+from src.utils.config import settings
+
+BENCHMARK_USER_ID = 999_000_000_001
+
+
+class BenchmarkDatabase:
+    """Минимальная замена DatabaseManager: ReservationManager нужен только pool"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+
+class TableLockReservationManager(ReservationManager):
+    """Прежняя стратегия блокировки - для сравнения"""
+
+    @asynccontextmanager
+    async def reservation_transaction(self, reservation_date: str, reservation_time: str):
+        async with self.db_manager.pool.acquire() as conn:
+            async with conn.transaction(isolation='serializable'):
+                await conn.execute("LOCK TABLE reservations IN SHARE UPDATE EXCLUSIVE MODE")
+                yield conn
+
+
+async def run_bookers(manager: ReservationManager, bookers: int, dates: list, seed: int) -> dict:
+    """Одновременный запуск bookers попыток бронирования"""
+    rng = random.Random(seed)
+    slots = manager.get_time_slots()
+    requests = [
+        (rng.choice(dates), rng.choice(slots), rng.randint(1, 4))
+        for _ in range(bookers)
+    ]
+
+    latencies = []
+
+    async def book(reservation_date: str, reservation_time: str, guests: int):
+        started = time.perf_counter()
+        reservation_id = await manager.create_reservation_atomic(
+            BENCHMARK_USER_ID, reservation_date, reservation_time, guests, "Benchmark", "+70000000000"
+        )
+        latencies.append(time.perf_counter() - started)
+        return reservation_id
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(book(*request) for request in requests))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'elapsed': elapsed,
+        'created': sum(1 for result in results if result),
+        'rejected': sum(1 for result in results if not result),
+        'throughput': bookers / elapsed if elapsed else 0,
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+async def cleanup(pool):
+    await pool.execute("DELETE FROM reservations WHERE user_id = $1", BENCHMARK_USER_ID)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Reservation locking contention benchmark")
+    parser.add_argument("--bookers", type=int, default=50, help="количество одновременных бронирований")
+    parser.add_argument("--dates", type=int, default=7, help="на сколько разных дат распределять брони")
+    parser.add_argument("--rounds", type=int, default=3, help="количество прогонов каждой стратегии")
+    parser.add_argument("--dsn", default=settings.DATABASE_URL)
+    args = parser.parse_args()
+
+    # Одно соединение на бронь, чтобы замерять конкуренцию за блокировки, а не за пул
+    pool = await asyncpg.create_pool(args.dsn, min_size=2, max_size=args.bookers + 2)
+    try:
+        await pool.execute('''
+            INSERT INTO users (user_id, full_name) VALUES ($1, 'Reservation benchmark')
+            ON CONFLICT (user_id) DO NOTHING
+        ''', BENCHMARK_USER_ID)
+
+        # Далекие даты, чтобы не пересекаться с реальными бронями
+        first_date = date.today() + timedelta(days=300)
+        dates = [(first_date + timedelta(days=i)).strftime("%d.%m.%Y") for i in range(args.dates)]
+
+        strategies = {
+            'LOCK TABLE (serializable)': TableLockReservationManager(BenchmarkDatabase(pool)),
+            'advisory lock per date': ReservationManager(BenchmarkDatabase(pool)),
+        }
+
+        print(f"Bookers: {args.bookers}, dates: {args.dates}, rounds: {args.rounds}\n")
+        for name, manager in strategies.items():
+            for round_number in range(args.rounds):
+                await cleanup(pool)
+                stats = await run_bookers(manager, args.bookers, dates, seed=round_number)
+                print(
+                    f"{name:<28} round {round_number + 1}: "
+                    f"{stats['elapsed']:.3f}s, {stats['throughput']:.1f} bookings/s, "
+                    f"created {stats['created']}, rejected {stats['rejected']}, "
+                    f"p50 {stats['p50'] * 1000:.0f}ms, p95 {stats['p95'] * 1000:.0f}ms"
+                )
+    finally:
+        await cleanup(pool)
+        await pool.execute("DELETE FROM users WHERE user_id = $1", BENCHMARK_USER_ID)
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
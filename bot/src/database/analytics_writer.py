@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+class AnalyticsWriter:
+    """
+    Отложенная пакетная запись аналитики (user_actions, menu_views).
+
+    Хендлеры только кладут события в очередь в памяти, запись в БД
+    происходит в фоне раз в flush_interval_ms или при накоплении batch_size строк.
+    """
+
+    def __init__(self, db_manager, flush_interval_ms: int = 1000, batch_size: int = 500,
+                 max_queue_size: int = 10000):
+        self.db_manager = db_manager
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_queue_size = max_queue_size
+
+        self.actions: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        # {(user_id, category): [view_count, last_viewed_at]} - агрегируем до записи
+        self.menu_views: Dict[Tuple[int, str], list] = {}
+
+        self.is_running = False
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+        self.stats = {
+            'actions_queued': 0,
+            'actions_written': 0,
+            'actions_dropped': 0,
+            'actions_failed': 0,
+            'menu_views_queued': 0,
+            'menu_views_dropped': 0,
+            'menu_views_failed': 0,
+            'flushes': 0,
+        }
+
+    # ==================== ENQUEUE ====================
+    def add_user_action(self, user_id: int, action_type: str, action_data: Dict = None) -> bool:
+        """Постановка действия в очередь без ожидания БД"""
+        record = (
+            user_id,
+            action_type,
+            json.dumps(action_data) if action_data else None,
+            datetime.now(timezone.utc)
+        )
+        try:
+            self.actions.put_nowait(record)
+        except asyncio.QueueFull:
+            # Очередь переполнена - БД не успевает, отбрасываем событие
+            self.stats['actions_dropped'] += 1
+            if self.stats['actions_dropped'] % 1000 == 1:
+                logger.warning(f"⚠️ Analytics queue full, dropped {self.stats['actions_dropped']} actions so far")
+            return False
+
+        self.stats['actions_queued'] += 1
+        if self.actions.qsize() >= self.batch_size:
+            self._flush_requested.set()
+        return True
+
+    def add_menu_view(self, user_id: int, category: str) -> bool:
+        """Учет просмотра категории меню (агрегируется до следующего сброса)"""
+        key = (user_id, category)
+        entry = self.menu_views.get(key)
+        if entry:
+            entry[0] += 1
+            entry[1] = datetime.now(timezone.utc)
+        elif len(self.menu_views) >= self.max_queue_size:
+            self.stats['menu_views_dropped'] += 1
+            return False
+        else:
+            self.menu_views[key] = [1, datetime.now(timezone.utc)]
+
+        self.stats['menu_views_queued'] += 1
+        return True
+
+    # ==================== LIFECYCLE ====================
+    async def start(self):
+        """Запуск фонового цикла записи"""
+        self.is_running = True
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"📝 Analytics writer started (interval: {self.flush_interval}s, batch: {self.batch_size})")
+
+    async def stop(self):
+        """Остановка и финальная запись всего, что осталось в очереди"""
+        self.is_running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        while not self.actions.empty() or self.menu_views:
+            if not await self.flush():
+                break
+        logger.info(f"📝 Analytics writer stopped: {self.stats}")
+
+    async def _run(self):
+        while self.is_running:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Analytics flush error: {e}")
+
+    # ==================== FLUSH ====================
+    async def flush(self) -> bool:
+        """Запись накопленных событий в БД. Возвращает False при ошибке записи"""
+        async with self._flush_lock:
+            actions = []
+            while not self.actions.empty() and len(actions) < self.batch_size:
+                actions.append(self.actions.get_nowait())
+
+            menu_views, self.menu_views = self.menu_views, {}
+
+            if not actions and not menu_views:
+                return True
+
+            ok = True
+            if actions:
+                try:
+                    written = await self._write_actions(actions)
+                    self.stats['actions_written'] += written
+                except Exception as e:
+                    ok = False
+                    self.stats['actions_failed'] += len(actions)
+                    logger.error(f"❌ Failed to write {len(actions)} user actions: {e}")
+
+            if menu_views:
+                try:
+                    await self._write_menu_views(menu_views)
+                except Exception as e:
+                    ok = False
+                    self.stats['menu_views_failed'] += len(menu_views)
+                    logger.error(f"❌ Failed to write {len(menu_views)} menu views: {e}")
+
+            self.stats['flushes'] += 1
+            return ok
+
+    async def _write_actions(self, actions: list) -> int:
+        """COPY пакета действий в user_actions"""
+        async with self.db_manager.pool.acquire() as conn:
+            try:
+                await conn.copy_records_to_table(
+                    'user_actions',
+                    records=actions,
+                    columns=['user_id', 'action_type', 'action_data', 'created_at']
+                )
+                return len(actions)
+            except asyncpg.ForeignKeyViolationError:
+                # В пакете есть действия несуществующих пользователей - пишем остальные
+                result = await conn.execute('''
+                    INSERT INTO user_actions (user_id, action_type, action_data, created_at)
+                    SELECT a.user_id, a.action_type, a.action_data::jsonb, a.created_at
+                    FROM unnest($1::bigint[], $2::text[], $3::text[], $4::timestamptz[])
+                        AS a(user_id, action_type, action_data, created_at)
+                    WHERE EXISTS (SELECT 1 FROM users u WHERE u.user_id = a.user_id)
+                ''', *map(list, zip(*actions)))
+                written = int(result.split()[-1])
+                if written < len(actions):
+                    logger.warning(f"⚠️ Skipped {len(actions) - written} actions of unknown users")
+                return written
+
+    async def _write_menu_views(self, menu_views: Dict[Tuple[int, str], list]):
+        """Один многострочный upsert агрегированных просмотров меню"""
+        user_ids, categories, counts, viewed_at = [], [], [], []
+        for (user_id, category), (count, last_viewed_at) in menu_views.items():
+            user_ids.append(user_id)
+            categories.append(category)
+            counts.append(count)
+            viewed_at.append(last_viewed_at)
+
+        async with self.db_manager.pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO menu_views (user_id, category, view_count, last_viewed_at)
+                SELECT v.user_id, v.category, v.view_count, v.last_viewed_at
+                FROM unnest($1::bigint[], $2::text[], $3::int[], $4::timestamptz[])
+                    AS v(user_id, category, view_count, last_viewed_at)
+                WHERE EXISTS (SELECT 1 FROM users u WHERE u.user_id = v.user_id)
+                ON CONFLICT (user_id, category) DO UPDATE SET
+                view_count = menu_views.view_count + EXCLUDED.view_count,
+                last_viewed_at = GREATEST(menu_views.last_viewed_at, EXCLUDED.last_viewed_at)
+            ''', user_ids, categories, counts, viewed_at)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики очереди для мониторинга"""
+        return {
+            **self.stats,
+            'actions_pending': self.actions.qsize(),
+            'menu_views_pending': len(self.menu_views),
+        }
@@ -1,11 +1,15 @@
 import asyncpg
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
 from datetime import datetime, date, time
 import json
 import logging
-from asyncio import sleep
+from asyncio import sleep, Lock, CancelledError, create_task
+from time import monotonic
 
 from src.database.reservation_manager import ReservationManager
+from src.database.role_cache import role_cache
+from src.database.menu_catalog import MenuCatalog
+from src.database.segments import PREDEFINED_SEGMENTS, compile_segment, resolve_segment
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +24,16 @@ class DatabaseManager:
         self.max_retries = 3
         self.retry_delay = 1
         self.reservation_manager = None
+        self.menu_catalog = None
+        self.dsn = None
+        self.notify_listener = None  # Отдельное соединение для LISTEN (roles_changed, menu_changed, tables_changed)
+        self.notify_listen_enabled = False
+        self._notify_reconnect_task = None
+        self.analytics_writer = None  # Отложенная запись user_actions/menu_views
+        self._roles_lock = Lock()
+        # Размеры сегментов рассылки: (loaded_at, {segment_key: count})
+        self.segment_counts_cache: Optional[Tuple[float, Dict[str, int]]] = None
+        self.segment_counts_ttl = 60
 
     async def execute_with_retry(self, operation, *args, **kwargs):
         """
@@ -44,8 +58,10 @@ class DatabaseManager:
     async def init_pool(self, dsn: str):
         """Инициализация пула соединений и менеджера бронирований"""
         try:
+            self.dsn = dsn
             self.pool = await asyncpg.create_pool(dsn)
             self.reservation_manager = ReservationManager(self)
+            self.menu_catalog = MenuCatalog(self)
             await self.execute_with_retry(self._health_check_impl)
             self.logger.info("✅ Database connection pool created successfully")
         except Exception as e:
@@ -54,6 +70,13 @@ class DatabaseManager:
         
     async def close_pool(self):
         """Закрытие пула соединений"""
+        self.notify_listen_enabled = False
+        if self._notify_reconnect_task:
+            self._notify_reconnect_task.cancel()
+            self._notify_reconnect_task = None
+        if self.notify_listener:
+            await self.notify_listener.close()
+            self.notify_listener = None
         if self.pool:
             await self.pool.close()
             self.logger.info("✅ Database connection pool closed")
@@ -64,6 +87,85 @@ class DatabaseManager:
             result = await conn.fetchval("SELECT 1")
             return result == 1
 
+    async def start_notify_listener(self) -> bool:
+        """
+        Подписка на NOTIFY-каналы для синхронизации кэшей между процессами бота.
+        Оборванное соединение восстанавливается в фоне (ensure_notify_listener)
+        """
+        self.notify_listen_enabled = True
+        connected = await self.ensure_notify_listener()
+        if not connected:
+            self._schedule_notify_reconnect()
+        return connected
+
+    @property
+    def notify_listener_connected(self) -> bool:
+        return self.notify_listener is not None and not self.notify_listener.is_closed()
+
+    async def ensure_notify_listener(self) -> bool:
+        """Переподключение LISTEN-соединения, если оно оборвалось. True - соединение есть"""
+        if not self.notify_listen_enabled:
+            return False
+        if self.notify_listener_connected:
+            return True
+
+        def _on_roles_changed(connection, pid, channel, payload):
+            role_cache.invalidate()
+            logger.debug(f"🔔 Role cache invalidated by NOTIFY from pid {pid}")
+
+        def _on_menu_changed(connection, pid, channel, payload):
+            if self.menu_catalog:
+                self.menu_catalog.invalidate()
+            logger.debug(f"🔔 Menu catalog invalidated by NOTIFY from pid {pid}")
+
+        def _on_tables_changed(connection, pid, channel, payload):
+            if self.reservation_manager:
+                self.reservation_manager.invalidate_tables()
+            logger.debug(f"🔔 Restaurant layout invalidated by NOTIFY from pid {pid}")
+
+        def _on_terminated(connection):
+            logger.warning("⚠️ Notify listener connection lost, reconnecting")
+            self._schedule_notify_reconnect()
+
+        reconnected = self.notify_listener is not None
+        try:
+            connection = await asyncpg.connect(self.dsn)
+            await connection.add_listener('roles_changed', _on_roles_changed)
+            await connection.add_listener('menu_changed', _on_menu_changed)
+            await connection.add_listener('tables_changed', _on_tables_changed)
+            connection.add_termination_listener(_on_terminated)
+            self.notify_listener = connection
+        except Exception as e:
+            logger.error(f"❌ Failed to start notify listener: {e}")
+            return False
+
+        if reconnected:
+            # Уведомления, пришедшие без соединения, потеряны - перечитываем кэши
+            role_cache.invalidate()
+            if self.menu_catalog:
+                self.menu_catalog.invalidate()
+            if self.reservation_manager:
+                self.reservation_manager.invalidate_tables()
+        logger.info("✅ Listening for cache invalidation on 'roles_changed', 'menu_changed', 'tables_changed'")
+        return True
+
+    def _schedule_notify_reconnect(self):
+        if not self.notify_listen_enabled:
+            return
+        if self._notify_reconnect_task and not self._notify_reconnect_task.done():
+            return
+        self._notify_reconnect_task = create_task(self._reconnect_notify_listener())
+
+    async def _reconnect_notify_listener(self):
+        """Повторные попытки подключения: 5, 10, 20... секунд, не реже раза в минуту"""
+        delay = 5
+        try:
+            while self.notify_listen_enabled and not await self.ensure_notify_listener():
+                await sleep(delay)
+                delay = min(delay * 2, 60)
+        except CancelledError:
+            pass
+
     async def health_check(self) -> bool:
         """Проверка соединения с базой данных с повторными попытками"""
         try:
@@ -155,35 +257,160 @@ class DatabaseManager:
             logger.error(f"❌ Failed to get user {user_id}: {e}")
             return None
 
-    async def get_users_by_segment(self, segment_key: str) -> List[Dict]:
-        """Получение пользователей по сегменту"""
-        async def _get_users_by_segment():
+    async def get_user_context(self, user_id: int) -> Optional[Dict]:
+        """Пользователь, флаг блокировки и роли (админ/персонал) одним запросом"""
+        async def _get_user_context():
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow('''
+                    SELECT
+                        u.user_id IS NOT NULL as user_exists,
+                        COALESCE(u.is_blocked, FALSE) as is_blocked,
+                        EXISTS (SELECT 1 FROM admin_users WHERE user_id = q.uid) as is_admin,
+                        EXISTS (
+                            SELECT 1 FROM admin_users WHERE user_id = q.uid
+                            UNION ALL
+                            SELECT 1 FROM staff_users WHERE user_id = q.uid
+                        ) as is_staff,
+                        u.username, u.full_name, u.sex, u.major, u.language_code,
+                        u.referrer_id, u.bonus_balance, u.created_at,
+                        COALESCE(u.is_reachable, TRUE) as is_reachable
+                    FROM (SELECT $1::BIGINT as uid) q
+                    LEFT JOIN users u ON u.user_id = q.uid
+                ''', user_id)
+
+                result = dict(row)
+                user_fields = ('username', 'full_name', 'sex', 'major', 'language_code',
+                               'referrer_id', 'bonus_balance', 'created_at')
+                return {
+                    'exists': result['user_exists'],
+                    'is_blocked': result['is_blocked'],
+                    'is_admin': result['is_admin'],
+                    'is_staff': result['is_staff'],
+                    'is_reachable': result['is_reachable'],
+                    'user': {key: result[key] for key in user_fields} if result['user_exists'] else {}
+                }
+        try:
+            return await self.execute_with_retry(_get_user_context)
+        except Exception as e:
+            logger.error(f"❌ Failed to get user context {user_id}: {e}")
+            return None
+
+    @staticmethod
+    def _segment_condition(params: list, segment_key: str = None, segment_expression: str = None,
+                           reachable_only: bool = True) -> str:
+        """
+        Условие WHERE над users u для сегмента рассылки: готового (segment_key)
+        или своего (segment_expression). Значения условий добавляются в params
+        """
+        return compile_segment(resolve_segment(segment_key, segment_expression), params, reachable_only)
+
+    async def get_segment_counts(self) -> Dict[str, int]:
+        """
+        Размеры всех сегментов рассылки одним проходом по users (COUNT(*) FILTER)
+        с коротким кэшем: меню рассылки открывается без повторных подсчетов
+        """
+        cached = self.segment_counts_cache
+        if cached and monotonic() - cached[0] < self.segment_counts_ttl:
+            return cached[1]
+        
+        async def _get_segment_counts():
+            async with self.pool.acquire() as conn:
+                params = []
+                filters = ", ".join(
+                    f"COUNT(*) FILTER (WHERE {segment.expression.compile(params)}) as {segment_key}"
+                    for segment_key, segment in PREDEFINED_SEGMENTS.items()
+                    if segment_key != "all"
+                )
+                row = await conn.fetchrow(f'''
+                    SELECT COUNT(*) as "all", {filters}
+                    FROM users u
+                    WHERE {self._segment_condition(params)}
+                ''', *params)
+                return dict(row)
+        
+        try:
+            counts = await self.execute_with_retry(_get_segment_counts)
+        except Exception as e:
+            logger.error(f"❌ Failed to get segment counts: {e}")
+            return cached[1] if cached else {}
+        
+        self.segment_counts_cache = (monotonic(), counts)
+        return counts
+
+    async def count_segment(self, segment_key: str = None, segment_expression: str = None) -> int:
+        """Размер сегмента (предпросмотр перед рассылкой)"""
+        async def _count_segment():
             async with self.pool.acquire() as conn:
-                base_query = "SELECT user_id FROM users WHERE is_blocked = FALSE"
+                params = []
+                condition = self._segment_condition(params, segment_key, segment_expression)
+                return await conn.fetchval(f"SELECT COUNT(*) FROM users u WHERE {condition}", *params)
+        
+        try:
+            return await self.execute_with_retry(_count_segment)
+        except Exception as e:
+            logger.error(f"❌ Failed to count segment {segment_key or segment_expression}: {e}")
+            return 0
+
+    async def explain_segment(self, segment_key: str = None, segment_expression: str = None) -> Optional[Dict]:
+        """
+        План выборки сегмента (EXPLAIN без выполнения): оценка стоимости и строк,
+        таблицы, которые читаются целиком, и используемые индексы
+        """
+        async def _explain_segment():
+            async with self.pool.acquire() as conn:
+                params = []
+                condition = self._segment_condition(params, segment_key, segment_expression)
+                plan_json = await conn.fetchval(
+                    f"EXPLAIN (FORMAT JSON) SELECT u.user_id FROM users u WHERE {condition} ORDER BY u.user_id",
+                    *params
+                )
+                plan = (json.loads(plan_json) if isinstance(plan_json, str) else plan_json)[0]['Plan']
                 
-                if segment_key == "male":
-                    query = f"{base_query} AND sex = 'male'"
-                elif segment_key == "female":
-                    query = f"{base_query} AND sex = 'female'"
-                elif segment_key == "students":
-                    query = f"{base_query} AND major = 'student'"
-                elif segment_key == "entrepreneurs":
-                    query = f"{base_query} AND major = 'entrepreneur'"
-                elif segment_key == "employees":
-                    query = f"{base_query} AND major = 'hire'"
-                elif segment_key == "freelancers":
-                    query = f"{base_query} AND major = 'frilans'"
-                else:
-                    query = base_query  # all users
+                seq_scans, indexes = set(), set()
+                nodes = [plan]
+                while nodes:
+                    node = nodes.pop()
+                    if node.get('Node Type') == 'Seq Scan':
+                        seq_scans.add(node.get('Relation Name'))
+                    if node.get('Index Name'):
+                        indexes.add(node['Index Name'])
+                    nodes.extend(node.get('Plans', []))
                 
-                rows = await conn.fetch(query)
-                return [dict(row) for row in rows]
+                return {
+                    'total_cost': plan.get('Total Cost', 0),
+                    'plan_rows': plan.get('Plan Rows', 0),
+                    'seq_scans': sorted(seq_scans),
+                    'indexes': sorted(indexes)
+                }
         
         try:
-            return await self.execute_with_retry(_get_users_by_segment)
+            return await self.execute_with_retry(_explain_segment)
         except Exception as e:
-            logger.error(f"❌ Failed to get users by segment {segment_key}: {e}")
-            return []
+            logger.error(f"❌ Failed to explain segment {segment_key or segment_expression}: {e}")
+            return None
+
+    async def _iter_user_ids(self, query: str, *args, batch_size: int = 1000) -> AsyncIterator[int]:
+        """
+        Потоковая выборка user_id страницами по ключу (WHERE user_id > последний ORDER BY user_id).
+        query получает последний user_id и размер страницы последними параметрами
+        """
+        last_user_id = -1
+        while True:
+            async def _fetch_page():
+                async with self.pool.acquire() as conn:
+                    return await conn.fetch(query, *args, last_user_id, batch_size)
+            
+            try:
+                rows = await self.execute_with_retry(_fetch_page)
+            except Exception as e:
+                logger.error(f"❌ Failed to fetch user ids page after {last_user_id}: {e}")
+                return
+            
+            for row in rows:
+                yield row['user_id']
+            if len(rows) < batch_size:
+                return
+            last_user_id = rows[-1]['user_id']
 
     # ==================== RESERVATIONS ====================
     async def check_table_availability(self, reservation_date: str, reservation_time: str, guests_count: int) -> dict:
@@ -195,6 +422,30 @@ class DatabaseManager:
             reservation_date, reservation_time, guests_count
         )
 
+    async def get_day_availability(self, reservation_date: str, guests_count: int = 1) -> dict:
+        """Доступность всех слотов времени на дату через ReservationManager"""
+        if not self.reservation_manager:
+            return {}
+        
+        return await self.reservation_manager.get_day_availability(reservation_date, guests_count)
+
+    async def find_alternative_slots(self, reservation_date: str, reservation_time: str, guests_count: int,
+                                     limit: int = 3) -> list:
+        """Ближайшие свободные слоты для той же компании через ReservationManager"""
+        if not self.reservation_manager:
+            return []
+        
+        return await self.reservation_manager.find_alternative_slots(
+            reservation_date, reservation_time, guests_count, limit
+        )
+
+    async def get_month_availability(self, year: int, month: int) -> dict:
+        """Загрузка дней месяца для календаря через ReservationManager"""
+        if not self.reservation_manager:
+            return {}
+        
+        return await self.reservation_manager.get_month_availability(year, month)
+
     async def create_reservation(self, user_id: int, reservation_date: str, reservation_time: str,
                                guests_count: int, customer_name: str, customer_phone: str) -> int:
         """Создание брони через атомарный метод"""
@@ -225,6 +476,71 @@ class DatabaseManager:
             return None
 
 
+    async def get_upcoming_confirmed_reservations(self, window_start: datetime, window_end: datetime):
+        """
+        Подтвержденные брони с началом в окне [window_start, window_end),
+        по которым отправлены не все напоминания (для планировщика напоминаний)
+        """
+        async def _get_upcoming_confirmed_reservations():
+            query = """
+                SELECT * FROM reservations 
+                WHERE status = 'confirmed'
+                AND (reservation_date + reservation_time) >= $1
+                AND (reservation_date + reservation_time) < $2
+                AND (reminder_24h_sent_at IS NULL OR reminder_3h_sent_at IS NULL)
+                ORDER BY reservation_date, reservation_time
+            """
+            return await self.pool.fetch(query, window_start, window_end)
+        
+        try:
+            return await self.execute_with_retry(_get_upcoming_confirmed_reservations)
+        except Exception as e:
+            self.logger.error(f"❌ Failed to get upcoming confirmed reservations: {e}")
+            return None
+
+    async def mark_reminders_sent(self, reminders: List[tuple]) -> Optional[set]:
+        """
+        Отметка напоминаний [(reservation_id, '24h'|'3h'), ...] одним UPDATE.
+        Возвращает отмеченные пары - напоминания, которые еще никто не отправлял
+        """
+        by_reservation: Dict[int, set] = {}
+        for reservation_id, kind in reminders:
+            by_reservation.setdefault(reservation_id, set()).add(kind)
+        
+        ids = list(by_reservation)
+        mark_24h = ['24h' in by_reservation[reservation_id] for reservation_id in ids]
+        mark_3h = ['3h' in by_reservation[reservation_id] for reservation_id in ids]
+        
+        async def _mark_reminders_sent():
+            query = """
+                UPDATE reservations r SET
+                    reminder_24h_sent_at = CASE WHEN m.mark_24h AND r.reminder_24h_sent_at IS NULL
+                        THEN CURRENT_TIMESTAMP ELSE r.reminder_24h_sent_at END,
+                    reminder_3h_sent_at = CASE WHEN m.mark_3h AND r.reminder_3h_sent_at IS NULL
+                        THEN CURRENT_TIMESTAMP ELSE r.reminder_3h_sent_at END
+                FROM unnest($1::int[], $2::bool[], $3::bool[]) AS m(id, mark_24h, mark_3h)
+                WHERE r.id = m.id
+                AND ((m.mark_24h AND r.reminder_24h_sent_at IS NULL) OR (m.mark_3h AND r.reminder_3h_sent_at IS NULL))
+                RETURNING r.id,
+                    m.mark_24h AND r.reminder_24h_sent_at = CURRENT_TIMESTAMP as marked_24h,
+                    m.mark_3h AND r.reminder_3h_sent_at = CURRENT_TIMESTAMP as marked_3h
+            """
+            return await self.pool.fetch(query, ids, mark_24h, mark_3h)
+        
+        try:
+            rows = await self.execute_with_retry(_mark_reminders_sent)
+        except Exception as e:
+            self.logger.error(f"❌ Failed to mark reminders sent: {e}")
+            return None
+        
+        marked = set()
+        for row in rows:
+            if row['marked_24h']:
+                marked.add((row['id'], '24h'))
+            if row['marked_3h']:
+                marked.add((row['id'], '3h'))
+        return marked
+
     async def get_today_reservations(self):
         async def _get_today_reservations():
             """Получение актуальных броней на сегодня"""
@@ -247,13 +563,19 @@ class DatabaseManager:
     async def update_reservation_status(self, reservation_id: int, status: str) -> bool:
         """Обновление статуса брони"""
         query = """
-            UPDATE reservations 
+            UPDATE reservations r
             SET status = $1, updated_at = CURRENT_TIMESTAMP
-            WHERE id = $2
+            FROM (SELECT id, status FROM reservations WHERE id = $2 FOR UPDATE) previous
+            WHERE r.id = previous.id
+            RETURNING r.reservation_date, previous.status as old_status
         """
         
         try:
-            await self.pool.execute(query, status, reservation_id)
+            row = await self.pool.fetchrow(query, status, reservation_id)
+            if row and self.reservation_manager:
+                self.reservation_manager.on_reservation_status_changed(
+                    reservation_id, row['reservation_date'], row['old_status'], status
+                )
             return True
         except Exception as e:
             self.logger.error(f"❌ Failed to update reservation status: {e}")
@@ -324,6 +646,8 @@ class DatabaseManager:
             """
             result = await self.pool.execute(query)
             self.logger.info(f"✅ Updated expired reservations: {result}")
+            if self.reservation_manager and result != "UPDATE 0":
+                self.reservation_manager.invalidate_availability()
             return True
         try:
             return await self.execute_with_retry(_update_expired_reservation)
@@ -463,15 +787,22 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка получения вызова {call_id}: {e}")
             return None
 
-    async def update_call_message_ids(self, call_id: int, message_ids: Dict[int, int]) -> bool:
-        """Сохранить ID сообщений для каждого официанта"""
+    async def update_call_message_ids(self, call_id: int, message_ids: Dict[int, int],
+                                      notify_latencies: Dict[int, int] = None) -> bool:
+        """
+        Сохранить ID сообщений для каждого официанта.
+        notify_latencies - через сколько мс после начала рассылки получил сообщение каждый официант
+        """
         async def _update_call_message_ids():
             async with self.pool.acquire() as conn:
                 result = await conn.execute('''
                     UPDATE staff_calls 
-                    SET message_ids = $1
+                    SET message_ids = $1,
+                        notify_latencies = COALESCE($3::jsonb, notify_latencies),
+                        notified_at = CURRENT_TIMESTAMP
                     WHERE id = $2
-                ''', json.dumps(message_ids), call_id)
+                ''', json.dumps(message_ids), call_id,
+                    json.dumps(notify_latencies) if notify_latencies is not None else None)
                 
                 success = "UPDATE 1" in result
                 if success:
@@ -486,9 +817,80 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка обновления message IDs для вызова {call_id}: {e}")
             return False
 
+    async def get_pending_staff_calls(self, max_age_seconds: int) -> Optional[List[Dict]]:
+        """
+        Непринятые вызовы не старше max_age_seconds - для восстановления таймеров эскалации.
+        notified_at - когда персонал был уведомлен (или время создания вызова)
+        """
+        async def _get_pending_staff_calls():
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch('''
+                    SELECT id, table_number, escalation_level,
+                           COALESCE(notified_at, created_at) AS notified_at
+                    FROM staff_calls
+                    WHERE status = 'pending'
+                    AND created_at > CURRENT_TIMESTAMP - make_interval(secs => $1)
+                    ORDER BY created_at
+                ''', max_age_seconds)
+                return [dict(row) for row in rows]
+        try:
+            return await self.execute_with_retry(_get_pending_staff_calls)
+        except Exception as e:
+            logger.error(f"❌ Failed to get pending staff calls: {e}")
+            return None
+
+    async def claim_staff_call_escalation(self, call_id: int, level: int) -> Optional[Dict]:
+        """
+        Перевод непринятого вызова на уровень эскалации level.
+        Возвращает вызов, если уровень еще не был достигнут (другим процессом или до перезапуска),
+        иначе None - вызов принят, отменен или уже эскалирован
+        """
+        async def _claim_staff_call_escalation():
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow('''
+                    WITH claimed AS (
+                        UPDATE staff_calls
+                        SET escalation_level = $2, escalated_at = CURRENT_TIMESTAMP
+                        WHERE id = $1 AND status = 'pending' AND escalation_level < $2
+                        RETURNING *
+                    )
+                    SELECT c.*, u.full_name as user_name, u.username as user_username
+                    FROM claimed c
+                    LEFT JOIN users u ON c.user_id = u.user_id
+                ''', call_id, level)
+                return dict(row) if row else None
+        try:
+            return await self.execute_with_retry(_claim_staff_call_escalation)
+        except Exception as e:
+            logger.error(f"❌ Failed to escalate staff call {call_id}: {e}")
+            return None
+
+    async def merge_call_message_ids(self, call_id: int, message_ids: Dict[int, int]) -> bool:
+        """
+        Добавить (заменить) ID сообщений официантов к уже сохраненным, пока вызов не принят.
+        False - вызов успели принять или отменить
+        """
+        async def _merge_call_message_ids():
+            async with self.pool.acquire() as conn:
+                result = await conn.execute('''
+                    UPDATE staff_calls
+                    SET message_ids = COALESCE(message_ids, '{}'::jsonb) || $2::jsonb
+                    WHERE id = $1 AND status = 'pending'
+                ''', call_id, json.dumps(message_ids))
+                return "UPDATE 1" in result
+        try:
+            return await self.execute_with_retry(_merge_call_message_ids)
+        except Exception as e:
+            logger.error(f"❌ Failed to merge message IDs for staff call {call_id}: {e}")
+            return False
+
     # ==================== USER ACTIONS ====================
     async def add_user_action(self, user_id: int, action_type: str, action_data: Dict = None) -> bool:
         """Безопасное добавление действия пользователя (с проверкой существования пользователя)"""
+        if self.analytics_writer and self.analytics_writer.is_running:
+            # Запись уходит в фоновый пакет, хендлер не ждет БД
+            return self.analytics_writer.add_user_action(user_id, action_type, action_data)
+
         async def _add_user_action():
             async with self.pool.acquire() as conn:
                 # Сначала проверяем существование пользователя
@@ -517,6 +919,9 @@ class DatabaseManager:
     # ==================== MENU VIEWS ====================
     async def add_menu_view(self, user_id: int, category: str) -> bool:
         """Добавление/обновление просмотра категории меню"""
+        if self.analytics_writer and self.analytics_writer.is_running:
+            return self.analytics_writer.add_menu_view(user_id, category)
+
         async def _add_menu_view():
             async with self.pool.acquire() as conn:
                 await conn.execute('''
@@ -538,6 +943,9 @@ class DatabaseManager:
 
     async def get_delivery_categories(self) -> List[Dict]:
         """Получение уникальных категорий доставки"""
+        if self.menu_catalog and await self.menu_catalog.ensure_loaded():
+            return [{'category': category} for category in await self.menu_catalog.get_categories()]
+
         try:
             async with self.pool.acquire() as conn:
                 rows = await conn.fetch('''
@@ -553,6 +961,9 @@ class DatabaseManager:
 
     async def get_delivery_menu(self, category: str = None) -> List[Dict]:
         """Получение меню доставки"""
+        if self.menu_catalog and await self.menu_catalog.ensure_loaded():
+            return await self.menu_catalog.get_items(category)
+
         try:
             async with self.pool.acquire() as conn:
                 if category:
@@ -692,19 +1103,28 @@ class DatabaseManager:
     # ==================== BROADCASTS ====================
     async def create_broadcast(self, title: str, message_text: str, target_sex: str = 'all', 
                          target_major: str = 'all', message_type: str = 'text', 
-                         image_file_id: str = None) -> Optional[int]:
-        """Создание рассылки с поддержкой разных типов контента"""
+                         image_file_id: str = None, segment_key: str = None,
+                         segment_expression: str = None, scheduled_at: datetime = None) -> Optional[int]:
+        """
+        Создание рассылки с поддержкой разных типов контента.
+        С scheduled_at рассылка создается в статусе scheduled и запускается планировщиком
+        """
         async def _create_broadcast():
             async with self.pool.acquire() as conn:
-                broadcast_id = await conn.fetchval('''
+                params = [title, message_text, target_sex, target_major, message_type, image_file_id,
+                          segment_key, segment_expression, scheduled_at]
+                condition = self._segment_condition(params, segment_key, segment_expression)
+                broadcast_id = await conn.fetchval(f'''
                     INSERT INTO broadcasts 
-                    (title, message_text, target_sex, target_major, message_type, image_file_id, total_count)
-                    VALUES ($1, $2, $3, $4, $5, $6, (
-                        SELECT COUNT(*) FROM users 
-                        WHERE is_blocked = FALSE
+                    (title, message_text, target_sex, target_major, message_type, image_file_id,
+                     segment_key, segment_expression, scheduled_at, status, total_count)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9,
+                        CASE WHEN $9::timestamptz IS NULL THEN 'draft' ELSE 'scheduled' END, (
+                        SELECT COUNT(*) FROM users u
+                        WHERE {condition}
                     ))
                     RETURNING id
-                ''', title, message_text, target_sex, target_major, message_type, image_file_id)
+                ''', *params)
                 return broadcast_id
         
         try:
@@ -713,25 +1133,328 @@ class DatabaseManager:
             logger.error(f"❌ Failed to create broadcast: {e}")
             return None
 
-    async def update_broadcast_stats(self, broadcast_id: int, sent_count: int) -> bool:
-        """Обновление статистики рассылки"""
-        async def _update_broadcast_stats():
+    async def _queue_deliveries(self, conn, broadcast_id: int, segment_key: str, segment_expression: str = None,
+                                owner: str = None, lease_seconds: int = 0) -> int:
+        """
+        Получатели сегмента в журнал доставки и перевод рассылки в sending (внутри транзакции conn).
+        owner сразу получает аренду рассылки, чтобы ее не продолжил другой экземпляр бота
+        """
+        params = [broadcast_id]
+        condition = self._segment_condition(params, segment_key, segment_expression)
+        queued = await conn.fetchval(f'''
+            WITH inserted AS (
+                INSERT INTO broadcast_deliveries (broadcast_id, user_id)
+                SELECT $1, u.user_id FROM users u
+                WHERE {condition}
+                ON CONFLICT DO NOTHING
+                RETURNING 1
+            )
+            SELECT COUNT(*) FROM inserted
+        ''', *params)
+        # Сколько отправок сэкономлено на недоступных пользователях сегмента
+        params = []
+        condition = self._segment_condition(params, segment_key, segment_expression, reachable_only=False)
+        pruned = await conn.fetchval(f'''
+            SELECT COUNT(*) FROM users u
+            WHERE {condition}
+            AND u.is_reachable = FALSE
+        ''', *params)
+        await conn.execute('''
+            UPDATE broadcasts
+            SET total_count = $2, pruned_count = $3, status = 'sending', started_at = CURRENT_TIMESTAMP,
+                lease_owner = $4,
+                lease_until = CASE WHEN $4::varchar IS NULL THEN NULL
+                                   ELSE CURRENT_TIMESTAMP + make_interval(secs => $5) END
+            WHERE id = $1
+        ''', broadcast_id, queued, pruned, owner, lease_seconds)
+        return queued
+
+    async def queue_broadcast_deliveries(self, broadcast_id: int, segment_key: str, segment_expression: str = None,
+                                         owner: str = None, lease_seconds: int = 0) -> Optional[int]:
+        """
+        Заполнение журнала доставки получателями сегмента (статус queued)
+        и запуск рассылки. Возвращает количество получателей, None - журнал не заполнен
+        """
+        async def _queue_broadcast_deliveries():
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    return await self._queue_deliveries(
+                        conn, broadcast_id, segment_key, segment_expression, owner, lease_seconds
+                    )
+        
+        try:
+            return await self.execute_with_retry(_queue_broadcast_deliveries)
+        except Exception as e:
+            logger.error(f"❌ Failed to queue broadcast deliveries {broadcast_id}: {e}")
+            return None
+
+    async def claim_due_broadcasts(self, limit: int = 5, owner: str = None, lease_seconds: int = 0) -> List[int]:
+        """
+        Захват запланированных рассылок, время которых наступило.
+        FOR UPDATE SKIP LOCKED: рассылку забирает один экземпляр бота, остальные ее пропускают.
+        Журнал доставки заполняется в той же транзакции, поэтому захваченная рассылка
+        сразу продолжаема после перезапуска
+        """
+        async def _claim_due_broadcasts():
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    rows = await conn.fetch('''
+                        SELECT id, segment_key, segment_expression FROM broadcasts
+                        WHERE status = 'scheduled' AND scheduled_at <= CURRENT_TIMESTAMP
+                        ORDER BY scheduled_at
+                        LIMIT $1
+                        FOR UPDATE SKIP LOCKED
+                    ''', limit)
+                    for row in rows:
+                        await self._queue_deliveries(
+                            conn, row['id'], row['segment_key'], row['segment_expression'], owner, lease_seconds
+                        )
+                    return [row['id'] for row in rows]
+        
+        try:
+            return await self.execute_with_retry(_claim_due_broadcasts)
+        except Exception as e:
+            logger.error(f"❌ Failed to claim due broadcasts: {e}")
+            return []
+
+    def iter_queued_broadcast_recipients(self, broadcast_id: int, batch_size: int = 1000) -> AsyncIterator[int]:
+        """Получатели, которым рассылка еще не отправлялась, страницами по user_id"""
+        return self._iter_user_ids('''
+            SELECT user_id FROM broadcast_deliveries
+            WHERE broadcast_id = $1 AND status = 'queued' AND user_id > $2
+            ORDER BY user_id
+            LIMIT $3
+        ''', broadcast_id, batch_size=batch_size)
+
+    async def record_broadcast_deliveries(self, broadcast_id: int, results: List[tuple]) -> bool:
+        """
+        Пакетная запись результатов доставки [(user_id, status)] в журнал
+        и увеличение счетчиков рассылки одним запросом
+        """
+        if not results:
+            return True
+        
+        async def _record_broadcast_deliveries():
             async with self.pool.acquire() as conn:
                 await conn.execute('''
-                    UPDATE broadcasts 
-                    SET sent_count = $1, 
-                        status = CASE WHEN sent_count >= total_count THEN 'completed' ELSE 'sending' END,
-                        sent_at = CASE WHEN sent_count >= total_count THEN CURRENT_TIMESTAMP ELSE sent_at END
-                    WHERE id = $2
-                ''', sent_count, broadcast_id)
+                    WITH updated AS (
+                        UPDATE broadcast_deliveries d
+                        SET status = u.status, updated_at = CURRENT_TIMESTAMP
+                        FROM unnest($2::bigint[], $3::varchar[]) AS u(user_id, status)
+                        WHERE d.broadcast_id = $1 AND d.user_id = u.user_id AND d.status = 'queued'
+                        RETURNING d.status
+                    )
+                    UPDATE broadcasts SET
+                        sent_count = sent_count + (SELECT COUNT(*) FROM updated WHERE status = 'sent'),
+                        failed_count = failed_count + (SELECT COUNT(*) FROM updated WHERE status = 'failed'),
+                        blocked_count = blocked_count + (SELECT COUNT(*) FROM updated WHERE status IN ('blocked', 'not_found'))
+                    WHERE id = $1
+                ''', broadcast_id, [user_id for user_id, _ in results], [status for _, status in results])
+                return True
+        
+        try:
+            return await self.execute_with_retry(_record_broadcast_deliveries)
+        except Exception as e:
+            logger.error(f"❌ Failed to record deliveries of broadcast {broadcast_id}: {e}")
+            return False
+
+    async def set_broadcast_status(self, broadcast_id: int, status: str) -> bool:
+        """Смена статуса рассылки (scheduled, sending, paused, completed, cancelled)"""
+        async def _set_broadcast_status():
+            async with self.pool.acquire() as conn:
+                result = await conn.execute('''
+                    UPDATE broadcasts
+                    SET status = $2,
+                        sent_at = CASE WHEN $2 = 'completed' THEN CURRENT_TIMESTAMP ELSE sent_at END
+                    WHERE id = $1 AND status NOT IN ('completed', 'cancelled')
+                ''', broadcast_id, status)
+                return result != "UPDATE 0"
+        
+        try:
+            return await self.execute_with_retry(_set_broadcast_status)
+        except Exception as e:
+            logger.error(f"❌ Failed to set broadcast {broadcast_id} status {status}: {e}")
+            return False
+
+    async def set_broadcast_progress_message(self, broadcast_id: int, chat_id: int, message_id: int) -> bool:
+        """Сохранение сообщения с прогрессом, чтобы обновлять его после перезапуска"""
+        async def _set_broadcast_progress_message():
+            async with self.pool.acquire() as conn:
+                await conn.execute('''
+                    UPDATE broadcasts
+                    SET progress_chat_id = $2, progress_message_id = $3
+                    WHERE id = $1
+                ''', broadcast_id, chat_id, message_id)
+                return True
+        
+        try:
+            return await self.execute_with_retry(_set_broadcast_progress_message)
+        except Exception as e:
+            logger.error(f"❌ Failed to save progress message of broadcast {broadcast_id}: {e}")
+            return False
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict]:
+        """Получение рассылки по ID"""
+        async def _get_broadcast():
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow('SELECT * FROM broadcasts WHERE id = $1', broadcast_id)
+                return dict(row) if row else None
+        
+        try:
+            return await self.execute_with_retry(_get_broadcast)
+        except Exception as e:
+            logger.error(f"❌ Failed to get broadcast {broadcast_id}: {e}")
+            return None
+
+    async def get_broadcasts_by_status(self, status: str) -> List[Dict]:
+        """Рассылки в указанном статусе (для продолжения после перезапуска)"""
+        async def _get_broadcasts_by_status():
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch('''
+                    SELECT * FROM broadcasts WHERE status = $1 ORDER BY id
+                ''', status)
+                return [dict(row) for row in rows]
+        
+        try:
+            return await self.execute_with_retry(_get_broadcasts_by_status)
+        except Exception as e:
+            logger.error(f"❌ Failed to get broadcasts with status {status}: {e}")
+            return []
+
+    async def claim_broadcast(self, broadcast_id: int, owner: str, lease_seconds: int) -> Optional[Dict]:
+        """
+        Захват рассылки для отправки экземпляром owner на lease_seconds секунд.
+        Удается, если рассылка в статусе sending или paused и ее никто не ведет
+        (аренды нет, она истекла или уже принадлежит owner). None - рассылку ведет другой экземпляр
+        """
+        async def _claim_broadcast():
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow('''
+                    UPDATE broadcasts
+                    SET lease_owner = $2, lease_until = CURRENT_TIMESTAMP + make_interval(secs => $3)
+                    WHERE id = $1 AND status IN ('sending', 'paused')
+                    AND (lease_owner IS NULL OR lease_owner = $2 OR lease_until < CURRENT_TIMESTAMP)
+                    RETURNING *
+                ''', broadcast_id, owner, lease_seconds)
+                return dict(row) if row else None
+        
+        try:
+            return await self.execute_with_retry(_claim_broadcast)
+        except Exception as e:
+            logger.error(f"❌ Failed to claim broadcast {broadcast_id}: {e}")
+            return None
+
+    async def renew_broadcast_leases(self, broadcast_ids: List[int], owner: str,
+                                     lease_seconds: int) -> Optional[List[int]]:
+        """
+        Продление аренды рассылок, которые ведет owner. Возвращает продленные:
+        остальные отменены, завершены или перехвачены другим экземпляром. None - ошибка БД
+        """
+        async def _renew_broadcast_leases():
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch('''
+                    UPDATE broadcasts
+                    SET lease_until = CURRENT_TIMESTAMP + make_interval(secs => $3)
+                    WHERE id = ANY($1::int[]) AND lease_owner = $2
+                    AND status IN ('sending', 'paused')
+                    RETURNING id
+                ''', broadcast_ids, owner, lease_seconds)
+                return [row['id'] for row in rows]
+        
+        try:
+            return await self.execute_with_retry(_renew_broadcast_leases)
+        except Exception as e:
+            logger.error(f"❌ Failed to renew broadcast leases: {e}")
+            return None
+
+    async def release_broadcasts(self, owner: str, broadcast_ids: List[int] = None) -> bool:
+        """Снятие аренды owner (с указанных рассылок или со всех): их сразу может продолжить другой экземпляр"""
+        async def _release_broadcasts():
+            async with self.pool.acquire() as conn:
+                await conn.execute('''
+                    UPDATE broadcasts SET lease_owner = NULL, lease_until = NULL
+                    WHERE lease_owner = $1 AND ($2::int[] IS NULL OR id = ANY($2::int[]))
+                ''', owner, broadcast_ids)
                 return True
         
         try:
-            return await self.execute_with_retry(_update_broadcast_stats)
+            return await self.execute_with_retry(_release_broadcasts)
         except Exception as e:
-            logger.error(f"❌ Failed to update broadcast stats {broadcast_id}: {e}")
+            logger.error(f"❌ Failed to release broadcasts of {owner}: {e}")
             return False
 
+    async def mark_users_unreachable(self, users: List[tuple]) -> int:
+        """
+        Пакетная отметка недоступных пользователей [(user_id, reason)],
+        reason - 'blocked' или 'chat_not_found'. Возвращает количество отмеченных
+        """
+        if not users:
+            return 0
+        
+        async def _mark_users_unreachable():
+            async with self.pool.acquire() as conn:
+                result = await conn.execute('''
+                    UPDATE users u
+                    SET is_reachable = FALSE,
+                        unreachable_reason = m.reason,
+                        unreachable_since = CURRENT_TIMESTAMP
+                    FROM unnest($1::bigint[], $2::varchar[]) AS m(user_id, reason)
+                    WHERE u.user_id = m.user_id AND u.is_reachable = TRUE
+                ''', [user_id for user_id, _ in users], [reason for _, reason in users])
+                return int(result.split()[-1])
+        
+        try:
+            marked = await self.execute_with_retry(_mark_users_unreachable)
+            if marked:
+                self.segment_counts_cache = None
+                logger.info(f"🚫 Marked {marked} users as unreachable")
+            return marked
+        except Exception as e:
+            logger.error(f"❌ Failed to mark users unreachable: {e}")
+            return 0
+
+    async def mark_user_reachable(self, user_id: int) -> bool:
+        """Пользователь снова написал боту - он опять получает рассылки"""
+        async def _mark_user_reachable():
+            async with self.pool.acquire() as conn:
+                await conn.execute('''
+                    UPDATE users
+                    SET is_reachable = TRUE, unreachable_reason = NULL, unreachable_since = NULL
+                    WHERE user_id = $1 AND is_reachable = FALSE
+                ''', user_id)
+                return True
+        
+        try:
+            return await self.execute_with_retry(_mark_user_reachable)
+        except Exception as e:
+            logger.error(f"❌ Failed to mark user {user_id} reachable: {e}")
+            return False
+
+    async def get_audience_pruning_stats(self) -> Dict[str, Any]:
+        """Недоступные пользователи и сэкономленные на них отправки"""
+        async def _get_audience_pruning_stats():
+            async with self.pool.acquire() as conn:
+                stats = await conn.fetchrow('''
+                    SELECT
+                        (SELECT COUNT(*) FROM users WHERE is_reachable = FALSE) as unreachable_total,
+                        (SELECT COUNT(*) FROM users
+                         WHERE is_reachable = FALSE AND unreachable_reason = 'blocked') as blocked_count,
+                        (SELECT COUNT(*) FROM users
+                         WHERE is_reachable = FALSE AND unreachable_reason = 'chat_not_found') as chat_not_found_count,
+                        (SELECT COUNT(*) FROM users
+                         WHERE is_reachable = FALSE
+                         AND unreachable_since >= CURRENT_TIMESTAMP - INTERVAL '7 days') as marked_last_week,
+                        (SELECT COALESCE(SUM(pruned_count), 0) FROM broadcasts) as pruned_sends,
+                        (SELECT COUNT(*) FROM broadcasts WHERE pruned_count > 0) as pruned_broadcasts
+                ''')
+                return dict(stats) if stats else {}
+        
+        try:
+            return await self.execute_with_retry(_get_audience_pruning_stats)
+        except Exception as e:
+            logger.error(f"❌ Failed to get audience pruning stats: {e}")
+            return {}
+
     # ==================== ANALYTICS METHODS ====================
     async def get_general_stats(self) -> Dict[str, Any]:
         """📊 Общая статистика"""
@@ -902,6 +1625,11 @@ class DatabaseManager:
                         COUNT(*) FILTER (WHERE status = 'cancelled') as cancelled_calls,
                         COALESCE(AVG(EXTRACT(EPOCH FROM (completed_at - created_at))/60) FILTER 
                             (WHERE completed_at IS NOT NULL), 0) as avg_completion_time_min,
+                        -- От вызова до уведомления последнего официанта
+                        COALESCE(AVG(EXTRACT(EPOCH FROM (notified_at - created_at))) FILTER 
+                            (WHERE notified_at IS NOT NULL), 0) as avg_notify_delay_sec,
+                        COALESCE(MAX(EXTRACT(EPOCH FROM (notified_at - created_at))) FILTER 
+                            (WHERE notified_at IS NOT NULL AND created_at::date = CURRENT_DATE), 0) as max_notify_delay_today_sec,
                         MODE() WITHIN GROUP (ORDER BY table_number) as most_active_table,
                         COUNT(*) FILTER (WHERE created_at::date = CURRENT_DATE) as today_calls
                     FROM staff_calls
@@ -1383,39 +2111,59 @@ class DatabaseManager:
 
     # ==================== ADMIN/STAFF MANAGEMENT ====================
 
-    async def is_admin(self, user_id: int) -> bool:
-        """Проверка, является ли пользователь администратором"""
-        async def _is_admin():
+    async def refresh_role_cache(self, force: bool = False) -> bool:
+        """Загрузка ролей в кэш (по TTL или принудительно)"""
+        async def _refresh_role_cache():
             async with self.pool.acquire() as conn:
-                exists = await conn.fetchval(
-                    "SELECT 1 FROM admin_users WHERE user_id = $1",
-                    user_id
-                )
-                return exists is not None
+                rows = await conn.fetch('''
+                    SELECT user_id, 'admin' as role FROM admin_users
+                    UNION ALL
+                    SELECT user_id, 'staff' as role FROM staff_users
+                ''')
+                admin_ids = [row['user_id'] for row in rows if row['role'] == 'admin']
+                staff_ids = [row['user_id'] for row in rows if row['role'] == 'staff']
+                role_cache.load(admin_ids, staff_ids)
+                return True
+
+        # Роли уже загружались, а обновление идет в другом запросе - не ждем его, отдаем прежние
+        if not force and role_cache.version and self._roles_lock.locked():
+            return False
+
+        async with self._roles_lock:
+            # Кэш мог обновить другой запрос, пока мы ждали блокировку,
+            # или после ошибки еще не пришло время повторной попытки
+            if not force and not role_cache.needs_refresh():
+                return role_cache.is_fresh()
+            try:
+                return await self.execute_with_retry(_refresh_role_cache)
+            except Exception as e:
+                # Оставляем предыдущее содержимое кэша до следующей попытки,
+                # проверки ролей до нее не ждут БД
+                role_cache.mark_failed()
+                logger.error(f"❌ Failed to refresh role cache: {e}")
+                return False
+
+    async def _roles_changed(self, conn):
+        """Сброс кэша ролей в этом процессе и уведомление остальных"""
+        role_cache.invalidate()
         try:
-            return await self.execute_with_retry(_is_admin)
+            await conn.execute("SELECT pg_notify('roles_changed', '')")
         except Exception as e:
-            logger.error(f"❌ Error checking admin status: {e}")
-            return False
+            logger.warning(f"⚠️ Failed to notify roles_changed: {e}")
+
+
+    async def is_admin(self, user_id: int) -> bool:
+        """Проверка, является ли пользователь администратором"""
+        if role_cache.needs_refresh():
+            await self.refresh_role_cache()
+        return role_cache.is_admin(user_id)
 
     async def is_staff(self, user_id: int) -> bool:
         """Проверка, является ли пользователь персоналом"""
-        async def _is_staff():
-            async with self.pool.acquire() as conn:
-                # Персонал = админы + официанты
-                exists = await conn.fetchval('''
-                    SELECT 1 FROM (
-                        SELECT user_id FROM admin_users 
-                        UNION 
-                        SELECT user_id FROM staff_users
-                    ) AS staff WHERE user_id = $1
-                ''', user_id)
-                return exists is not None
-        try:
-            return await self.execute_with_retry(_is_staff)
-        except Exception as e:
-            logger.error(f"❌ Error checking staff status: {e}")
-            return False
+        # Персонал = админы + официанты
+        if role_cache.needs_refresh():
+            await self.refresh_role_cache()
+        return role_cache.is_staff(user_id)
 
     async def add_admin(self, user_id: int, username: str, full_name: str) -> bool:
         """Добавление администратора"""
@@ -1431,6 +2179,7 @@ class DatabaseManager:
                     username = EXCLUDED.username,
                     full_name = EXCLUDED.full_name
                 ''', user_id, username, full_name)
+                await self._roles_changed(conn)
                 return True
         try:
             return await self.execute_with_retry(_add_admin)
@@ -1446,6 +2195,7 @@ class DatabaseManager:
                     "DELETE FROM admin_users WHERE user_id = $1",
                     user_id
                 )
+                await self._roles_changed(conn)
                 return True
         try:
             return await self.execute_with_retry(_remove_admin)
@@ -1481,6 +2231,7 @@ class DatabaseManager:
                     username = EXCLUDED.username,
                     full_name = EXCLUDED.full_name
                 ''', user_id, username, full_name)
+                await self._roles_changed(conn)
                 return True
         try:
             return await self.execute_with_retry(_add_staff)
@@ -1496,6 +2247,7 @@ class DatabaseManager:
                     "DELETE FROM staff_users WHERE user_id = $1",
                     user_id
                 )
+                await self._roles_changed(conn)
                 return True
         try:
             return await self.execute_with_retry(_remove_staff)
@@ -1517,6 +2269,68 @@ class DatabaseManager:
             logger.error(f"❌ Error getting staff: {e}")
             return []
 
+    async def set_staff_zone(self, user_id: int, zone: Optional[str]) -> bool:
+        """Назначение официанту зоны зала (None - любая зона)"""
+        async def _set_staff_zone():
+            async with self.pool.acquire() as conn:
+                result = await conn.execute(
+                    "UPDATE staff_users SET zone = $2 WHERE user_id = $1",
+                    user_id, zone
+                )
+                return "UPDATE 1" in result
+        try:
+            return await self.execute_with_retry(_set_staff_zone)
+        except Exception as e:
+            logger.error(f"❌ Error setting zone for staff {user_id}: {e}")
+            return False
+
+    async def get_table_zones(self) -> List[str]:
+        """Зоны зала из restaurant_tables"""
+        async def _get_table_zones():
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch('''
+                    SELECT DISTINCT zone FROM restaurant_tables
+                    WHERE is_active = TRUE AND zone IS NOT NULL
+                    ORDER BY zone
+                ''')
+                return [row['zone'] for row in rows]
+        try:
+            return await self.execute_with_retry(_get_table_zones)
+        except Exception as e:
+            logger.error(f"❌ Error getting table zones: {e}")
+            return []
+
+    async def get_staff_call_candidates(self, table_number: int, window_seconds: int) -> Optional[List[Dict]]:
+        """
+        Официанты для маршрутизации вызова со стола table_number: зона официанта, зона стола
+        и загрузка по вызовам, принятым за последние window_seconds секунд -
+        open_calls (принятые и еще не завершенные), zone_calls (в зоне стола), last_accepted_at.
+        Окно отсекает вызовы, которые забыли завершить
+        """
+        async def _get_staff_call_candidates():
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch('''
+                    SELECT
+                        s.user_id,
+                        s.zone,
+                        t.zone AS table_zone,
+                        COUNT(c.id) FILTER (WHERE c.status = 'accepted') AS open_calls,
+                        COUNT(c.id) FILTER (WHERE ct.zone = t.zone) AS zone_calls,
+                        MAX(c.accepted_at) AS last_accepted_at
+                    FROM staff_users s
+                    LEFT JOIN restaurant_tables t ON t.table_number = $1 AND t.is_active = TRUE
+                    LEFT JOIN staff_calls c ON c.accepted_by = s.user_id
+                        AND c.accepted_at > CURRENT_TIMESTAMP - make_interval(secs => $2)
+                    LEFT JOIN restaurant_tables ct ON ct.table_number = c.table_number
+                    GROUP BY s.user_id, s.zone, t.zone
+                ''', table_number, window_seconds)
+                return [dict(row) for row in rows]
+        try:
+            return await self.execute_with_retry(_get_staff_call_candidates)
+        except Exception as e:
+            logger.error(f"❌ Error getting staff call candidates for table {table_number}: {e}")
+            return None
+
     async def add_dish_to_menu(self, category: str, name: str, description: str, price: float, image_url: str = None) -> bool:
         """Добавление блюда в меню"""
         async def _add_dish_to_menu():
@@ -1525,6 +2339,8 @@ class DatabaseManager:
                     INSERT INTO delivery_menu (category, name, description, price, image_url)
                     VALUES ($1, $2, $3, $4, $5)
                 ''', category, name, description, price, image_url)
+                if self.menu_catalog:
+                    self.menu_catalog.invalidate()
                 return True
         try:
             return await self.execute_with_retry(_add_dish_to_menu)
@@ -1540,6 +2356,8 @@ class DatabaseManager:
                     "DELETE FROM delivery_menu WHERE id = $1",
                     dish_id
                 )
+                if self.menu_catalog:
+                    self.menu_catalog.invalidate()
                 return True
         try:
             return await self.execute_with_retry(_remove_dish_from_menu)
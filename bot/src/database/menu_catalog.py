@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class MenuCatalog:
+    """
+    Меню доставки в памяти процесса.
+
+    Загружается из delivery_menu одним запросом и индексируется по id и категории.
+    Любое изменение меню увеличивает version, и при следующем обращении каталог перечитывается.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.version = 0
+        self.loaded_version = -1
+        self.items_by_id: Dict[int, Dict] = {}
+        self.items_by_category: Dict[str, List[Dict]] = {}
+        self.category_texts: Dict[Tuple[str, str], str] = {}
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """Сброс каталога (блюдо добавлено/удалено здесь или в другом процессе)"""
+        self.version += 1
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.loaded_version == self.version
+
+    async def ensure_loaded(self) -> bool:
+        """Загрузка каталога, если он устарел. Возвращает False, если БД недоступна"""
+        if self.is_loaded:
+            return True
+
+        async with self._lock:
+            if self.is_loaded:
+                return True
+
+            version = self.version
+            try:
+                async with self.db_manager.pool.acquire() as conn:
+                    rows = await conn.fetch('''
+                        SELECT * FROM delivery_menu
+                        WHERE is_available = TRUE
+                        ORDER BY category, name
+                    ''')
+            except Exception as e:
+                logger.error(f"❌ Failed to load delivery menu catalog: {e}")
+                return False
+
+            items_by_id = {}
+            items_by_category: Dict[str, List[Dict]] = {}
+            for row in rows:
+                item = dict(row)
+                items_by_id[item['id']] = item
+                items_by_category.setdefault(item['category'], []).append(item)
+
+            self.items_by_id = items_by_id
+            self.items_by_category = items_by_category
+            self.category_texts = {}
+            # Если меню изменилось во время загрузки, следующий вызов перечитает его снова
+            self.loaded_version = version
+            logger.info(f"✅ Delivery menu catalog loaded: {len(items_by_id)} items, version {version}")
+            return True
+
+    async def get_categories(self) -> List[str]:
+        """Категории с доступными блюдами"""
+        await self.ensure_loaded()
+        return sorted(self.items_by_category)
+
+    async def get_items(self, category: str = None) -> List[Dict]:
+        """Блюда категории (или всё меню) в порядке, как в БД"""
+        await self.ensure_loaded()
+        if category:
+            return list(self.items_by_category.get(category, []))
+        return [item for key in sorted(self.items_by_category) for item in self.items_by_category[key]]
+
+    async def get_item(self, item_id: int) -> Optional[Dict]:
+        """Блюдо по ID без обращения к БД"""
+        await self.ensure_loaded()
+        return self.items_by_id.get(item_id)
+
+    async def get_category_text(self, category: str, title: str) -> Optional[str]:
+        """Готовый текст категории для сообщения (кэшируется до изменения меню)"""
+        await self.ensure_loaded()
+        key = (category, title)
+        if key in self.category_texts:
+            return self.category_texts[key]
+
+        menu_items = self.items_by_category.get(category)
+        if not menu_items:
+            return None
+
+        text = f"<b>{title}</b>\n\n"
+
+        for item in menu_items:
+            text += f"<b>{item['id']}. {item['name']}</b> - {item['price']}₽\n"
+            if item.get('description'):
+                text += f"<i>{item['description']}</i>\n"
+            text += "\n"
+
+        text += "💡 <b>Как добавить в корзину:</b>\n"
+        text += "• Напишите номер товара (например: <code>1</code>)\n"
+        text += "• Или <code>добавить [номер]</code> (например: <code>добавить 1</code>)\n\n"
+        text += "🛒 Нажмите 'Корзина' чтобы посмотреть ваш заказ"
+
+        self.category_texts[key] = text
+        return text
@@ -1,26 +1,64 @@
 import asyncio
+import time as time_module
+from calendar import monthrange
 from datetime import datetime, date, time, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import asyncpg
 from contextlib import asynccontextmanager
 import logging
 
+from src.database.table_allocator import DateAllocation, RestaurantTable
+
 logger = logging.getLogger(__name__)
 
+# Статусы броней, занимающих столы
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+# Первый ключ advisory-блокировок бронирования (второй - порядковый номер даты)
+RESERVATION_LOCK_NAMESPACE = 7301
+
+# Зона столов схемы зала по умолчанию (restaurant_tables пуста)
+DEFAULT_ZONE = 'default'
+
 class ReservationManager:
     def __init__(self, db_manager):
         self.db_manager = db_manager
         self.restaurant_config = {
             'opening_time': time(10, 0),  # 10:00
             'closing_time': time(22, 0),  # 22:00
-            'table_capacity': 40,         # Общая вместимость
-            'max_tables': 10,             # Количество столов
+            'table_capacity': 40,         # Общая вместимость (схема зала по умолчанию)
+            'max_tables': 10,             # Количество столов (схема зала по умолчанию)
+            'max_join_tables': 3,         # Сколько столов одной зоны можно сдвинуть вместе
             'reservation_duration': timedelta(hours=2),  # Длительность брони
-            'cleaning_interval': timedelta(minutes=30)   # Время на уборку
+            'cleaning_interval': timedelta(minutes=30),  # Время на уборку
+            'slot_interval': timedelta(hours=1),         # Шаг слотов в выборе времени
+            'busy_threshold': 0.75                       # Доля занятых столов, с которой день считается "занятым"
         }
+        
+        # Схема зала из restaurant_tables (загружается при первом обращении)
+        self.tables: Optional[List[RestaurantTable]] = None
+        # Рассадка по датам: {date: (built_at, DateAllocation)}
+        self.allocation_cache: Dict[date, Tuple[float, DateAllocation]] = {}
+        # Кэш загрузки по дням месяца: {(year, month): (loaded_at, {day: 'free'|'busy'|'full'})}
+        self.month_cache: Dict[Tuple[int, int], Tuple[float, Dict[int, str]]] = {}
+        self.cache_ttl = 60
+    
+    def get_time_slots(self) -> List[str]:
+        """Слоты выбора времени от открытия до последнего часа работы"""
+        slots = []
+        current = datetime.combine(date.today(), self.restaurant_config['opening_time'])
+        closing = datetime.combine(date.today(), self.restaurant_config['closing_time'])
+        while current < closing:
+            slots.append(current.strftime("%H:%M"))
+            current += self.restaurant_config['slot_interval']
+        return slots
     
-    async def check_table_availability(self, reservation_date: str, reservation_time: str, guests_count: int) -> Dict[str, any]:
-        """Проверка доступности столов с правильной логикой пересечений"""
+    async def check_table_availability(self, reservation_date: str, reservation_time: str, guests_count: int,
+                                       conn: asyncpg.Connection = None) -> Dict[str, any]:
+        """
+        Проверка доступности столов по рассадке на дату.
+        conn - соединение открытой транзакции (иначе берется соединение из пула)
+        """
         try:
             # Преобразуем дату и время
             day, month, year = map(int, reservation_date.split('.'))
@@ -36,19 +74,294 @@ class ReservationManager:
             if not basic_checks["available"]:
                 return basic_checks
             
-            # Получаем все брони на эту дату
-            reservations = await self._get_reservations_for_date(reservation_date_obj)
+            # Рассадка существующих броней на эту дату
+            allocation = await self.get_date_allocation(reservation_date_obj, conn)
             
-            # Проверяем доступность с учетом пересечений
-            availability = await self._check_availability_with_overlaps(
-                target_datetime, guests_count, reservations
-            )
+            return self._evaluate_allocation(allocation, reservation_time_obj, guests_count)
+        
+        except Exception as e:
+            logger.error(f"❌ Error checking table availability: {e}")
+            return {"available": False, "reason": "error", "message": str(e)}
+    
+    async def get_day_availability(self, reservation_date: str, guests_count: int = 1) -> Dict[str, Dict[str, any]]:
+        """Доступность всех слотов даты по одной рассадке дня"""
+        try:
+            day, month, year = map(int, reservation_date.split('.'))
+            reservation_date_obj = date(year, month, day)
             
+            allocation = await self.get_date_allocation(reservation_date_obj)
+            
+            availability = {}
+            for slot in self.get_time_slots():
+                slot_time = time(*map(int, slot.split(':')))
+                basic_checks = await self._check_basic_conditions(
+                    datetime.combine(reservation_date_obj, slot_time), guests_count
+                )
+                if not basic_checks["available"]:
+                    availability[slot] = basic_checks
+                else:
+                    availability[slot] = self._evaluate_allocation(allocation, slot_time, guests_count)
             return availability
+        
+        except Exception as e:
+            logger.error(f"❌ Error getting day availability: {e}")
+            return {}
+    
+    async def find_alternative_slots(self, reservation_date: str, reservation_time: str, guests_count: int,
+                                     limit: int = 3, days_around: int = 2) -> List[Dict[str, str]]:
+        """
+        Ближайшие к запрошенному свободные слоты для той же компании.
+        Ищет на days_around дней в обе стороны по кэшированным рассадкам дат
+        """
+        try:
+            day, month, year = map(int, reservation_date.split('.'))
+            hour, minute = map(int, reservation_time.split(':'))
+            requested = datetime(year, month, day, hour, minute)
+            
+            slot_times = [time(*map(int, slot.split(':'))) for slot in self.get_time_slots()]
+            first_date = max(requested.date() - timedelta(days=days_around), date.today())
+            
+            candidates = []
+            current_date = first_date
+            while current_date <= requested.date() + timedelta(days=days_around):
+                allocation = await self.get_date_allocation(current_date)
+                for slot_time in slot_times:
+                    slot_start = datetime.combine(current_date, slot_time)
+                    if slot_start == requested:
+                        continue
+                    if not (await self._check_basic_conditions(slot_start, guests_count))["available"]:
+                        continue
+                    if allocation.find_tables(slot_time, guests_count):
+                        candidates.append((abs(slot_start - requested), slot_start))
+                current_date += timedelta(days=1)
+            
+            candidates.sort()
+            return [
+                {
+                    "date": f"{slot_start.day}.{slot_start.month}.{slot_start.year}",
+                    "time": slot_start.strftime("%H:%M")
+                }
+                for _, slot_start in candidates[:limit]
+            ]
             
         except Exception as e:
-            logger.error(f"❌ Error checking table availability: {e}")
-            return {"available": False, "reason": "error", "message": str(e)}
+            logger.error(f"❌ Error finding alternative slots: {e}")
+            return []
+    
+    async def get_month_availability(self, year: int, month: int) -> Dict[int, str]:
+        """Загрузка дней месяца ('free', 'busy', 'full') одним запросом с кэшем"""
+        cached = self.month_cache.get((year, month))
+        if cached and time_module.monotonic() - cached[0] < self.cache_ttl:
+            return cached[1]
+        
+        try:
+            _, days_in_month = monthrange(year, month)
+            tables = await self.get_tables()
+            rows = await self.db_manager.pool.fetch('''
+                SELECT id, reservation_date, reservation_time, guests_count, table_numbers
+                FROM reservations
+                WHERE reservation_date BETWEEN $1 AND $2
+                AND status IN ('pending', 'confirmed')
+                ORDER BY id
+            ''', date(year, month, 1), date(year, month, days_in_month))
+        except Exception as e:
+            logger.error(f"❌ Error getting month availability: {e}")
+            return {}
+        
+        reservations_by_day: Dict[int, list] = {}
+        for row in rows:
+            reservations_by_day.setdefault(row['reservation_date'].day, []).append(row)
+        
+        now = time_module.monotonic()
+        
+        day_load = {}
+        for day in range(1, days_in_month + 1):
+            day_reservations = reservations_by_day.get(day)
+            if not day_reservations:
+                day_load[day] = 'free'
+                continue
+            
+            # Рассадка строится один раз и сразу кэшируется для проверок этой даты
+            allocation = self._build_allocation(date(year, month, day), tables, day_reservations)
+            self.allocation_cache[allocation.reservation_date] = (now, allocation)
+            
+            day_load[day] = self._classify_day(allocation)
+        
+        self.month_cache[(year, month)] = (now, day_load)
+        return day_load
+    
+    def _classify_day(self, allocation: DateAllocation) -> str:
+        """Загрузка дня для календаря по рассадке: 'free', 'busy' или 'full'"""
+        busy_tables = len(allocation.tables) * self.restaurant_config['busy_threshold']
+        free_counts = [
+            len(allocation.free_tables(time(*map(int, slot.split(':')))))
+            for slot in self.get_time_slots()
+        ]
+        if not any(free_counts):
+            return 'full'
+        if any(len(allocation.tables) - free_count >= busy_tables for free_count in free_counts):
+            return 'busy'
+        return 'free'
+    
+    def on_reservation_created(self, reservation_date: date, reservation_id: int, reservation_time: time,
+                               guests_count: int, table_numbers: List[int]):
+        """Инкрементальное обновление кэшей после создания брони"""
+        cached = self.allocation_cache.get(reservation_date)
+        if not cached:
+            self.month_cache.pop((reservation_date.year, reservation_date.month), None)
+            return
+        
+        if not cached[1].add_reservation(reservation_id, reservation_time, guests_count, table_numbers):
+            self.invalidate_availability(reservation_date)
+            return
+        
+        self._refresh_month_day(cached[1])
+    
+    def on_reservation_status_changed(self, reservation_id: int, reservation_date: date,
+                                      old_status: str, new_status: str):
+        """Инкрементальное обновление кэшей после смены статуса брони"""
+        was_active = old_status in ACTIVE_STATUSES
+        is_active = new_status in ACTIVE_STATUSES
+        if was_active == is_active:
+            return
+        
+        cached = self.allocation_cache.get(reservation_date)
+        # Возврат брони в активные или бронь не учтена в рассадке - перестраиваем дату целиком
+        if not cached or is_active or not cached[1].remove_reservation(reservation_id):
+            self.invalidate_availability(reservation_date)
+            return
+        
+        self._refresh_month_day(cached[1])
+    
+    def _refresh_month_day(self, allocation: DateAllocation):
+        """Пересчет отметки дня в кэше месяца, если месяц закэширован"""
+        reservation_date = allocation.reservation_date
+        cached_month = self.month_cache.get((reservation_date.year, reservation_date.month))
+        if cached_month:
+            cached_month[1][reservation_date.day] = self._classify_day(allocation)
+    
+    def invalidate_availability(self, reservation_date: date = None):
+        """Сброс рассадки и загрузки месяца (бронь создана, отменена или сменила статус)"""
+        if reservation_date is None:
+            self.allocation_cache.clear()
+            self.month_cache.clear()
+        else:
+            self.allocation_cache.pop(reservation_date, None)
+            self.month_cache.pop((reservation_date.year, reservation_date.month), None)
+    
+    async def get_tables(self, conn: asyncpg.Connection = None) -> List[RestaurantTable]:
+        """
+        Схема зала. Без restaurant_tables - схема по умолчанию (default_tables).
+        Внутри транзакции (conn) запрос выполняется под точкой сохранения, чтобы
+        ошибка чтения схемы не прерывала транзакцию брони
+        """
+        if self.tables is not None:
+            return self.tables
+        
+        query = """
+            SELECT table_number, seats, zone, can_join
+            FROM restaurant_tables
+            WHERE is_active = TRUE
+            ORDER BY table_number
+        """
+        try:
+            if conn is not None:
+                async with conn.transaction():
+                    rows = await conn.fetch(query)
+            else:
+                rows = await self.db_manager.pool.fetch(query)
+        except Exception as e:
+            # Схему по умолчанию не кэшируем: следующий запрос снова попробует прочитать зал
+            logger.error(f"❌ Failed to load restaurant tables, using default layout: {e}")
+            return self.default_tables()
+        
+        tables = [
+            RestaurantTable(row['table_number'], row['seats'], row['zone'], row['can_join'])
+            for row in rows
+        ]
+        if not tables:
+            tables = self.default_tables()
+            logger.warning(f"⚠️ restaurant_tables is empty, using default layout: {len(tables)} tables")
+        
+        self.tables = tables
+        return tables
+    
+    def default_tables(self) -> List[RestaurantTable]:
+        """
+        Схема зала по умолчанию: max_tables столов поровну из table_capacity в одной зоне,
+        все можно сдвигать - компания рассаживается, пока хватает общей вместимости
+        """
+        max_tables = self.restaurant_config['max_tables']
+        seats = self.restaurant_config['table_capacity'] // max_tables
+        return [RestaurantTable(number, seats, DEFAULT_ZONE, True) for number in range(1, max_tables + 1)]
+    
+    def invalidate_tables(self):
+        """Сброс схемы зала и построенных по ней рассадок (изменились restaurant_tables)"""
+        self.tables = None
+        self.invalidate_availability()
+    
+    async def get_date_allocation(self, reservation_date: date, conn: asyncpg.Connection = None) -> DateAllocation:
+        """
+        Рассадка броней на дату. Внутри транзакции (conn) всегда строится заново
+        по актуальным данным, иначе берется из кэша
+        """
+        if conn is None:
+            cached = self.allocation_cache.get(reservation_date)
+            if cached and time_module.monotonic() - cached[0] < self.cache_ttl:
+                return cached[1]
+        
+        tables = await self.get_tables(conn)
+        reservations = await self._get_reservations_for_date(reservation_date, conn)
+        allocation = self._build_allocation(reservation_date, tables, reservations)
+        
+        if conn is None:
+            self.allocation_cache[reservation_date] = (time_module.monotonic(), allocation)
+        return allocation
+    
+    def _build_allocation(self, reservation_date: date, tables: List[RestaurantTable], reservations: List[Dict]) -> DateAllocation:
+        """Рассадка броней даты в порядке создания"""
+        # В схеме по умолчанию сдвигаются любые столы, иначе не больше max_join_tables
+        max_join_tables = self.restaurant_config['max_join_tables']
+        if all(table.zone == DEFAULT_ZONE for table in tables):
+            max_join_tables = len(tables)
+        allocation = DateAllocation(
+            reservation_date, tables,
+            self.restaurant_config['reservation_duration'],
+            self.restaurant_config['cleaning_interval'],
+            max_join_tables
+        )
+        for reservation in reservations:
+            allocation.add_reservation(
+                reservation['id'], reservation['reservation_time'],
+                reservation['guests_count'], reservation['table_numbers']
+            )
+        return allocation
+    
+    def _evaluate_allocation(self, allocation: DateAllocation, reservation_time: time, guests_count: int) -> Dict[str, any]:
+        """Подбор столов для брони по рассадке даты"""
+        tables = allocation.find_tables(reservation_time, guests_count)
+        
+        if tables is None:
+            if guests_count > allocation.max_party_size:
+                return {
+                    "available": False,
+                    "reason": "capacity_exceeded",
+                    "details": f"Максимальный размер компании: {allocation.max_party_size}"
+                }
+            return {
+                "available": False,
+                "reason": "no_tables",
+                "details": "Нет подходящих свободных столов в это время"
+            }
+        
+        return {
+            "available": True,
+            "reason": "available",
+            "details": {
+                "tables": list(tables),
+                "free_tables": len(allocation.free_tables(reservation_time))
+            }
+        }
     
     async def _check_basic_conditions(self, target_datetime: datetime, guests_count: int) -> Dict[str, any]:
         """Проверка базовых условий (время работы, валидность даты и т.д.)"""
@@ -68,104 +381,51 @@ class ReservationManager:
         
         return {"available": True}
     
-    async def _get_reservations_for_date(self, reservation_date: date) -> List[Dict]:
-        """Получение всех бронирований на указанную дату"""
+    async def _get_reservations_for_date(self, reservation_date: date, conn: asyncpg.Connection = None) -> List[Dict]:
+        """Получение всех бронирований на указанную дату в порядке создания"""
         query = """
-            SELECT reservation_time, guests_count, status 
-            FROM reservations 
-            WHERE reservation_date = $1 
+            SELECT id, reservation_time, guests_count, table_numbers, status
+            FROM reservations
+            WHERE reservation_date = $1
             AND status IN ('pending', 'confirmed')
+            ORDER BY id
         """
         
-        async with self.db_manager.pool.acquire() as conn:
+        if conn is not None:
             rows = await conn.fetch(query, reservation_date)
             return [dict(row) for row in rows]
-    
-    async def _check_availability_with_overlaps(self, target_datetime: datetime, guests_count: int, reservations: List[Dict]) -> Dict[str, any]:
-        """Проверка доступности с учетом пересечений временных интервалов"""
-        
-        # Рассчитываем временной интервал брони
-        reservation_start = target_datetime
-        reservation_end = reservation_start + self.restaurant_config['reservation_duration']
         
-        # Считаем занятые места в пересекающихся интервалах
-        overlapping_guests = 0
-        overlapping_reservations = 0
-        
-        for reservation in reservations:
-            # Время существующей брони
-            existing_time = reservation['reservation_time']
-            if isinstance(existing_time, str):
-                # Если время в строковом формате
-                existing_hour, existing_minute = map(int, existing_time.split(':'))
-                existing_start = datetime(
-                    target_datetime.year, target_datetime.month, target_datetime.day,
-                    existing_hour, existing_minute
-                )
-            else:
-                # Если время в формате time
-                existing_start = datetime.combine(target_datetime, existing_time)
-            
-            existing_end = existing_start + self.restaurant_config['reservation_duration']
-            
-            # Проверяем пересечение интервалов
-            if self._time_intervals_overlap(
-                reservation_start, reservation_end,
-                existing_start, existing_end
-            ):
-                overlapping_guests += reservation['guests_count']
-                overlapping_reservations += 1
-        
-        # Проверяем вместимость
-        total_guests_during_overlap = overlapping_guests + guests_count
-        
-        if overlapping_reservations >= self.restaurant_config['max_tables']:
-            return {
-                "available": False, 
-                "reason": "no_tables",
-                "details": f"Все {self.restaurant_config['max_tables']} столов заняты в это время"
-            }
-        
-        if total_guests_during_overlap > self.restaurant_config['table_capacity']:
-            return {
-                "available": False, 
-                "reason": "capacity_exceeded",
-                "details": f"Превышена вместимость: {total_guests_during_overlap}/{self.restaurant_config['table_capacity']}"
-            }
-        
-        return {
-            "available": True,
-            "reason": "available",
-            "details": {
-                "overlapping_reservations": overlapping_reservations,
-                "available_tables": self.restaurant_config['max_tables'] - overlapping_reservations,
-                "current_guests": overlapping_guests,
-                "capacity_after": self.restaurant_config['table_capacity'] - total_guests_during_overlap
-            }
-        }
-    
-    def _time_intervals_overlap(self, start1: datetime, end1: datetime, start2: datetime, end2: datetime) -> bool:
-        """Проверяет пересекаются ли два временных интервала"""
-        return (start1 < end2) and (start2 < end1)
+        async with self.db_manager.pool.acquire() as conn:
+            rows = await conn.fetch(query, reservation_date)
+            return [dict(row) for row in rows]
     
 
     @asynccontextmanager
     async def reservation_transaction(self, reservation_date: str, reservation_time: str):
-        """Контекстный менеджер для безопасного создания брони"""
+        """
+        Контекстный менеджер для безопасного создания брони.
+        
+        Брони одной даты сериализуются advisory-блокировкой на эту дату,
+        брони на разные даты создаются параллельно.
+        """
         day, month, year = map(int, reservation_date.split('.'))
         reservation_date_obj = date(year, month, day)
         
         async with self.db_manager.pool.acquire() as conn:
             try:
-                # Начинаем транзакцию с высоким уровнем изоляции
-                async with conn.transaction(isolation='serializable'):
-                    # Блокируем таблицу для предотвращения race conditions
-                    await conn.execute("LOCK TABLE reservations IN SHARE UPDATE EXCLUSIVE MODE")
+                # READ COMMITTED: после получения блокировки каждый запрос видит брони,
+                # закоммиченные предыдущим владельцем блокировки
+                async with conn.transaction():
+                    # Блокировка снимается автоматически в конце транзакции
+                    await conn.execute(
+                        "SELECT pg_advisory_xact_lock($1, $2)",
+                        RESERVATION_LOCK_NAMESPACE, reservation_date_obj.toordinal()
+                    )
                     
                     yield conn
                     
-            except asyncpg.SerializationError:
-                logger.warning("⚡ Transaction serialization error - retrying might be needed")
+            except asyncpg.DeadlockDetectedError:
+                logger.warning("⚡ Transaction deadlock detected - retrying might be needed")
                 raise
             except Exception as e:
                 logger.error(f"❌ Transaction error: {e}")
@@ -179,25 +439,36 @@ class ReservationManager:
         for attempt in range(max_retries):
             try:
                 async with self.reservation_transaction(reservation_date, reservation_time) as conn:
-                    # Повторная проверка доступности внутри транзакции
-                    availability = await self.check_table_availability(reservation_date, reservation_time, guests_count)
+                    # Повторная проверка доступности внутри транзакции на том же соединении
+                    availability = await self.check_table_availability(
+                        reservation_date, reservation_time, guests_count, conn=conn
+                    )
                     
                     if not availability["available"]:
                         logger.warning(f"❌ Reservation no longer available: {availability['reason']}")
                         return None
                     
-                    # Создаем бронь
+                    # Создаем бронь на подобранные столы
+                    table_numbers = availability["details"]["tables"]
                     reservation_id = await self._create_reservation_in_transaction(
-                        conn, user_id, reservation_date, reservation_time, guests_count, customer_name, customer_phone
+                        conn, user_id, reservation_date, reservation_time, guests_count, customer_name, customer_phone,
+                        table_numbers
                     )
                     
-                    logger.info(f"✅ Reservation #{reservation_id} created atomically")
-                    return reservation_id
+                    logger.info(f"✅ Reservation #{reservation_id} created atomically (tables: {table_numbers})")
+                
+                # Кэши обновляем после коммита, чтобы их не перечитали до появления брони
+                day, month, year = map(int, reservation_date.split('.'))
+                hour, minute = map(int, reservation_time.split(':'))
+                self.on_reservation_created(
+                    date(year, month, day), reservation_id, time(hour, minute), guests_count, table_numbers
+                )
+                return reservation_id
                     
-            except asyncpg.SerializationError:
+            except (asyncpg.DeadlockDetectedError, asyncpg.SerializationError):
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 0.1  # Exponential backoff
-                    logger.info(f"🔄 Retrying reservation after serialization error (attempt {attempt + 1})")
+                    logger.info(f"🔄 Retrying reservation after lock conflict (attempt {attempt + 1})")
                     await asyncio.sleep(wait_time)
                     continue
                 else:
@@ -210,7 +481,8 @@ class ReservationManager:
         return None
     
     async def _create_reservation_in_transaction(self, conn, user_id: int, reservation_date: str, reservation_time: str,
-                                               guests_count: int, customer_name: str, customer_phone: str) -> int:
+                                               guests_count: int, customer_name: str, customer_phone: str,
+                                               table_numbers: List[int] = None) -> int:
         """Создание брони внутри транзакции"""
         
         day, month, year = map(int, reservation_date.split('.'))
@@ -222,9 +494,9 @@ class ReservationManager:
         
         reservation_id = await conn.fetchval('''
             INSERT INTO reservations 
-            (user_id, reservation_date, reservation_time, guests_count, customer_name, customer_phone, status)
-            VALUES ($1, $2, $3, $4, $5, $6, 'pending')
+            (user_id, reservation_date, reservation_time, guests_count, customer_name, customer_phone, table_numbers, status)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, 'pending')
             RETURNING id
-        ''', user_id, reservation_date_obj, reservation_time_obj, guests_count, customer_name, customer_phone)
+        ''', user_id, reservation_date_obj, reservation_time_obj, guests_count, customer_name, customer_phone, table_numbers)
         
         return reservation_id
\ No newline at end of file
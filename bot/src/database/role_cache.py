@@ -0,0 +1,58 @@
+import time
+import logging
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+class RoleCache:
+    """Кэш ролей в памяти процесса: множества ID администраторов и персонала"""
+
+    def __init__(self, ttl: int = 300, retry_interval: int = 30):
+        self.ttl = ttl  # Время жизни кэша в секундах
+        # Пауза после неудачной загрузки: пока БД недоступна, отдаем прежние роли
+        self.retry_interval = retry_interval
+        self.failed_at = 0.0
+        self.admin_ids: frozenset = frozenset()
+        self.staff_ids: frozenset = frozenset()  # Персонал = админы + официанты
+        self.loaded_at = 0.0
+        self.version = 0
+
+    def seed(self, admin_ids: Iterable[int], staff_ids: Iterable[int]):
+        """Начальное заполнение из статических списков (до загрузки из БД)"""
+        self.admin_ids = frozenset(admin_ids)
+        self.staff_ids = frozenset(staff_ids) | self.admin_ids
+
+    def load(self, admin_ids: Iterable[int], staff_ids: Iterable[int]):
+        """Замена содержимого кэша данными из БД"""
+        self.seed(admin_ids, staff_ids)
+        self.loaded_at = time.monotonic()
+        self.failed_at = 0.0
+        self.version += 1
+        logger.debug(f"🔄 Role cache loaded: {len(self.admin_ids)} admins, {len(self.staff_ids)} staff")
+
+    def invalidate(self):
+        """Помечает кэш устаревшим, следующая проверка перечитает роли из БД"""
+        self.loaded_at = 0.0
+        self.failed_at = 0.0
+
+    def mark_failed(self):
+        """Загрузка не удалась: следующая попытка не раньше чем через retry_interval"""
+        self.failed_at = time.monotonic()
+
+    def is_fresh(self) -> bool:
+        return self.loaded_at > 0 and time.monotonic() - self.loaded_at < self.ttl
+
+    def needs_refresh(self) -> bool:
+        """Кэш устарел и время повторной попытки после ошибки уже наступило"""
+        if self.is_fresh():
+            return False
+        return not self.failed_at or time.monotonic() - self.failed_at >= self.retry_interval
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admin_ids
+
+    def is_staff(self, user_id: int) -> bool:
+        return user_id in self.staff_ids
+
+# Глобальный экземпляр
+role_cache = RoleCache()
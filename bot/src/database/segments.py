@@ -0,0 +1,353 @@
+"""
+Сегменты аудитории рассылок.
+
+Сегмент - выражение из условий по полям пользователя, объединенных
+and / or / not и скобками, например:
+
+    sex = female and orders >= 3 and inactive_days >= 30
+
+Выражение компилируется в условие WHERE над users u с позиционными
+параметрами ($1, $2, ...), значения в текст запроса не подставляются.
+"""
+
+import re
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, List, Optional, Tuple
+
+class SegmentParseError(ValueError):
+    """Ошибка в тексте сегмента (сообщение показывается администратору)"""
+    pass
+
+# ==================== ПОЛЯ ====================
+
+COMPARISON_OPS = ('<=', '>=', '!=', '=', '<', '>')
+EQUALITY_OPS = ('=', '!=')
+
+# Значения сравниваются в SQL с integer-колонками, дни вычитаются из CURRENT_TIMESTAMP
+INT4_MAX = 2 ** 31 - 1
+MAX_INACTIVE_DAYS = 36500
+# Порядок суммы (numeric) - больше заведомо не бывает
+MAX_AMOUNT_DIGITS = 15
+
+def _parse_int(value: str, maximum: int = INT4_MAX) -> int:
+    # isdigit() пропускает надстрочные и другие юникодные цифры, которые int() не разбирает
+    if not (value.isascii() and value.isdigit()):
+        raise SegmentParseError(f"Ожидалось целое число, получено «{value}»")
+    number = int(value)
+    if number > maximum:
+        raise SegmentParseError(f"Слишком большое число: {value} (не больше {maximum})")
+    return number
+
+def _parse_days(value: str) -> int:
+    return _parse_int(value, MAX_INACTIVE_DAYS)
+
+def _parse_amount(value: str) -> Decimal:
+    try:
+        amount = Decimal(value.replace(',', '.'))
+    except InvalidOperation:
+        raise SegmentParseError(f"Ожидалась сумма, получено «{value}»")
+    if not amount.is_finite():
+        raise SegmentParseError(f"Ожидалась сумма, получено «{value}»")
+    if amount.adjusted() >= MAX_AMOUNT_DIGITS:
+        raise SegmentParseError(f"Слишком большая сумма: {value}")
+    if amount < 0:
+        raise SegmentParseError(f"Сумма не может быть отрицательной: {value}")
+    return amount
+
+def _parse_bool(value: str) -> bool:
+    lowered = value.lower()
+    if lowered in ('yes', 'true', 'да'):
+        return True
+    if lowered in ('no', 'false', 'нет'):
+        return False
+    raise SegmentParseError(f"Ожидалось yes/no, получено «{value}»")
+
+def _choice_parser(choices: Tuple[str, ...]) -> Callable[[str], str]:
+    def parse(value: str) -> str:
+        if value.lower() not in choices:
+            raise SegmentParseError(f"Допустимые значения: {', '.join(choices)}")
+        return value.lower()
+    return parse
+
+def _compare(column: str) -> Callable[[str, str], str]:
+    return lambda op, placeholder: f"{column} {op} {placeholder}"
+
+# Заказы доставки без отмененных
+ORDERS_COUNT_SQL = (
+    "(SELECT COUNT(*) FROM delivery_orders o "
+    "WHERE o.user_id = u.user_id AND o.status <> 'cancelled')"
+)
+ORDERS_SPENT_SQL = (
+    "(SELECT COALESCE(SUM(o.final_amount), 0) FROM delivery_orders o "
+    "WHERE o.user_id = u.user_id AND o.status <> 'cancelled')"
+)
+
+def _inactive_days_sql(op: str, placeholder: str) -> str:
+    """
+    Дней с последнего действия в user_actions. Сравнение сводится к EXISTS
+    по окну времени, чтобы использовать индекс (user_id, created_at)
+    """
+    window_start = f"CURRENT_TIMESTAMP - make_interval(days => {placeholder})"
+    if op in ('<', '<='):
+        bound = '>' if op == '<' else '>='
+        return f"EXISTS (SELECT 1 FROM user_actions a WHERE a.user_id = u.user_id AND a.created_at {bound} {window_start})"
+    if op in ('>', '>='):
+        bound = '>=' if op == '>' else '>'
+        return f"NOT EXISTS (SELECT 1 FROM user_actions a WHERE a.user_id = u.user_id AND a.created_at {bound} {window_start})"
+    raise SegmentParseError("Для inactive_days используйте <, <=, > или >=")
+
+@dataclass(frozen=True)
+class SegmentField:
+    """Поле, по которому можно отбирать пользователей"""
+    description: str
+    parse: Callable[[str], object]
+    ops: Tuple[str, ...]
+    sql: Callable[[str, str], str]
+
+SEGMENT_FIELDS: Dict[str, SegmentField] = {
+    'sex': SegmentField(
+        "пол: male, female", _choice_parser(('male', 'female', 'other', 'unknown')),
+        EQUALITY_OPS, _compare("u.sex")
+    ),
+    'major': SegmentField(
+        "занятость: student, entrepreneur, hire, frilans",
+        _choice_parser(('student', 'entrepreneur', 'hire', 'frilans', 'other', 'unknown')),
+        EQUALITY_OPS, _compare("u.major")
+    ),
+    'inactive_days': SegmentField(
+        "дней с последней активности", _parse_days, ('<', '<=', '>', '>='), _inactive_days_sql
+    ),
+    'orders': SegmentField(
+        "количество заказов доставки", _parse_int, COMPARISON_OPS, _compare(ORDERS_COUNT_SQL)
+    ),
+    'spent': SegmentField(
+        "сумма заказов доставки", _parse_amount, COMPARISON_OPS, _compare(ORDERS_SPENT_SQL)
+    ),
+    'bonus': SegmentField(
+        "бонусный баланс", _parse_amount, COMPARISON_OPS, _compare("u.bonus_balance")
+    ),
+    'referred': SegmentField(
+        "пришел по приглашению: yes, no", _parse_bool, EQUALITY_OPS, _compare("(u.referrer_id IS NOT NULL)")
+    ),
+    'referrals': SegmentField(
+        "сколько друзей пригласил", _parse_int, COMPARISON_OPS, _compare("u.referral_count")
+    ),
+}
+
+# ==================== ВЫРАЖЕНИЯ ====================
+
+class SegmentExpression:
+    """Узел выражения сегмента"""
+
+    def compile(self, params: list) -> str:
+        """SQL-условие над users u. Значения добавляются в params"""
+        raise NotImplementedError
+
+    def to_text(self) -> str:
+        raise NotImplementedError
+
+    def __and__(self, other: "SegmentExpression") -> "SegmentExpression":
+        return And((self, other))
+
+    def __or__(self, other: "SegmentExpression") -> "SegmentExpression":
+        return Or((self, other))
+
+    def __invert__(self) -> "SegmentExpression":
+        return Not(self)
+
+@dataclass(frozen=True)
+class Condition(SegmentExpression):
+    field: str
+    op: str
+    value: object
+
+    def compile(self, params: list) -> str:
+        params.append(self.value)
+        return SEGMENT_FIELDS[self.field].sql(self.op, f"${len(params)}")
+
+    def to_text(self) -> str:
+        value = self.value
+        if isinstance(value, bool):
+            value = 'yes' if value else 'no'
+        return f"{self.field} {self.op} {value}"
+
+@dataclass(frozen=True)
+class And(SegmentExpression):
+    items: Tuple[SegmentExpression, ...]
+
+    def compile(self, params: list) -> str:
+        if not self.items:
+            return "TRUE"
+        return "(" + " AND ".join(item.compile(params) for item in self.items) + ")"
+
+    def to_text(self) -> str:
+        return " and ".join(_wrap(item, Or) for item in self.items)
+
+@dataclass(frozen=True)
+class Or(SegmentExpression):
+    items: Tuple[SegmentExpression, ...]
+
+    def compile(self, params: list) -> str:
+        return "(" + " OR ".join(item.compile(params) for item in self.items) + ")"
+
+    def to_text(self) -> str:
+        return " or ".join(item.to_text() for item in self.items)
+
+@dataclass(frozen=True)
+class Not(SegmentExpression):
+    item: SegmentExpression
+
+    def compile(self, params: list) -> str:
+        return f"NOT ({self.item.compile(params)})"
+
+    def to_text(self) -> str:
+        return f"not {_wrap(self.item, (And, Or))}"
+
+def _wrap(item: SegmentExpression, compound) -> str:
+    text = item.to_text()
+    return f"({text})" if isinstance(item, compound) else text
+
+ALL_USERS = And(())
+
+# ==================== РАЗБОР ТЕКСТА ====================
+
+TOKEN_RE = re.compile(r"\s*(?:(\()|(\))|(<=|>=|!=|=|<|>)|([^\s()<>=!]+))")
+KEYWORDS = {
+    'and': 'and', 'и': 'and',
+    'or': 'or', 'или': 'or',
+    'not': 'not', 'не': 'not',
+}
+
+def _tokenize(text: str) -> List[str]:
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN_RE.match(text, position)
+        if not match or match.end() == position:
+            raise SegmentParseError(f"Непонятный символ в позиции {position + 1}: «{text[position]}»")
+        tokens.append(next(group for group in match.groups() if group))
+        position = match.end()
+    return tokens
+
+class _Parser:
+    """Рекурсивный спуск: or < and < not < (скобки | условие)"""
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise SegmentParseError("Выражение оборвалось")
+        self.position += 1
+        return token
+
+    def keyword(self) -> Optional[str]:
+        token = self.peek()
+        return KEYWORDS.get(token.lower()) if token else None
+
+    def parse(self) -> SegmentExpression:
+        expression = self.parse_or()
+        if self.peek() is not None:
+            raise SegmentParseError(f"Лишний фрагмент: «{self.peek()}»")
+        return expression
+
+    def parse_or(self) -> SegmentExpression:
+        items = [self.parse_and()]
+        while self.keyword() == 'or':
+            self.take()
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else Or(tuple(items))
+
+    def parse_and(self) -> SegmentExpression:
+        items = [self.parse_not()]
+        while self.keyword() == 'and':
+            self.take()
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else And(tuple(items))
+
+    def parse_not(self) -> SegmentExpression:
+        if self.keyword() == 'not':
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self) -> SegmentExpression:
+        if self.peek() == '(':
+            self.take()
+            expression = self.parse_or()
+            if self.take() != ')':
+                raise SegmentParseError("Не хватает закрывающей скобки")
+            return expression
+
+        field_name = self.take().lower()
+        field = SEGMENT_FIELDS.get(field_name)
+        if field is None:
+            raise SegmentParseError(f"Неизвестное поле «{field_name}»")
+
+        op = self.take()
+        if op not in field.ops:
+            raise SegmentParseError(f"Для {field_name} допустимы операторы: {' '.join(field.ops)}")
+
+        return Condition(field_name, op, field.parse(self.take()))
+
+def parse_segment(text: str) -> SegmentExpression:
+    """Разбор текста сегмента. Пустой текст - все пользователи"""
+    tokens = _tokenize(text or "")
+    if not tokens:
+        return ALL_USERS
+    return _Parser(tokens).parse()
+
+def segment_help() -> str:
+    """Подсказка по синтаксису для администратора"""
+    fields = "\n".join(f"• <code>{name}</code> - {field.description}" for name, field in SEGMENT_FIELDS.items())
+    return (
+        f"{fields}\n\n"
+        "Операторы: = != &lt; &lt;= &gt; &gt;=, условия объединяются and / or / not и скобками.\n"
+        "Пример: <code>sex = female and (orders &gt;= 3 or spent &gt;= 5000) and inactive_days &gt;= 30</code>"
+    )
+
+# ==================== ГОТОВЫЕ СЕГМЕНТЫ ====================
+
+@dataclass(frozen=True)
+class Segment:
+    name: str
+    expression: SegmentExpression
+
+PREDEFINED_SEGMENTS: Dict[str, Segment] = {
+    key: Segment(name, parse_segment(text))
+    for key, (name, text) in {
+        "all": ("👥 Все пользователи", ""),
+        "male": ("👨 Мужчины", "sex = male"),
+        "female": ("👩 Женщины", "sex = female"),
+        "students": ("🎓 Студенты", "major = student"),
+        "entrepreneurs": ("💼 Предприниматели", "major = entrepreneur"),
+        "employees": ("💻 Работающие по найму", "major = hire"),
+        "freelancers": ("🚀 Фрилансеры", "major = frilans"),
+    }.items()
+}
+
+def resolve_segment(segment_key: str = None, segment_expression: str = None) -> SegmentExpression:
+    """Выражение сегмента: свое (segment_expression) или готовое по ключу, иначе все пользователи"""
+    if segment_expression:
+        return parse_segment(segment_expression)
+    segment = PREDEFINED_SEGMENTS.get(segment_key)
+    return segment.expression if segment else ALL_USERS
+
+def compile_segment(expression: SegmentExpression, params: list, reachable_only: bool = True) -> str:
+    """
+    Условие WHERE над users u вместе с базовыми условиями рассылки.
+    reachable_only - без заблокировавших бота и пользователей без чата
+    """
+    base_condition = "u.is_blocked = FALSE"
+    if reachable_only:
+        base_condition += " AND u.is_reachable = TRUE"
+    if expression == ALL_USERS:
+        return base_condition
+    return f"{base_condition} AND {expression.compile(params)}"
@@ -0,0 +1,145 @@
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Шаг шкалы занятости и количество шагов в сутках
+BUCKET_MINUTES = 15
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+
+@dataclass(frozen=True)
+class RestaurantTable:
+    """Стол зала"""
+    number: int
+    seats: int
+    zone: Optional[str] = None
+    can_join: bool = False
+
+class DateAllocation:
+    """
+    Рассадка броней одной даты по конкретным столам.
+
+    Сутки разбиты на 15-минутные интервалы. Занятость стола хранится битовой маской
+    интервалов (с учетом уборки), поэтому проверка "свободен ли стол на любую
+    длительность" - одна операция AND.
+
+    Новая бронь получает наименьший подходящий свободный стол (best-fit),
+    а если такого нет - наименьшую комбинацию сдвигаемых столов одной зоны.
+    """
+
+    def __init__(self, reservation_date: date, tables: List[RestaurantTable], duration: timedelta,
+                 cleaning_interval: timedelta, max_join_tables: int = 3):
+        self.reservation_date = reservation_date
+        self.tables = sorted(tables, key=lambda table: (table.seats, table.number))
+        self.buckets_per_reservation = -(-int((duration + cleaning_interval).total_seconds()) // (BUCKET_MINUTES * 60))
+        self.max_join_tables = max_join_tables
+
+        self.table_masks: Dict[int, int] = {table.number: 0 for table in self.tables}
+        # {reservation_id: (время, столы)} - для снятия брони при отмене
+        self.assignments: Dict[int, Tuple[object, Tuple[int, ...]]] = {}
+
+    @property
+    def max_party_size(self) -> int:
+        """Наибольшая компания, которую можно рассадить в пустом зале"""
+        best = max((table.seats for table in self.tables), default=0)
+        zones: Dict[str, List[int]] = {}
+        for table in self.tables:
+            if table.can_join and table.zone:
+                zones.setdefault(table.zone, []).append(table.seats)
+        for seats in zones.values():
+            best = max(best, sum(sorted(seats, reverse=True)[:self.max_join_tables]))
+        return best
+
+    def bucket_range(self, reservation_time) -> Tuple[int, int]:
+        """Интервалы [first, last), которые бронь занимает вместе с уборкой"""
+        if isinstance(reservation_time, str):
+            hour, minute = map(int, reservation_time.split(':')[:2])
+        else:
+            hour, minute = reservation_time.hour, reservation_time.minute
+        first = (hour * 60 + minute) // BUCKET_MINUTES
+        return first, min(first + self.buckets_per_reservation, BUCKETS_PER_DAY)
+
+    @staticmethod
+    def _mask(first: int, last: int) -> int:
+        return ((1 << (last - first)) - 1) << first
+
+    def is_free(self, table_number: int, reservation_time) -> bool:
+        return not self.table_masks[table_number] & self._mask(*self.bucket_range(reservation_time))
+
+    def free_tables(self, reservation_time) -> List[RestaurantTable]:
+        mask = self._mask(*self.bucket_range(reservation_time))
+        return [table for table in self.tables if not self.table_masks[table.number] & mask]
+
+    def find_tables(self, reservation_time, guests_count: int) -> Optional[Tuple[int, ...]]:
+        """Подбор столов для брони без назначения. None - рассадить невозможно"""
+        free = self.free_tables(reservation_time)
+
+        # Один стол: наименьший, куда помещаются гости
+        for table in free:
+            if table.seats >= guests_count:
+                return (table.number,)
+
+        # Объединение столов одной зоны: минимум лишних мест, затем минимум столов
+        zones: Dict[str, List[RestaurantTable]] = {}
+        for table in free:
+            if table.can_join and table.zone:
+                zones.setdefault(table.zone, []).append(table)
+
+        best: Optional[Tuple[int, int, Tuple[int, ...]]] = None
+        for zone_tables in zones.values():
+            for size in range(2, min(self.max_join_tables, len(zone_tables)) + 1):
+                for combo in combinations(zone_tables, size):
+                    seats = sum(table.seats for table in combo)
+                    if seats < guests_count:
+                        continue
+                    candidate = (seats, size, tuple(sorted(table.number for table in combo)))
+                    if best is None or candidate < best:
+                        best = candidate
+
+        return best[2] if best else None
+
+    def assign(self, reservation_time, table_numbers: Iterable[int]):
+        """Занять столы на время брони"""
+        mask = self._mask(*self.bucket_range(reservation_time))
+        for table_number in table_numbers:
+            if table_number in self.table_masks:
+                self.table_masks[table_number] |= mask
+
+    def release(self, reservation_time, table_numbers: Iterable[int]):
+        """Освободить столы отмененной брони"""
+        mask = self._mask(*self.bucket_range(reservation_time))
+        for table_number in table_numbers:
+            if table_number in self.table_masks:
+                self.table_masks[table_number] &= ~mask
+
+    def add_reservation(self, reservation_id: int, reservation_time, guests_count: int,
+                        table_numbers: Optional[Iterable[int]] = None) -> Optional[Tuple[int, ...]]:
+        """
+        Учет брони. Если столы уже назначены и свободны - занимаем их,
+        иначе (старые брони без столов) подбираем столы так же, как для новой брони
+        """
+        if table_numbers:
+            table_numbers = tuple(table_numbers)
+            if not all(number in self.table_masks and self.is_free(number, reservation_time) for number in table_numbers):
+                table_numbers = None
+
+        if not table_numbers:
+            table_numbers = self.find_tables(reservation_time, guests_count)
+            if not table_numbers:
+                logger.warning(f"⚠️ Reservation #{reservation_id} on {self.reservation_date} does not fit any table")
+                return None
+
+        self.assign(reservation_time, table_numbers)
+        self.assignments[reservation_id] = (reservation_time, table_numbers)
+        return table_numbers
+
+    def remove_reservation(self, reservation_id: int) -> bool:
+        """Снятие брони (отмена, завершение). False - бронь не была учтена"""
+        assignment = self.assignments.pop(reservation_id, None)
+        if assignment is None:
+            return False
+        self.release(*assignment)
+        return True
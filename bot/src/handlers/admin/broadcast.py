@@ -5,12 +5,19 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from fluent.runtime import FluentLocalization
 import logging
 from datetime import datetime
+import html
 import json
 
 from src.states.broadcast import BroadcastStates
 from src.database.db_manager import DatabaseManager
+from src.database.segments import PREDEFINED_SEGMENTS, SegmentParseError, parse_segment, segment_help
 from src.utils.config import settings
 from src.utils.logger import get_logger
+from src.utils.time_utils import format_restaurant_time, get_restaurant_time, parse_schedule_time
+from src.utils.broadcast_jobs import (
+    get_broadcast_control_keyboard, get_scheduled_broadcast_keyboard,
+    queue_broadcast, start_broadcast as start_broadcast_job, pause_broadcast, resume_broadcast, cancel_broadcast as cancel_broadcast_job
+)
 
 router = Router()
 logger = get_logger(__name__)
@@ -19,15 +26,10 @@ class BroadcastManager:
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
         
-        # Определяем сегменты для рассылки
+        # Готовые сегменты для рассылки (условия в src/database/segments.py)
         self.segments = {
-            "all": {"name": "👥 Все пользователи", "filter": {}},
-            "male": {"name": "👨 Мужчины", "filter": {"sex": "male"}},
-            "female": {"name": "👩 Женщины", "filter": {"sex": "female"}},
-            "students": {"name": "🎓 Студенты", "filter": {"major": "student"}},
-            "entrepreneurs": {"name": "💼 Предприниматели", "filter": {"major": "entrepreneur"}},
-            "employees": {"name": "💻 Работающие по найму", "filter": {"major": "hire"}},
-            "freelancers": {"name": "🚀 Фрилансеры", "filter": {"major": "frilans"}}
+            segment_key: {"name": segment.name, "expression": segment.expression}
+            for segment_key, segment in PREDEFINED_SEGMENTS.items()
         }
         
         # Типы контента для рассылки
@@ -38,85 +40,8 @@ class BroadcastManager:
     
     async def get_segment_users_count(self, segment_key: str) -> int:
         """Получение количества пользователей в сегменте"""
-        try:
-            if segment_key == "all":
-                stats = await self.db_manager.get_general_stats()
-                return stats.get('total_users', 0)
-            elif segment_key in ["male", "female"]:
-                segments = await self.db_manager.get_target_segments()
-                return segments.get(f'{segment_key}_count', 0)
-            elif segment_key in ["students", "entrepreneurs", "employees", "freelancers"]:
-                segment_map = {
-                    "students": "students_count",
-                    "entrepreneurs": "entrepreneurs_count", 
-                    "employees": "employees_count",
-                    "freelancers": "freelancers_count"
-                }
-                segments = await self.db_manager.get_target_segments()
-                return segments.get(segment_map[segment_key], 0)
-            else:
-                # Для сложных сегментов пока возвращаем примерное количество
-                stats = await self.db_manager.get_general_stats()
-                return max(1, stats.get('total_users', 0) // 10)
-        except Exception as e:
-            logger.error(f"❌ Error getting segment count: {e}")
-            return 0
-    
-    async def send_broadcast_message(self, bot: Bot, user_id: int, message_type: str, 
-                                text: str, image_file_id: str = None) -> bool:
-        """Отправка сообщения пользователю в зависимости от типа"""
-        try:
-            if message_type == "text":
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=text,
-                    parse_mode="HTML"
-                )
-                return True
-                
-            elif message_type == "image":
-                if not image_file_id:
-                    logger.error(f"❌ No image_file_id for image broadcast to {user_id}")
-                    # Fallback to text only
-                    await bot.send_message(
-                        chat_id=user_id,
-                        text=text,
-                        parse_mode="HTML"
-                    )
-                    return True
-                
-                try:
-                    # Ограничиваем длину подписи для фото
-                    caption = text[:1024] if len(text) > 1024 else text
-                    await bot.send_photo(
-                        chat_id=user_id,
-                        photo=image_file_id,
-                        caption=caption,
-                        parse_mode="HTML"
-                    )
-                    return True
-                except Exception as photo_error:
-                    logger.error(f"❌ Failed to send photo to {user_id}: {photo_error}")
-                    # Fallback to text only
-                    await bot.send_message(
-                        chat_id=user_id,
-                        text=f"🖼️ {text}",  # Добавляем эмодзи чтобы показать, что должно было быть изображение
-                        parse_mode="HTML"
-                    )
-                    return True
-                    
-            else:
-                # Fallback для неизвестного типа
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=text,
-                    parse_mode="HTML"
-                )
-                return True
-                
-        except Exception as e:
-            logger.error(f"❌ Failed to send broadcast to {user_id}: {e}")
-            return False
+        counts = await self.db_manager.get_segment_counts()
+        return counts.get(segment_key, 0)
 
 @router.message(F.text == "📢 Сделать рассылку подписчикам")
 async def start_broadcast(message: Message, state: FSMContext, l10n: FluentLocalization, db_manager: DatabaseManager):
@@ -138,13 +63,16 @@ async def start_broadcast(message: Message, state: FSMContext, l10n: FluentLocal
         # Создаем клавиатуру для выбора сегмента
         builder = InlineKeyboardBuilder()
         
+        # Размеры всех сегментов одним запросом
+        segment_counts = await db_manager.get_segment_counts()
         for segment_key, segment_info in broadcast_manager.segments.items():
-            users_count = await broadcast_manager.get_segment_users_count(segment_key)
+            users_count = segment_counts.get(segment_key, 0)
             builder.button(
                 text=f"{segment_info['name']} ({users_count})",
                 callback_data=f"broadcast_segment_{segment_key}"
             )
         
+        builder.button(text="🧩 Свой сегмент", callback_data="broadcast_custom_segment")
         builder.button(text="❌ Отмена", callback_data="broadcast_cancel")
         builder.adjust(1)
         
@@ -183,6 +111,7 @@ async def choose_broadcast_segment(callback: CallbackQuery, state: FSMContext, d
         await state.update_data(
             segment_key=segment_key,
             segment_name=segment_info["name"],
+            segment_expression=None,
             users_count=users_count
         )
         
@@ -213,6 +142,84 @@ async def choose_broadcast_segment(callback: CallbackQuery, state: FSMContext, d
         logger.error(f"❌ Error choosing broadcast segment: {e}")
         await callback.answer("❌ Ошибка при выборе сегмента")
 
+@router.callback_query(BroadcastStates.choosing_segment, F.data == "broadcast_custom_segment")
+async def ask_custom_segment(callback: CallbackQuery, state: FSMContext):
+    """Запрос выражения своего сегмента"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔙 Назад", callback_data="broadcast_back_to_segments")
+    
+    await callback.message.edit_text(
+        "🧩 <b>СВОЙ СЕГМЕНТ</b>\n\n"
+        "Отправьте условие отбора пользователей. Доступные поля:\n"
+        f"{segment_help()}",
+        parse_mode="HTML",
+        reply_markup=builder.as_markup()
+    )
+    await state.set_state(BroadcastStates.entering_segment)
+    await callback.answer()
+
+@router.message(BroadcastStates.entering_segment, F.text)
+async def process_custom_segment(message: Message, state: FSMContext, db_manager: DatabaseManager):
+    """Разбор своего сегмента: размер аудитории и проверка плана запроса"""
+    try:
+        if message.text.startswith('/cancel'):
+            await message.answer("❌ Рассылка отменена")
+            await state.clear()
+            return
+        
+        try:
+            expression = parse_segment(message.text)
+        except SegmentParseError as e:
+            await message.answer(
+                f"❌ <b>Ошибка в сегменте:</b> {html.escape(str(e))}\n\n{segment_help()}",
+                parse_mode="HTML"
+            )
+            return
+        
+        segment_expression = expression.to_text()
+        users_count = await db_manager.count_segment(segment_expression=segment_expression)
+        plan = await db_manager.explain_segment(segment_expression=segment_expression)
+        
+        plan_text = ""
+        if plan:
+            # Полный просмотр больших таблиц означает, что индекс не подошел
+            slow_tables = [table for table in plan['seq_scans'] if table in ('user_actions', 'delivery_orders')]
+            plan_text = f"🔍 <b>Оценка запроса:</b> {plan['total_cost']:.0f}"
+            if slow_tables:
+                plan_text += f"\n⚠️ <i>Полный просмотр: {', '.join(slow_tables)}, подсчет может быть медленным</i>"
+            plan_text += "\n\n"
+        
+        await state.update_data(
+            segment_key="custom",
+            segment_name=f"🧩 {html.escape(segment_expression)}",
+            segment_expression=segment_expression,
+            users_count=users_count
+        )
+        
+        broadcast_manager = BroadcastManager(db_manager)
+        builder = InlineKeyboardBuilder()
+        for content_key, content_info in broadcast_manager.content_types.items():
+            builder.button(
+                text=f"{content_info['icon']} {content_info['name']}",
+                callback_data=f"broadcast_type_{content_key}"
+            )
+        builder.button(text="🔙 Назад", callback_data="broadcast_back_to_segments")
+        builder.adjust(1)
+        
+        await message.answer(
+            f"✅ <b>Сегмент:</b> <code>{html.escape(segment_expression)}</code>\n"
+            f"👥 <b>Количество пользователей:</b> {users_count}\n"
+            f"{plan_text}"
+            "🎨 <b>Выберите тип контента:</b>",
+            parse_mode="HTML",
+            reply_markup=builder.as_markup()
+        )
+        await state.set_state(BroadcastStates.choosing_type)
+        
+    except Exception as e:
+        logger.error(f"❌ Error processing custom segment: {e}")
+        await message.answer("❌ Ошибка при разборе сегмента")
+
 @router.callback_query(BroadcastStates.choosing_type, F.data.startswith("broadcast_type_"))
 async def choose_broadcast_type(callback: CallbackQuery, state: FSMContext):
     """Обработка выбора типа контента"""
@@ -336,6 +343,7 @@ async def process_broadcast_text(message: Message, state: FSMContext, bot: Bot,
         # Создаем клавиатуру подтверждения
         builder = InlineKeyboardBuilder()
         builder.button(text="✅ Подтвердить рассылку", callback_data="broadcast_confirm")
+        builder.button(text="🕒 Запланировать", callback_data="broadcast_schedule")
         builder.button(text="✏️ Изменить текст", callback_data="broadcast_edit_text")
         builder.button(text="🔄 Выбрать другой сегмент", callback_data="broadcast_back_to_segments")
         builder.button(text="❌ Отмена", callback_data="broadcast_cancel")
@@ -370,6 +378,20 @@ async def process_broadcast_text(message: Message, state: FSMContext, bot: Bot,
         logger.error(f"❌ Error processing broadcast text: {e}")
         await message.answer("❌ Ошибка при обработке текста")
 
+async def create_broadcast_from_state(db_manager: DatabaseManager, data: dict, scheduled_at: datetime = None):
+    """Запись рассылки в БД по данным, собранным в диалоге создания"""
+    return await db_manager.create_broadcast(
+        title=f"Рассылка {datetime.now().strftime('%d.%m.%Y %H:%M')}",
+        message_text=data.get('broadcast_text'),
+        target_sex='all',
+        target_major='all',
+        message_type=data.get('content_type'),
+        image_file_id=data.get('image_file_id'),
+        segment_key=data.get('segment_key'),
+        segment_expression=data.get('segment_expression'),
+        scheduled_at=scheduled_at
+    )
+
 @router.callback_query(BroadcastStates.confirming, F.data == "broadcast_confirm")
 async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot, db_manager: DatabaseManager):
     """Подтверждение и запуск рассылки"""
@@ -378,113 +400,48 @@ async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot
 
         data = await state.get_data()
         segment_key = data.get('segment_key')
-        segment_name = data.get('segment_name')
+        segment_expression = data.get('segment_expression')
         users_count = data.get('users_count', 0)
         content_type = data.get('content_type')
-        text = data.get('broadcast_text')
         image_file_id = data.get('image_file_id')
         
         logger.info(f"📤 Starting broadcast: type={content_type}, segment={segment_key}, users={users_count}, has_image={bool(image_file_id)}")
         
-        # Вместо редактирования существующего сообщения, отправляем новое
-        progress_message = await callback.message.answer(
-            f"🚀 <b>ЗАПУСК РАССЫЛКИ</b>\n\n"
-            f"📤 Отправка {users_count} сообщений...\n"
-            f"⏳ Это может занять несколько минут",
-            parse_mode="HTML"
-        )
-        
         # Создаем запись о рассылке в БД
-        broadcast_id = await db_manager.create_broadcast(
-            title=f"Рассылка {datetime.now().strftime('%d.%m.%Y %H:%M')}",
-            message_text=text,
-            target_sex='all',
-            target_major='all',
-            message_type=content_type,
-            image_file_id=image_file_id
-        )
+        broadcast_id = await create_broadcast_from_state(db_manager, data)
         
         if not broadcast_id:
-            await progress_message.edit_text("❌ Ошибка при создании рассылки в БД")
+            await callback.message.answer("❌ Ошибка при создании рассылки в БД")
             await state.clear()
             return
         
-        # Получаем пользователей для рассылки
-        users = await db_manager.get_users_by_segment(segment_key)
-        
-        # Запускаем рассылку
-        broadcast_manager = BroadcastManager(db_manager)
-        sent_count = 0
-        failed_count = 0
+        # Получатели заносятся в журнал доставки, по нему рассылка продолжится после перезапуска
+        users_count = await queue_broadcast(broadcast_id, segment_key, segment_expression)
+        if users_count is None:
+            # Без журнала рассылка никому не уйдет - черновик отменяем, чтобы его не запустили
+            await db_manager.set_broadcast_status(broadcast_id, 'cancelled')
+            await callback.message.answer(
+                "❌ Не удалось подготовить список получателей, рассылка не запущена.\n"
+                "Попробуйте создать ее еще раз позже"
+            )
+            await state.clear()
+            return
         
-        for user in users:
-            try:
-                success = await broadcast_manager.send_broadcast_message(
-                    bot=bot,
-                    user_id=user['user_id'],
-                    message_type=content_type,
-                    text=text,
-                    image_file_id=image_file_id
-                )
-                
-                if success:
-                    sent_count += 1
-                else:
-                    failed_count += 1
-                    
-                # Обновляем прогресс каждые 10 сообщений
-                if (sent_count + failed_count) % 10 == 0:
-                    try:
-                        await progress_message.edit_text(
-                            f"📤 <b>РАССЫЛКА В ПРОЦЕССЕ</b>\n\n"
-                            f"✅ Отправлено: {sent_count}\n"
-                            f"❌ Ошибок: {failed_count}\n"
-                            f"⏳ Осталось: {len(users) - sent_count - failed_count}",
-                            parse_mode="HTML"
-                        )
-                    except Exception as edit_error:
-                        logger.error(f"Ошибка редактирования progress_message: {edit_error}")
-                        # Продолжаем рассылку даже если не удалось обновить прогресс
-                        
-            except Exception as e:
-                logger.error(f"❌ Failed to send to {user['user_id']}: {e}")
-                failed_count += 1
-        
-        # Финальный отчет
-        report_text = (
-            f"✅ <b>РАССЫЛКА ЗАВЕРШЕНА</b>\n\n"
-            f"📊 <b>Итоги:</b>\n"
-            f"• ✅ Успешно: {sent_count}\n"
-            f"• ❌ Ошибок: {failed_count}\n"
-            f"• 📈 Эффективность: {sent_count/max(1, len(users))*100:.1f}%\n\n"
-            f"👥 <b>Аудитория:</b> {segment_name}\n"
-            f"🎨 <b>Тип:</b> {content_type}\n"
-            f"🆔 <b>ID рассылки:</b> {broadcast_id}"
+        # Вместо редактирования существующего сообщения, отправляем новое
+        progress_message = await callback.message.answer(
+            f"🚀 <b>ЗАПУСК РАССЫЛКИ</b>\n\n"
+            f"📤 Отправка {users_count} сообщений...\n"
+            f"⏳ Это может занять несколько минут",
+            parse_mode="HTML",
+            reply_markup=get_broadcast_control_keyboard(broadcast_id)
         )
-        
-        if content_type == "image":
-            report_text += f"\n🖼️ <b>Изображение:</b> {'✅' if image_file_id else '❌'}"
-        
-        # Обновляем статистику рассылки в БД
-        await db_manager.update_broadcast_stats(broadcast_id, sent_count)
-        
-        await progress_message.edit_text(report_text, parse_mode="HTML")
-        
-        # Логируем действие
-        await db_manager.add_user_action(
-            user_id=callback.from_user.id,
-            action_type='broadcast_completed',
-            action_data={
-                'broadcast_id': broadcast_id,
-                'segment': segment_key,
-                'sent_count': sent_count,
-                'failed_count': failed_count,
-                'content_type': content_type,
-                'has_image': bool(image_file_id)
-            }
+        await db_manager.set_broadcast_progress_message(
+            broadcast_id, progress_message.chat.id, progress_message.message_id
         )
         
-        logger.info(f"✅ Broadcast #{broadcast_id} completed: {sent_count} sent, {failed_count} failed")
+        # Рассылка идет в фоне, обработчик сразу освобождается
+        if not await start_broadcast_job(broadcast_id):
+            await progress_message.edit_text("❌ Не удалось запустить рассылку")
         
         await state.clear()
         
@@ -497,6 +454,112 @@ async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot
             logger.error(f"❌ Failed to send error message: {send_error}")
         await state.clear()
 
+@router.callback_query(BroadcastStates.confirming, F.data == "broadcast_schedule")
+async def ask_broadcast_schedule(callback: CallbackQuery, state: FSMContext):
+    """Запрос времени отложенной рассылки"""
+    await callback.message.answer(
+        "🕒 <b>Когда отправить рассылку?</b>\n\n"
+        f"Время ресторана сейчас: {format_restaurant_time(format_str='%d.%m %H:%M')}\n"
+        "Формат: <code>ЧЧ:ММ</code> или <code>ДД.ММ ЧЧ:ММ</code>\n\n"
+        "❌ Для отмены введите /cancel",
+        parse_mode="HTML"
+    )
+    await state.set_state(BroadcastStates.entering_schedule)
+    await callback.answer()
+
+@router.message(BroadcastStates.entering_schedule, F.text)
+async def process_broadcast_schedule(message: Message, state: FSMContext, db_manager: DatabaseManager):
+    """Создание запланированной рассылки: ее запустит планировщик в указанное время"""
+    try:
+        if message.text.startswith('/cancel'):
+            await message.answer("❌ Рассылка отменена")
+            await state.clear()
+            return
+        
+        scheduled_at = parse_schedule_time(message.text)
+        if scheduled_at is None or scheduled_at <= get_restaurant_time():
+            await message.answer(
+                "❌ Не удалось распознать время или оно уже прошло.\n"
+                "Формат: <code>ЧЧ:ММ</code> или <code>ДД.ММ ЧЧ:ММ</code>",
+                parse_mode="HTML"
+            )
+            return
+        
+        data = await state.get_data()
+        broadcast_id = await create_broadcast_from_state(db_manager, data, scheduled_at)
+        if not broadcast_id:
+            await message.answer("❌ Ошибка при создании рассылки в БД")
+            await state.clear()
+            return
+        
+        scheduled_text = format_restaurant_time(scheduled_at, '%d.%m.%Y %H:%M')
+        scheduled_message = await message.answer(
+            f"🕒 <b>РАССЫЛКА ЗАПЛАНИРОВАНА</b>\n\n"
+            f"📅 <b>Отправка:</b> {scheduled_text}\n"
+            f"👥 <b>Аудитория:</b> {data.get('segment_name', 'Неизвестно')}\n"
+            f"📊 <b>Пользователей сейчас:</b> {data.get('users_count', 0)}\n"
+            f"🆔 <b>ID рассылки:</b> {broadcast_id}\n\n"
+            f"<i>Состав аудитории определится в момент отправки</i>",
+            parse_mode="HTML",
+            reply_markup=get_scheduled_broadcast_keyboard(broadcast_id)
+        )
+        # В этом сообщении будет показан прогресс, когда рассылка начнется
+        await db_manager.set_broadcast_progress_message(
+            broadcast_id, scheduled_message.chat.id, scheduled_message.message_id
+        )
+        
+        await db_manager.add_user_action(
+            user_id=message.from_user.id,
+            action_type='broadcast_scheduled',
+            action_data={'broadcast_id': broadcast_id, 'scheduled_at': scheduled_at.isoformat()}
+        )
+        logger.info(f"🕒 Broadcast #{broadcast_id} scheduled for {scheduled_at.isoformat()}")
+        await state.clear()
+        
+    except Exception as e:
+        logger.error(f"❌ Error scheduling broadcast: {e}")
+        await message.answer("❌ Ошибка при планировании рассылки")
+        await state.clear()
+
+@router.callback_query(F.data.startswith("broadcast_pause_"))
+async def pause_broadcast_callback(callback: CallbackQuery, db_manager: DatabaseManager):
+    """Пауза запущенной рассылки"""
+    if not await db_manager.is_admin(callback.from_user.id):
+        await callback.answer("❌ Эта команда доступна только администраторам.")
+        return
+    
+    broadcast_id = int(callback.data.split("_")[2])
+    if await pause_broadcast(broadcast_id):
+        await callback.answer("⏸ Рассылка приостановлена")
+    else:
+        await callback.answer("❌ Рассылка не выполняется", show_alert=True)
+
+@router.callback_query(F.data.startswith("broadcast_resume_"))
+async def resume_broadcast_callback(callback: CallbackQuery, db_manager: DatabaseManager):
+    """Продолжение рассылки после паузы"""
+    if not await db_manager.is_admin(callback.from_user.id):
+        await callback.answer("❌ Эта команда доступна только администраторам.")
+        return
+    
+    broadcast_id = int(callback.data.split("_")[2])
+    if await resume_broadcast(broadcast_id):
+        await callback.answer("▶️ Рассылка продолжена")
+    else:
+        await callback.answer("❌ Рассылку нельзя продолжить", show_alert=True)
+
+@router.callback_query(F.data.startswith("broadcast_abort_"))
+async def abort_broadcast_callback(callback: CallbackQuery, db_manager: DatabaseManager):
+    """Отмена запущенной рассылки"""
+    if not await db_manager.is_admin(callback.from_user.id):
+        await callback.answer("❌ Эта команда доступна только администраторам.")
+        return
+    
+    broadcast_id = int(callback.data.split("_")[2])
+    if await cancel_broadcast_job(broadcast_id):
+        await callback.answer("⛔ Рассылка отменена")
+    else:
+        await callback.answer("❌ Рассылка уже завершена", show_alert=True)
+
 @router.callback_query(F.data == "broadcast_back_to_segments")
 async def back_to_segments(callback: CallbackQuery, state: FSMContext, db_manager: DatabaseManager, l10n: FluentLocalization):
     """Возврат к выбору сегмента"""
@@ -518,13 +581,16 @@ async def back_to_segments(callback: CallbackQuery, state: FSMContext, db_manage
         # Создаем клавиатуру для выбора сегмента
         builder = InlineKeyboardBuilder()
         
+        # Размеры всех сегментов одним запросом
+        segment_counts = await db_manager.get_segment_counts()
         for segment_key, segment_info in broadcast_manager.segments.items():
-            users_count = await broadcast_manager.get_segment_users_count(segment_key)
+            users_count = segment_counts.get(segment_key, 0)
             builder.button(
                 text=f"{segment_info['name']} ({users_count})",
                 callback_data=f"broadcast_segment_{segment_key}"
             )
         
+        builder.button(text="🧩 Свой сегмент", callback_data="broadcast_custom_segment")
         builder.button(text="❌ Отмена", callback_data="broadcast_cancel")
         builder.adjust(1)
         
@@ -578,6 +644,8 @@ async def cancel_broadcast(callback: CallbackQuery, state: FSMContext):
 # Обработка команды отмены
 @router.message(BroadcastStates.entering_text, F.text == "/cancel")
 @router.message(BroadcastStates.entering_image, F.text == "/cancel")
+@router.message(BroadcastStates.entering_segment, F.text == "/cancel")
+@router.message(BroadcastStates.entering_schedule, F.text == "/cancel")
 async def cancel_broadcast_command(message: Message, state: FSMContext):
     """Отмена рассылки по команде"""
     await message.answer("❌ Рассылка отменена")
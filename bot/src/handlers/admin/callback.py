@@ -4,6 +4,8 @@ import logging
 import json
 from src.utils.time_utils import format_restaurant_time
 from src.utils.config import settings
+from src.utils.telegram_sender import dispatch, fan_out, PRIORITY_STAFF_CALL
+from src.utils.staff_call_escalation import cancel_call_escalation
 from functools import wraps
 
 from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -66,54 +68,43 @@ async def notify_all_staff_call_accepted(bot, staff_name: str, staff_username: s
             f"<i>Официант уже направляется к столу</i>"
         )
         
-        # Обновляем сообщения у всех официантов
-        update_count = 0
+        # Обновляем сообщения у всех официантов параллельно
+        messages = {}
         for staff_id_str, message_id in original_message_ids.items():
-            try:
-                # Преобразуем строковый staff_id в int для сравнения
-                staff_id_int = int(staff_id_str)
-                
-                # Проверяем, является ли пользователь еще персоналом
-                if db_manager and staff_id_int not in staff_ids:
-                    logger.info(f"⚠️ Пользователь {staff_id_int} больше не в персонале, пропускаем")
-                    continue
-                
-                logger.info(f"🔄 Обновление сообщения для staff_id: {staff_id_str}->{staff_id_int}, message_id: {message_id}")
-                logger.info(f"🔍 Сравнение: {staff_id_int} == {accepted_by_staff_id} -> {staff_id_int == accepted_by_staff_id}")
-                
-                # Если это тот официант, который принял вызов - даем кнопку завершения
-                if staff_id_int == accepted_by_staff_id:
-                    logger.info(f"🎯 Это принявший официант, добавляем кнопку завершения")
-                    keyboard = InlineKeyboardBuilder()
-                    keyboard.button(text="✅ Завершить вызов", callback_data=f"complete_call_{call_id}")
-                    
-                    updated_text = base_text + "\n\n<b>Нажмите 'Завершить' после обслуживания стола</b>"
-                    
-                    await bot.edit_message_text(
-                        chat_id=staff_id_int,
-                        message_id=message_id,
-                        text=updated_text,
-                        reply_markup=keyboard.as_markup(),
-                        parse_mode="HTML"
-                    )
-                    logger.info(f"✅ Добавлена кнопку завершения для принявшего официанта")
-                else:
-                    # Для остальных - просто информация (без кнопок)
-                    logger.info(f"📝 Это другой официант, убираем кнопки")
-                    await bot.edit_message_text(
-                        chat_id=staff_id_int,
-                        message_id=message_id,
-                        text=base_text,
-                        reply_markup=None,
-                        parse_mode="HTML"
-                    )
-                
-                update_count += 1
-                
-            except Exception as e:
-                logger.error(f"❌ Ошибка при обновлении сообщения для staff {staff_id_str}: {e}")
+            # Преобразуем строковый staff_id в int для сравнения
+            staff_id_int = int(staff_id_str)
+            
+            # Проверяем, является ли пользователь еще персоналом
+            if db_manager and staff_id_int not in staff_ids:
+                logger.info(f"⚠️ Пользователь {staff_id_int} больше не в персонале, пропускаем")
+                continue
+            messages[staff_id_int] = message_id
+        
+        # Принявшему официанту - кнопка завершения, остальным - просто информация (без кнопок)
+        complete_keyboard = InlineKeyboardBuilder()
+        complete_keyboard.button(text="✅ Завершить вызов", callback_data=f"complete_call_{call_id}")
+        accepted_text = base_text + "\n\n<b>Нажмите 'Завершить' после обслуживания стола</b>"
+        
+        async def update_message(staff_id: int):
+            is_acceptor = staff_id == accepted_by_staff_id
+            return await dispatch(
+                staff_id,
+                lambda: bot.edit_message_text(
+                    chat_id=staff_id,
+                    message_id=messages[staff_id],
+                    text=accepted_text if is_acceptor else base_text,
+                    reply_markup=complete_keyboard.as_markup() if is_acceptor else None,
+                    parse_mode="HTML"
+                ),
+                PRIORITY_STAFF_CALL
+            )
+        
+        report = await fan_out(messages, update_message, settings.STAFF_NOTIFY_CONCURRENCY)
+        for staff_id, error in report.errors.items():
+            logger.error(f"❌ Ошибка при обновлении сообщения для staff {staff_id}: {error}")
         
-        logger.info(f"✅ Успешно обновлено {update_count} сообщений из {len(original_message_ids)}")
+        logger.info(f"✅ Успешно обновлено {len(report.results)} сообщений из {len(original_message_ids)} "
+                    f"за {report.duration:.2f} сек (последнее через {report.last_latency:.2f} сек)")
         
     except Exception as e:
         logger.error(f"❌ Критическая ошибка в notify_all_staff_call_accepted: {e}", exc_info=True)
@@ -166,6 +157,7 @@ async def accept_staff_call(callback: CallbackQuery, db_manager=None, settings=N
             return
         
         logger.info(f"✅ Вызов #{call_id} принят в БД")
+        cancel_call_escalation(call_id)  # Повторные уведомления больше не нужны
         
         # Получаем message_ids из БД
         message_ids = {}
@@ -288,6 +280,7 @@ async def complete_staff_call(callback: CallbackQuery, db_manager=None):
         # Завершаем вызов
         success = await db_manager.complete_staff_call(call_id)
         if success:
+            cancel_call_escalation(call_id)
             # Обновляем сообщение у официанта
             await callback.message.edit_text(
                 f"✅ Вызов стола #{call['table_number']} завершен",
@@ -311,6 +304,7 @@ async def cancel_staff_call(callback: CallbackQuery, db_manager = None):
         
         success = await db_manager.cancel_staff_call(call_id)
         if success:
+            cancel_call_escalation(call_id)
             await callback.answer("✅ Вызов отменен", show_alert=True)
         else:
             await callback.answer("❌ Не удалось отменить вызов", show_alert=True)
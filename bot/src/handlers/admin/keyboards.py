@@ -52,9 +52,10 @@ async def get_staff_management_keyboard():
     builder.button(text="➕ Добавить официанта")
     builder.button(text="➖ Удалить официанта")
     builder.button(text="📋 Список официантов")
+    builder.button(text="🗺 Зона официанта")
     builder.button(text="🔙 Назад в настройки")
     
-    builder.adjust(2, 1, 1)
+    builder.adjust(2, 2, 1)
     return builder.as_markup(resize_keyboard=True)
 
 async def get_menu_management_keyboard():
@@ -151,6 +151,20 @@ async def target_segments(message: Message, db_manager = None):
 👨💻 Мужчины-фрилансеры: {segments.get('male_freelancers', 0)}
     """
     
+    # Пользователи, исключенные из рассылок по ошибкам доставки
+    pruning = await db_manager.get_audience_pruning_stats()
+    if pruning:
+        pruned_sends = pruning.get('pruned_sends', 0)
+        saved_minutes = pruned_sends / settings.TELEGRAM_GLOBAL_RATE_LIMIT / 60
+        text += f"""
+<b>✂️ Очистка аудитории:</b>
+🚫 Недоступны: {pruning.get('unreachable_total', 0)}
+   • заблокировали бота: {pruning.get('blocked_count', 0)}
+   • чат не найден: {pruning.get('chat_not_found_count', 0)}
+🆕 Отмечено за неделю: {pruning.get('marked_last_week', 0)}
+📉 Сэкономлено отправок: {pruned_sends} в {pruning.get('pruned_broadcasts', 0)} рассылках (~{saved_minutes:.1f} мин)
+"""
+    
     await message.answer(text, parse_mode="HTML")
 
 @router.message(F.text == "📋 Бронирования")
@@ -214,6 +228,7 @@ async def staff_calls_analytics(message: Message, db_manager = None):
 
 <b>Эффективность:</b>
 • Среднее время: {avg_time:.1f} мин.
+• Уведомление персонала: в среднем {float(stats.get('avg_notify_delay_sec') or 0):.1f} сек., макс. сегодня {float(stats.get('max_notify_delay_today_sec') or 0):.1f} сек.
 • Активный стол: #{stats.get('most_active_table', 'Нет данных')}
 • Вызовы сегодня: {stats.get('today_calls', 0)}
     """
@@ -270,10 +285,10 @@ async def daily_activity(message: Message, db_manager = None):
     await message.answer(text, parse_mode="HTML")
 
 @router.message(F.text == "🔙 В главное меню")
-async def back_to_main_menu(message: Message, l10n: FluentLocalization, db_manager = None):
+async def back_to_main_menu(message: Message, l10n: FluentLocalization, db_manager = None, user_context = None):
     """Возврат в главное меню"""
     from src.handlers.user.message import show_main_menu
-    await show_main_menu(message, l10n, db_manager)
+    await show_main_menu(message, l10n, db_manager, user_context)
 
 
 @router.message(F.text == "📋 Брони сегодня")
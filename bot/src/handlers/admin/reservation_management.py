@@ -10,6 +10,7 @@ from src.handlers.user.reservation import notify_user_about_reservation_status
 from datetime import date, datetime, time
 from src.utils.time_utils import format_restaurant_time, parse_reservation_datetime
 from src.utils.logger import get_logger
+from src.utils.reminders import reschedule_reservation_reminders, unschedule_reservation_reminders
 
 router = Router()
 logger = get_logger(__name__)
@@ -73,6 +74,8 @@ async def confirm_reservation_admin(callback: CallbackQuery, db_manager: Databas
             # Получаем обновленные данные брони
             reservation = await db_manager.get_reservation_by_id(reservation_id)
             if reservation:
+                reschedule_reservation_reminders(reservation)
+                
                 # Уведомляем пользователя - ПЕРЕДАЕМ ОБЪЕКТЫ, А НЕ СТРОКИ
                 await notify_user_about_reservation_status(
                     bot, reservation['user_id'], 
@@ -118,6 +121,8 @@ async def reject_reservation_admin(callback: CallbackQuery, db_manager: Database
         success = await db_manager.update_reservation_status(reservation_id, "cancelled")
         
         if success:
+            unschedule_reservation_reminders(reservation_id)
+            
             # Получаем обновленные данные брони
             reservation = await db_manager.get_reservation_by_id(reservation_id)
             if reservation:
@@ -218,6 +223,9 @@ def format_reservation_text(reservation: dict, status_prefix: str = "") -> str:
 ⏰ Создана: {formatted_created_at}
 """
     
+    if reservation.get('table_numbers'):
+        base_text += f"🪑 Столы: {', '.join(map(str, reservation['table_numbers']))}\n"
+    
     if reservation.get('notes'):
         base_text += f"📝 Заметки: {reservation['notes']}\n"
     
@@ -136,6 +136,7 @@ async def list_staff(message: Message, db_manager: DatabaseManager):
             
             text += f"{i}. {staff_member['full_name']} ({username})\n"
             text += f"   🆔 ID: {staff_member['user_id']}\n"
+            text += f"   🗺 Зона: {staff_member.get('zone') or 'любая'}\n"
             text += f"   📅 Добавлен: {created_at}\n\n"
         
         await message.answer(text, parse_mode="HTML")
@@ -214,7 +215,7 @@ async def back_to_settings(message: Message, l10n: FluentLocalization, db_manage
     await settings_menu(message, l10n, db_manager)
 
 @router.message(F.text == "🔙 В главное меню")
-async def back_to_main_menu_from_settings(message: Message, l10n: FluentLocalization, db_manager: DatabaseManager):
+async def back_to_main_menu_from_settings(message: Message, l10n: FluentLocalization, db_manager: DatabaseManager, user_context = None):
     """Возврат в главное меню из настроек"""
     from src.handlers.user.message import show_main_menu
-    await show_main_menu(message, l10n, db_manager)
\ No newline at end of file
+    await show_main_menu(message, l10n, db_manager, user_context)
\ No newline at end of file
@@ -48,7 +48,8 @@ async def cancel_operation(callback: CallbackQuery, state: FSMContext):
     
     elif current_state in [
         SettingsStates.waiting_for_staff_id,
-        SettingsStates.waiting_for_remove_staff_id
+        SettingsStates.waiting_for_remove_staff_id,
+        SettingsStates.waiting_for_staff_zone
     ]:
         # Возврат в меню управления официантами
         await callback.message.edit_text(
@@ -330,6 +331,73 @@ async def remove_staff_finish(message: Message, state: FSMContext, db_manager: D
         )
     await state.clear()
 
+@router.message(F.text == "🗺 Зона официанта")
+async def staff_zone_start(message: Message, state: FSMContext, db_manager: DatabaseManager):
+    """Начало назначения зоны зала официанту (для маршрутизации вызовов)"""
+    if not await db_manager.is_admin(message.from_user.id):
+        await message.answer("❌ Недостаточно прав.")
+        return
+
+    staff = await db_manager.get_staff()
+    if not staff:
+        await message.answer("❌ Нет официантов.")
+        return
+
+    zones = await db_manager.get_table_zones()
+
+    text = "🗺 <b>Зоны официантов</b>\n\n"
+    for staff_member in staff:
+        text += f"• ID: {staff_member['user_id']} - {staff_member['full_name']}: {staff_member.get('zone') or 'любая'}\n"
+
+    text += (
+        f"\nЗоны зала: {', '.join(zones) if zones else 'не заданы'}\n\n"
+        "Введите ID официанта и зону через пробел, например <code>123456789 hall</code>.\n"
+        "Чтобы снять зону, укажите <code>-</code>\n"
+        "💡 <i>Вызовы со столов зоны сначала получают ее официанты</i>"
+    )
+
+    await message.answer(
+        text,
+        parse_mode="HTML",
+        reply_markup=get_cancel_keyboard()
+    )
+    await state.set_state(SettingsStates.waiting_for_staff_zone)
+
+@router.message(SettingsStates.waiting_for_staff_zone, F.text)
+async def staff_zone_finish(message: Message, state: FSMContext, db_manager: DatabaseManager):
+    """Завершение назначения зоны официанту"""
+    parts = message.text.split()
+    if len(parts) != 2 or not parts[0].isdigit():
+        await message.answer(
+            "❌ Неверный формат. Введите ID и зону через пробел.",
+            reply_markup=get_cancel_keyboard()
+        )
+        return
+
+    user_id = int(parts[0])
+    zone = None if parts[1] == "-" else parts[1]
+
+    zones = await db_manager.get_table_zones()
+    if zone and zones and zone not in zones:
+        await message.answer(
+            f"❌ Нет такой зоны. Доступные зоны: {', '.join(zones)}",
+            reply_markup=get_cancel_keyboard()
+        )
+        return
+
+    success = await db_manager.set_staff_zone(user_id, zone)
+    if success:
+        await message.answer(
+            f"✅ Официанту {user_id} назначена зона: {zone or 'любая'}.",
+            reply_markup=await kb.get_staff_management_keyboard()
+        )
+    else:
+        await message.answer(
+            f"❌ Официант {user_id} не найден.",
+            reply_markup=await kb.get_staff_management_keyboard()
+        )
+    await state.clear()
+
 # ==================== MENU MANAGEMENT ====================
 
 @router.message(F.text == "🍕 Добавить блюдо")
@@ -11,6 +11,9 @@ from src.states.greetings import Greeting
 from src.utils.logger import get_logger
 
 from src.utils.time_utils import format_restaurant_time
+from src.utils.telegram_sender import dispatch_message, fan_out, PRIORITY_STAFF_CALL
+from src.utils.staff_call_escalation import schedule_call_escalation, cancel_call_escalation
+from src.utils.staff_call_routing import route_staff_call
 
 from datetime import datetime
 
@@ -53,6 +56,10 @@ async def confirm_staff_call(callback: CallbackQuery, state: FSMContext, l10n: F
             call_id=call_id,
             db_manager=db_manager
         )
+        
+        # Если никто не примет вызов - остальной персонал, повторное уведомление, затем администраторам.
+        # Таймер ставится и без доставленных сообщений: следующие ступени отправят вызов заново
+        schedule_call_escalation(call_id)
     
     text = l10n.format_value("staff-called-message")
     await callback.message.edit_text(text=text)
@@ -72,6 +79,7 @@ async def cancel_staff_call(callback: CallbackQuery, state: FSMContext, l10n: Fl
     if db_manager and call_id:
         # Добавляем метод для отмены вызова
         await db_manager.cancel_staff_call(call_id)
+        cancel_call_escalation(call_id)
         await db_manager.add_user_action(
             user_id=callback.from_user.id,
             action_type='staff_call_cancelled',
@@ -128,7 +136,7 @@ async def confirm_sex_and_ask_major(callback: CallbackQuery, state: FSMContext,
     "user_major_hire", 
     "user_major_frilans"
 ]))
-async def confirm_major_and_send_main_menu(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization, db_manager = None):
+async def confirm_major_and_send_main_menu(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization, db_manager = None, user_context = None):
     await callback.answer()
 
     # Сохраняем данные о профессии пользователя
@@ -182,7 +190,7 @@ async def confirm_major_and_send_main_menu(callback: CallbackQuery, state: FSMCo
 
     # Открываем главное меню (БЕЗ установки состояния)
     welcome_text = l10n.format_value("main-menu-text")
-    keyboard = await kb.get_main_menu_keyboard(l10n, user_id=callback.from_user.id)
+    keyboard = await kb.get_main_menu_keyboard(l10n, user_id=callback.from_user.id, user_context=user_context)
     await callback.message.answer(welcome_text, reply_markup=keyboard)
     
     # Очищаем состояние после регистрации
@@ -216,55 +224,91 @@ async def get_all_staff_users(db_manager):
         return []
 
 async def notify_staff_about_call(bot, table_number: int, user_info: str, call_id: int, db_manager=None):
-    """Уведомление всего персонала (админы + стафф) о новом вызове с HTML разметкой"""
+    """
+    Уведомление о новом вызове с HTML разметкой: лучшим официантам по зоне стола и загрузке,
+    а если маршрутизация выключена, официантов нет или ни одному из выбранных не удалось
+    отправить - всему персоналу (админы + стафф). Остальной персонал получает вызов при эскалации
+    """
     try:
         from src.utils.config import settings
         
-        message_ids = {}
-        
         keyboard = InlineKeyboardBuilder()
         keyboard.button(text="✅ Принять вызов", callback_data=f"accept_call_{call_id}")
         
         current_time = format_restaurant_time()
         
-        message_text = (
-            f"🆘 <b>НОВЫЙ ВЫЗОВ ПЕРСОНАЛА</b>\n\n"
-            f"🪑 <b>Стол:</b> #{table_number}\n"
-            f"👤 <b>Клиент:</b> {user_info}\n"
-            f"⏰ <b>Время:</b> {current_time}\n"
-            f"🆔 <b>ID вызова:</b> {call_id}\n\n"
-            f"<i>Кто первый успеет - того и клиент!</i>"
-        )
+        def render(footer: str) -> str:
+            return (
+                f"🆘 <b>НОВЫЙ ВЫЗОВ ПЕРСОНАЛА</b>\n\n"
+                f"🪑 <b>Стол:</b> #{table_number}\n"
+                f"👤 <b>Клиент:</b> {user_info}\n"
+                f"⏰ <b>Время:</b> {current_time}\n"
+                f"🆔 <b>ID вызова:</b> {call_id}\n\n"
+                f"<i>{footer}</i>"
+            )
+        
+        # Выбранным официантам - что вызов адресован им, всему персоналу - кто первый успеет
+        routed_text = render("Вызов направлен вам - пожалуйста, примите его. "
+                             "Если не ответите, его получит остальной персонал")
+        broadcast_text = render("Кто первый успеет - того и клиент!")
         
         # 🔥 ИСПРАВЛЕНИЕ: Получаем актуальный список персонала из БД, а не из .env
+        routed = False
         if db_manager:
-            staff_ids = await get_all_staff_users(db_manager)
+            staff_ids = await route_staff_call(db_manager, table_number)
+            routed = bool(staff_ids)
+            if not routed:
+                staff_ids = await get_all_staff_users(db_manager)
             logger.info(f"👥 Актуальный ID персонала из БД для уведомления: {staff_ids}")
         else:
             # Fallback: используем статический список если db_manager не доступен
             staff_ids = [int(staff_id.strip()) for staff_id in settings.STAFF_IDS.split(",")]
             logger.info(f"👥 Используем статический ID персонала из settings: {staff_ids}")
         
-        # Отправляем ВСЕМУ персоналу (админы + стафф)
-        for staff_id in staff_ids:
-            try:
-                logger.info(f"📤 Отправка сообщения персоналу {staff_id}")
-                message = await bot.send_message(
-                    chat_id=staff_id,
-                    text=message_text,
-                    reply_markup=keyboard.as_markup(),
+        # Отправляем выбранному персоналу параллельно
+        markup = keyboard.as_markup()
+        
+        def notifier(message_text: str):
+            async def notify(staff_id: int):
+                # Полоса вызовов персонала: уходит раньше заказов, напоминаний и рассылок
+                return await dispatch_message(
+                    bot, staff_id, message_text, PRIORITY_STAFF_CALL,
+                    reply_markup=markup,
                     parse_mode="HTML"
                 )
-                message_ids[staff_id] = message.message_id
-                logger.info(f"✅ Сообщение отправлено персоналу {staff_id}, message_id: {message.message_id}")
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки персоналу {staff_id}: {e}")
+            return notify
+        
+        report = await fan_out(
+            staff_ids, notifier(routed_text if routed else broadcast_text), settings.STAFF_NOTIFY_CONCURRENCY
+        )
+        for staff_id, error in report.errors.items():
+            logger.error(f"❌ Ошибка отправки персоналу {staff_id}: {error}")
+        
+        # Ни один из выбранных официантов не получил вызов (заблокировал бота, чат удален) -
+        # не ждем эскалации, сразу уведомляем остальной персонал
+        if routed and not report.results:
+            staff_ids = [staff_id for staff_id in await get_all_staff_users(db_manager) if staff_id not in report.errors]
+            logger.warning(f"⚠️ Вызов #{call_id}: выбранные официанты недоступны, уведомляем весь персонал")
+            fallback_report = await fan_out(staff_ids, notifier(broadcast_text), settings.STAFF_NOTIFY_CONCURRENCY)
+            for staff_id, error in fallback_report.errors.items():
+                logger.error(f"❌ Ошибка отправки персоналу {staff_id}: {error}")
+            report.results.update(fallback_report.results)
+            # Задержка считается от начала первой отправки
+            report.latencies.update({
+                staff_id: report.duration + latency for staff_id, latency in fallback_report.latencies.items()
+            })
+        
+        message_ids = {staff_id: message.message_id for staff_id, message in report.results.items()}
         
-        logger.info(f"💾 Сохранение message_ids в БД: {message_ids}")
+        logger.info(f"✅ Вызов #{call_id}: уведомлено {len(message_ids)} из {len(staff_ids)}, "
+                    f"последний через {report.last_latency:.2f} сек")
         
-        # Сохраняем время вызова и информацию о клиенте в БД
+        # Сохраняем message_ids и задержку уведомления каждого сотрудника (мс)
         if db_manager:
-            success = await db_manager.update_call_message_ids(call_id, message_ids)
+            notify_latencies = {
+                staff_id: round(latency * 1000) for staff_id, latency in report.latencies.items()
+            }
+            success = await db_manager.update_call_message_ids(call_id, message_ids, notify_latencies)
             if success:
                 logger.info(f"✅ Message_ids сохранены в БД для вызова #{call_id}")
             else:
@@ -11,6 +11,7 @@ import src.handlers.user.keyboards as kb
 from src.utils.rate_limiter import rate_limit
 from src.handlers.user.message import show_main_menu
 from src.utils.config import settings
+from src.utils.telegram_sender import dispatch_message, dispatch_photo, PRIORITY_ORDER
 from src.states.payment import PaymentStates
 
 router = Router()
@@ -59,13 +60,13 @@ async def back_to_categories_from_menu(message: Message, state: FSMContext, l10n
     await message.answer("Выберите категорию:", reply_markup=await kb.get_delivery_categories_kb(l10n))
 
 @router.message(F.text == "🔙 Назад")
-async def back_handler(message: Message, state: FSMContext, l10n: FluentLocalization, db_manager=None):
+async def back_handler(message: Message, state: FSMContext, l10n: FluentLocalization, db_manager=None, user_context=None):
     """Обработка кнопки Назад"""
     current_state = await state.get_state()
     
     if current_state == DeliveryStates.choosing_category:
         await state.clear()
-        await show_main_menu(message, l10n, db_manager)
+        await show_main_menu(message, l10n, db_manager, user_context)
     elif current_state == DeliveryStates.viewing_menu:
         await state.set_state(DeliveryStates.choosing_category)
         await message.answer("Выберите категорию:", reply_markup=await kb.get_delivery_categories_kb(l10n))
@@ -76,7 +77,7 @@ async def back_handler(message: Message, state: FSMContext, l10n: FluentLocaliza
         await message.answer(f"Возвращаемся к {current_category_name}", reply_markup=await kb.get_delivery_menu_kb(l10n))
     else:
         await state.clear()
-        await show_main_menu(message, l10n, db_manager)
+        await show_main_menu(message, l10n, db_manager, user_context)
 
 @router.message(DeliveryStates.choosing_category, F.text.in_(["🍳 ЗАВТРАКИ", "🍲 ГОРЯЧЕЕ", "☕️ ГОРЯЧИЕ НАПИТКИ", "🍸 ХОЛОДНЫЕ НАПИТКИ", "🍰 ДЕСЕРТЫ"]))
 async def choose_category(message: Message, state: FSMContext, l10n: FluentLocalization, db_manager=None):
@@ -95,27 +96,16 @@ async def choose_category(message: Message, state: FSMContext, l10n: FluentLocal
             await message.answer("❌ Пожалуйста, выберите категорию из списка")
             return
         
-        menu_items = await db_manager.get_delivery_menu(category_key) if db_manager else []
+        # Текст категории берется из каталога в памяти, без запроса к БД
+        catalog = db_manager.menu_catalog if db_manager else None
+        text = await catalog.get_category_text(category_key, message.text) if catalog else None
         
-        if not menu_items:
+        if not text:
             await message.answer("😔 В этой категории пока нет блюд")
             return
         
         await state.update_data(current_category=category_key, current_category_name=message.text)
         
-        text = f"<b>{message.text}</b>\n\n"
-        
-        for item in menu_items:
-            text += f"<b>{item['id']}. {item['name']}</b> - {item['price']}₽\n"
-            if item.get('description'):
-                text += f"<i>{item['description']}</i>\n"
-            text += "\n"
-        
-        text += "💡 <b>Как добавить в корзину:</b>\n"
-        text += "• Напишите номер товара (например: <code>1</code>)\n"
-        text += "• Или <code>добавить [номер]</code> (например: <code>добавить 1</code>)\n\n"
-        text += "🛒 Нажмите 'Корзина' чтобы посмотреть ваш заказ"
-        
         await state.set_state(DeliveryStates.viewing_menu)
         await message.answer(text, parse_mode="HTML", reply_markup=await kb.get_delivery_menu_kb(l10n))
         
@@ -154,11 +144,10 @@ async def add_to_cart_flexible(message: Message, state: FSMContext, l10n: Fluent
         
         data = await state.get_data()
         current_category = data.get('current_category', 'pizza')
-        menu_items = await db_manager.get_delivery_menu(current_category) if db_manager else []
-        
-        item = next((item for item in menu_items if item['id'] == item_id), None)
+        catalog = db_manager.menu_catalog if db_manager else None
+        item = await catalog.get_item(item_id) if catalog else None
         
-        if not item:
+        if not item or item['category'] != current_category:
             await message.answer("❌ Товар с таким номером не найден. Используйте номер из списка.")
             return
         
@@ -1321,14 +1310,13 @@ async def notify_admins_about_delivery_order(
                                 # Добавим короткие метаданные, если есть
                                 if r.get('note'):
                                     caption += f"{r.get('note')}\n"
-                                await bot.send_photo(chat_id=admin_id, photo=file_id, caption=caption)
+                                await dispatch_photo(bot, admin_id, file_id, PRIORITY_ORDER, caption=caption)
                         except Exception as e:
                             logger.debug(f"notify_admins_about_delivery_order: failed to send receipt to admin {admin_id}: {e}")
 
                 # Основное сообщение с кнопками
-                await bot.send_message(
-                    chat_id=admin_id,
-                    text=message_text,
+                await dispatch_message(
+                    bot, admin_id, message_text, PRIORITY_ORDER,
                     reply_markup=kb.as_markup(),
                     parse_mode="HTML"
                 )
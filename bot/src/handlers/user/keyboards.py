@@ -43,7 +43,7 @@ async def get_user_major_kb(l10n: FluentLocalization):
 
     return kb.as_markup()
 
-async def get_main_menu_keyboard(l10n: FluentLocalization, user_id: int, db_manager=None):
+async def get_main_menu_keyboard(l10n: FluentLocalization, user_id: int, db_manager=None, user_context=None):
     """Главное меню с кнопками (с проверкой прав через базу данных)"""
     builder = ReplyKeyboardBuilder()
     
@@ -51,7 +51,11 @@ async def get_main_menu_keyboard(l10n: FluentLocalization, user_id: int, db_mana
     is_admin = False
     is_staff = False
     
-    if db_manager:
+    if user_context:
+        # Права уже загружены middleware для этого апдейта
+        is_admin = user_context.is_admin
+        is_staff = user_context.is_staff
+    elif db_manager:
         try:
             is_admin = await db_manager.is_admin(user_id)
             is_staff = await db_manager.is_staff(user_id)
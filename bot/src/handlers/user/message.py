@@ -10,6 +10,7 @@ from aiogram.fsm.state import any_state
 import src.handlers.user.keyboards as kb
 from src.states.call_stuff import CallStaff
 from src.states.greetings import Greeting
+from src.middlewares.user_context_middleware import UserContext
 from src.utils.logger import get_logger
 from src.utils.rate_limiter import staff_call_limit, reservation_limit, menu_view_limit
 
@@ -97,11 +98,11 @@ async def start_handler(message: Message, state: FSMContext, l10n: FluentLocaliz
         raise
 
 @router.message(Command("menu"))
-async def open_main_menu_from_command(message: Message, l10n: FluentLocalization, db_manager = None):
-    await show_main_menu(message, l10n, db_manager)
+async def open_main_menu_from_command(message: Message, l10n: FluentLocalization, db_manager = None, user_context: UserContext = None):
+    await show_main_menu(message, l10n, db_manager, user_context)
 
 # Общая функция для показа главного меню
-async def show_main_menu(message: Message, l10n: FluentLocalization, db_manager=None):
+async def show_main_menu(message: Message, l10n: FluentLocalization, db_manager=None, user_context: UserContext = None):
     user = message.from_user
     
     try:
@@ -113,15 +114,20 @@ async def show_main_menu(message: Message, l10n: FluentLocalization, db_manager=
         # Проверяем права через базу данных, если db_manager доступен
         if db_manager:
             # Гарантируем существование пользователя в базе
-            await db_manager.ensure_user_exists(
-                user_id=user.id,
-                username=user.username,
-                full_name=user.full_name
-            )
+            if not (user_context and user_context.exists):
+                await db_manager.ensure_user_exists(
+                    user_id=user.id,
+                    username=user.username,
+                    full_name=user.full_name
+                )
             
-            # Получаем права из базы данных
-            is_admin = await db_manager.is_admin(user.id)
-            is_staff = await db_manager.is_staff(user.id)
+            # Получаем права (из контекста апдейта, если он загружен)
+            if user_context:
+                is_admin = user_context.is_admin
+                is_staff = user_context.is_staff
+            else:
+                is_admin = await db_manager.is_admin(user.id)
+                is_staff = await db_manager.is_staff(user.id)
             
             # Логируем действие
             await db_manager.add_user_action(
@@ -151,7 +157,8 @@ async def show_main_menu(message: Message, l10n: FluentLocalization, db_manager=
         keyboard = await kb.get_main_menu_keyboard(
             l10n=l10n,
             user_id=user.id,
-            db_manager=db_manager
+            db_manager=db_manager,
+            user_context=user_context
         )
         
         welcome_text = l10n.format_value("main-menu-text")
@@ -385,8 +392,8 @@ async def desserts(message: Message, l10n: FluentLocalization, db_manager = None
 
 #=====Кнопка "Назад" в главное меню
 @router.message(F.text == "🔙 Назад")
-async def back_to_main_menu(message: Message, l10n: FluentLocalization, db_manager = None):
-    await show_main_menu(message, l10n, db_manager)
+async def back_to_main_menu(message: Message, l10n: FluentLocalization, db_manager = None, user_context: UserContext = None):
+    await show_main_menu(message, l10n, db_manager, user_context)
 
 ############################################################################# - Меню (конец)
 
@@ -15,6 +15,8 @@ from src.utils.logger import get_logger
 from src.utils.rate_limiter import rate_limit, reservation_limit
 import src.handlers.user.keyboards as kb
 from src.utils.time_utils import format_restaurant_time, parse_reservation_datetime
+from src.utils.reminders import unschedule_reservation_reminders
+from src.utils.telegram_sender import dispatch_message, PRIORITY_ORDER
 
 router = Router()
 logger = get_logger(__name__)
@@ -114,7 +116,7 @@ async def notify_admins_about_reservation(bot, reservation_data: dict, l10n: Flu
     
     for admin_id in admin_ids:
         try:
-            await bot.send_message(admin_id, message_text, parse_mode="HTML", reply_markup=keyboard)
+            await dispatch_message(bot, admin_id, message_text, PRIORITY_ORDER, parse_mode="HTML", reply_markup=keyboard)
             logger.info(f"✅ Sent reservation notification to admin {admin_id} with correct timezone")
         except Exception as e:
             logger.error(f"❌ Failed to send notification to admin {admin_id}: {e}")
@@ -203,19 +205,27 @@ async def show_reservation_summary(message: Message, state: FSMContext, l10n: Fl
     await message.answer(summary_text, reply_markup=builder.as_markup())
     await state.set_state(ReservationStates.confirmation)
 
+async def get_calendar_with_load(db_manager: DatabaseManager, year: int = None, month: int = None):
+    """Календарь с отметками загрузки дней"""
+    now = datetime.now()
+    year = year or now.year
+    month = month or now.month
+    day_load = await db_manager.get_month_availability(year, month)
+    return Calendar.get_calendar_keyboard(year, month, day_load)
+
 @router.message(F.text == "🍽️ Забронировать стол")
 @router.message(Command("reserve"))
 @reservation_limit(cooldown=30)
-async def start_reservation(message: Message, state: FSMContext, l10n: FluentLocalization):
+async def start_reservation(message: Message, state: FSMContext, l10n: FluentLocalization, db_manager: DatabaseManager):
     """Начало процесса бронирования"""
     await state.set_state(ReservationStates.waiting_for_date)
     await message.answer(
         "📅 Выберите дату бронирования:",
-        reply_markup=Calendar.get_calendar_keyboard()
+        reply_markup=await get_calendar_with_load(db_manager)
     )
 
 @router.callback_query(F.data.startswith("calendar_"), ReservationStates.waiting_for_date)
-async def process_calendar(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization):
+async def process_calendar(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization, db_manager: DatabaseManager):
     """Обработка взаимодействия с календарем"""
     action = callback.data.split("_")[1]
     
@@ -230,9 +240,12 @@ async def process_calendar(callback: CallbackQuery, state: FSMContext, l10n: Flu
         await state.update_data(selected_date=selected_date)
         await state.set_state(ReservationStates.waiting_for_time)
         
+        data = await state.get_data()
+        day_availability = await db_manager.get_day_availability(selected_date, data.get('guests_count', 1))
+        
         await callback.message.edit_text(
             f"🕐 Выберите время бронирования на {selected_date}:",
-            reply_markup=Calendar.get_time_keyboard()
+            reply_markup=Calendar.get_time_keyboard(day_availability)
         )
         
     elif action in ["prev", "next"]:
@@ -254,15 +267,33 @@ async def process_calendar(callback: CallbackQuery, state: FSMContext, l10n: Flu
                 month += 1
         
         await callback.message.edit_reply_markup(
-            reply_markup=Calendar.get_calendar_keyboard(year, month)
+            reply_markup=await get_calendar_with_load(db_manager, year, month)
         )
     
+    elif action == "full":
+        from src.utils.reservation_errors import get_reservation_error_message, ReservationError
+        
+        await callback.answer(get_reservation_error_message(ReservationError.NO_TABLES), show_alert=True)
+        return
+    
     await callback.answer()
 
 @router.callback_query(F.data.startswith("time_select_"), ReservationStates.waiting_for_time)
 async def process_time_selection(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization, db_manager: DatabaseManager):
     """Обработка выбора времени с проверкой доступности - ОБНОВЛЕННАЯ ВЕРСИЯ"""
     selected_time = callback.data.replace("time_select_", "")
+    await apply_time_selection(callback, state, l10n, db_manager, selected_time)
+
+@router.callback_query(F.data.startswith("alt_slot_"), ReservationStates.waiting_for_time)
+async def process_alternative_slot(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization, db_manager: DatabaseManager):
+    """Выбор предложенного альтернативного слота (дата и время одной кнопкой)"""
+    _, _, selected_date, selected_time = callback.data.split("_")
+    await state.update_data(selected_date=selected_date)
+    await apply_time_selection(callback, state, l10n, db_manager, selected_time)
+
+async def apply_time_selection(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization,
+                               db_manager: DatabaseManager, selected_time: str):
+    """Проверка выбранного времени и переход к следующему шагу"""
     data = await state.get_data()
     
     # Проверяем доступность через новый менеджер
@@ -286,7 +317,17 @@ async def process_time_selection(callback: CallbackQuery, state: FSMContext, l10
         error_type = error_mapping.get(availability['reason'], ReservationError.SERVICE_UNAVAILABLE)
         error_message = get_reservation_error_message(error_type, availability.get('details'))
         
-        await callback.message.edit_text(error_message)
+        # Если время занято - предлагаем ближайшие свободные слоты одной кнопкой
+        reply_markup = None
+        if availability['reason'] in ("no_tables", "capacity_exceeded"):
+            alternatives = await db_manager.find_alternative_slots(
+                data['selected_date'], selected_time, data.get('guests_count', 1)
+            )
+            if alternatives:
+                error_message += "\n\n🕐 Ближайшее свободное время:"
+                reply_markup = Calendar.get_alternatives_keyboard(alternatives, data['selected_date'])
+        
+        await callback.message.edit_text(error_message, reply_markup=reply_markup)
         await callback.answer()
         return
     
@@ -308,6 +349,61 @@ async def process_time_selection(callback: CallbackQuery, state: FSMContext, l10
     
     await callback.answer()
 
+@router.callback_query(F.data.startswith("time_full_"), ReservationStates.waiting_for_time)
+async def process_full_time_slot(callback: CallbackQuery):
+    """Нажатие на занятый слот - подсказка без перехода дальше"""
+    from src.utils.reservation_errors import get_reservation_error_message, ReservationError
+    
+    await callback.answer(get_reservation_error_message(ReservationError.NO_TABLES), show_alert=True)
+
+async def get_guests_unavailable_reply(state: FSMContext, db_manager: DatabaseManager, data: dict,
+                                      guests: int, availability: dict):
+    """
+    Ответ, когда на выбранное время нельзя рассадить guests гостей.
+    Есть свободные слоты для такой компании - предлагаем их (переход к выбору времени),
+    иначе остаемся на выборе количества гостей
+    """
+    from src.utils.reservation_errors import get_reservation_error_message, ReservationError
+    
+    error_mapping = {
+        "restaurant_closed": ReservationError.RESTAURANT_CLOSED,
+        "past_date": ReservationError.PAST_DATE,
+        "no_tables": ReservationError.NO_TABLES,
+        "capacity_exceeded": ReservationError.CAPACITY_EXCEEDED,
+        "invalid_guests_count": ReservationError.INVALID_GUESTS,
+        "error": ReservationError.SERVICE_UNAVAILABLE
+    }
+    
+    error_type = error_mapping.get(availability['reason'], ReservationError.SERVICE_UNAVAILABLE)
+    error_message = get_reservation_error_message(error_type, availability.get('details'))
+    
+    if availability['reason'] in ("no_tables", "capacity_exceeded"):
+        alternatives = await db_manager.find_alternative_slots(
+            data['selected_date'], data['selected_time'], guests
+        )
+        if alternatives:
+            # Альтернативный слот подбирается уже для этой компании
+            await state.update_data(guests_count=guests)
+            await state.set_state(ReservationStates.waiting_for_time)
+            error_message += "\n\n🕐 Ближайшее свободное время:"
+            return error_message, Calendar.get_alternatives_keyboard(
+                alternatives, data['selected_date'], change_guests=True
+            )
+    
+    error_message += "\n\n👥 Выберите другое количество гостей:"
+    return error_message, get_guests_keyboard()
+
+@router.callback_query(F.data == "change_guests", ReservationStates.waiting_for_time)
+async def change_guests_count(callback: CallbackQuery, state: FSMContext):
+    """Возврат к выбору количества гостей из списка альтернативных слотов"""
+    await state.update_data(guests_count=None)
+    await state.set_state(ReservationStates.waiting_for_guests)
+    await callback.message.edit_text(
+        "👥 На сколько гостей бронируем?",
+        reply_markup=get_guests_keyboard()
+    )
+    await callback.answer()
+
 @router.callback_query(F.data.startswith("guests_"), ReservationStates.waiting_for_guests)
 async def process_guests_count_callback(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization, db_manager: DatabaseManager):
     """Обработка выбора количества гостей - ОБНОВЛЕННАЯ ВЕРСИЯ"""
@@ -323,21 +419,10 @@ async def process_guests_count_callback(callback: CallbackQuery, state: FSMConte
             )
             
             if not availability["available"]:
-                from src.utils.reservation_errors import get_reservation_error_message, ReservationError
-                
-                error_mapping = {
-                    "restaurant_closed": ReservationError.RESTAURANT_CLOSED,
-                    "past_date": ReservationError.PAST_DATE,
-                    "no_tables": ReservationError.NO_TABLES,
-                    "capacity_exceeded": ReservationError.CAPACITY_EXCEEDED,
-                    "invalid_guests_count": ReservationError.INVALID_GUESTS,
-                    "error": ReservationError.SERVICE_UNAVAILABLE
-                }
-                
-                error_type = error_mapping.get(availability['reason'], ReservationError.SERVICE_UNAVAILABLE)
-                error_message = get_reservation_error_message(error_type, availability.get('details'))
-                
-                await callback.message.edit_text(error_message)
+                error_message, reply_markup = await get_guests_unavailable_reply(
+                    state, db_manager, data, guests, availability
+                )
+                await callback.message.edit_text(error_message, reply_markup=reply_markup)
                 await callback.answer()
                 return
         
@@ -372,21 +457,10 @@ async def process_guests_count_text(message: Message, state: FSMContext, l10n: F
             )
             
             if not availability["available"]:
-                from src.utils.reservation_errors import get_reservation_error_message, ReservationError
-                
-                error_mapping = {
-                    "restaurant_closed": ReservationError.RESTAURANT_CLOSED,
-                    "past_date": ReservationError.PAST_DATE,
-                    "no_tables": ReservationError.NO_TABLES,
-                    "capacity_exceeded": ReservationError.CAPACITY_EXCEEDED,
-                    "invalid_guests_count": ReservationError.INVALID_GUESTS,
-                    "error": ReservationError.SERVICE_UNAVAILABLE
-                }
-                
-                error_type = error_mapping.get(availability['reason'], ReservationError.SERVICE_UNAVAILABLE)
-                error_message = get_reservation_error_message(error_type, availability.get('details'))
-                
-                await message.answer(error_message)
+                error_message, reply_markup = await get_guests_unavailable_reply(
+                    state, db_manager, data, guests, availability
+                )
+                await message.answer(error_message, reply_markup=reply_markup)
                 return
         
         await state.update_data(guests_count=guests)
@@ -547,9 +621,12 @@ async def confirm_reservation(callback: CallbackQuery, state: FSMContext, db_man
             )
             
             # Предлагаем выбрать другое время
+            day_availability = await db_manager.get_day_availability(
+                data['selected_date'], data.get('guests_count', 1)
+            )
             await callback.message.answer(
                 "🕐 Пожалуйста, выберите другое время:",
-                reply_markup=Calendar.get_time_keyboard()
+                reply_markup=Calendar.get_time_keyboard(day_availability)
             )
             await state.set_state(ReservationStates.waiting_for_time)
             return
@@ -572,12 +649,12 @@ async def confirm_reservation(callback: CallbackQuery, state: FSMContext, db_man
 
 # Обработчики навигации
 @router.callback_query(F.data == "back_to_calendar", ReservationStates.waiting_for_time)
-async def back_to_calendar(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization):
+async def back_to_calendar(callback: CallbackQuery, state: FSMContext, l10n: FluentLocalization, db_manager: DatabaseManager):
     """Возврат к выбору даты"""
     await state.set_state(ReservationStates.waiting_for_date)
     await callback.message.edit_text(
         "📅 Выберите дату бронирования:",
-        reply_markup=Calendar.get_calendar_keyboard()
+        reply_markup=await get_calendar_with_load(db_manager)
     )
     await callback.answer()
     
@@ -626,6 +703,8 @@ async def cancel_reservation_callback(callback: CallbackQuery, db_manager=None,
         success = await db_manager.update_reservation_status(reservation_id, "cancelled")
         
         if success:
+            unschedule_reservation_reminders(reservation_id)
+            
             # Форматируем дату и время для сообщения
             reservation_date = reservation['reservation_date']
             reservation_time = reservation['reservation_time']
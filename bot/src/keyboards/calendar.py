@@ -2,11 +2,16 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from datetime import datetime, timedelta
 from calendar import monthrange
+from typing import Dict, List
 
 class Calendar:
     @staticmethod
-    def get_calendar_keyboard(year: int = None, month: int = None) -> InlineKeyboardMarkup:
-        """Генерация интерактивного календаря"""
+    def get_calendar_keyboard(year: int = None, month: int = None, day_load: Dict[int, str] = None) -> InlineKeyboardMarkup:
+        """
+        Генерация интерактивного календаря.
+        day_load - загрузка дней месяца (ReservationManager.get_month_availability):
+        занятые дни помечаются 🟡, полностью забронированные 🔴 и недоступны для выбора
+        """
         now = datetime.now()
         if not year:
             year = now.year
@@ -52,16 +57,28 @@ class Calendar:
         
         # Кнопки с днями
         today = datetime.now().date()
+        day_load = day_load or {}
         for day in range(1, days_in_month + 1):
             current_date = datetime(year, month, day).date()
             is_past = current_date < today
             is_today = current_date == today
+            load = day_load.get(day, 'free')
             
             if is_past:
                 builder.add(InlineKeyboardButton(
                     text=f"❌{day}", 
                     callback_data="ignore"
                 ))
+            elif load == 'full':
+                builder.add(InlineKeyboardButton(
+                    text=f"🔴{day}", 
+                    callback_data=f"calendar_full_{year}_{month:02d}_{day:02d}"
+                ))
+            elif load == 'busy':
+                builder.add(InlineKeyboardButton(
+                    text=f"🟡{day}", 
+                    callback_data=f"calendar_select_{year}_{month:02d}_{day:02d}"
+                ))
             elif is_today:
                 builder.add(InlineKeyboardButton(
                     text=f"📍{day}", 
@@ -82,26 +99,72 @@ class Calendar:
         return builder.as_markup()
 
     @staticmethod
-    def get_time_keyboard() -> InlineKeyboardMarkup:
-        """Генерация клавиатуры для выбора времени"""
+    def get_time_keyboard(availability: Dict[str, Dict] = None) -> InlineKeyboardMarkup:
+        """
+        Генерация клавиатуры для выбора времени.
+        availability - доступность слотов на дату (ReservationManager.get_day_availability):
+        прошедшие слоты скрываются, занятые помечаются 🚫
+        """
         builder = InlineKeyboardBuilder()
         
         # Популярные временные слоты
-        time_slots = [
+        time_slots = list(availability) if availability else [
             "10:00", "11:00", "12:00", "13:00", "14:00", "15:00",
             "16:00", "17:00", "18:00", "19:00", "20:00", "21:00"
         ]
         
         for time_slot in time_slots:
+            slot = availability.get(time_slot) if availability else None
+            
+            if slot is None or slot["available"]:
+                builder.add(InlineKeyboardButton(
+                    text=time_slot, 
+                    callback_data=f"time_select_{time_slot}"
+                ))
+            elif slot["reason"] in ("no_tables", "capacity_exceeded"):
+                builder.add(InlineKeyboardButton(
+                    text=f"🚫 {time_slot}", 
+                    callback_data=f"time_full_{time_slot}"
+                ))
+        
+        # buttons - генератор, он всегда истинен
+        if not list(builder.buttons):
+            builder.add(InlineKeyboardButton(text="Нет свободного времени", callback_data="ignore"))
+        
+        builder.adjust(3)
+        builder.row(
+            InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_calendar"),
+            InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_reservation")
+        )
+        
+        return builder.as_markup()
+
+    @staticmethod
+    def get_alternatives_keyboard(alternatives: List[Dict[str, str]], selected_date: str,
+                                  change_guests: bool = False) -> InlineKeyboardMarkup:
+        """
+        Кнопки ближайших свободных слотов (ReservationManager.find_alternative_slots).
+        change_guests - добавить кнопку возврата к выбору количества гостей
+        """
+        builder = InlineKeyboardBuilder()
+        
+        for alternative in alternatives:
+            if alternative["date"] == selected_date:
+                text = f"🕐 {alternative['time']}"
+            else:
+                day, month, _ = alternative["date"].split('.')
+                text = f"📅 {int(day):02d}.{int(month):02d} {alternative['time']}"
             builder.add(InlineKeyboardButton(
-                text=time_slot, 
-                callback_data=f"time_select_{time_slot}"
+                text=text,
+                callback_data=f"alt_slot_{alternative['date']}_{alternative['time']}"
             ))
         
+        builder.adjust(1)
+        if change_guests:
+            builder.row(InlineKeyboardButton(text="👥 Изменить количество гостей", callback_data="change_guests"))
         builder.row(
             InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_calendar"),
             InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_reservation")
         )
         
-        builder.adjust(3, 3, 3, 3, 2)
-        return builder.as_markup()
\ No newline at end of file
+        return builder.as_markup()
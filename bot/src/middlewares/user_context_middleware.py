@@ -0,0 +1,65 @@
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery, User
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Any, Awaitable, Optional
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class UserContext:
+    """Данные пользователя и его права, загруженные один раз на апдейт"""
+    user_id: int
+    exists: bool = False
+    is_blocked: bool = False
+    is_admin: bool = False
+    is_staff: bool = False
+    user: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_settings(cls, user_id: int) -> "UserContext":
+        """Fallback: права из статических списков ADMIN_IDS / STAFF_IDS"""
+        return cls(
+            user_id=user_id,
+            is_admin=user_id in settings.admin_ids_list,
+            is_staff=user_id in settings.all_staff_ids
+        )
+
+class UserContextMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message | CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        db_manager = data.get("db_manager")
+
+        if user:
+            data["user_context"] = await self._load_context(user, db_manager)
+
+        return await handler(event, data)
+
+    async def _load_context(self, user: User, db_manager) -> UserContext:
+        """Загрузка пользователя, флага блокировки и ролей одним запросом"""
+        row = None
+        if db_manager and db_manager.pool:
+            row = await db_manager.get_user_context(user.id)
+
+        if row is None:
+            return UserContext.from_settings(user.id)
+
+        if row['exists'] and not row['is_reachable']:
+            # Написал боту после блокировки - снова получает рассылки
+            await db_manager.mark_user_reachable(user.id)
+
+        return UserContext(
+            user_id=user.id,
+            exists=row['exists'],
+            is_blocked=row['is_blocked'],
+            is_admin=row['is_admin'],
+            is_staff=row['is_staff'],
+            user=row['user']
+        )
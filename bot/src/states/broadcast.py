@@ -3,7 +3,9 @@ from aiogram.fsm.state import State, StatesGroup
 class BroadcastStates(StatesGroup):
     """Состояния для создания рассылки"""
     choosing_segment = State()
+    entering_segment = State()
     choosing_type = State()
     entering_text = State()
     entering_image = State()
-    confirming = State()
\ No newline at end of file
+    confirming = State()
+    entering_schedule = State()
\ No newline at end of file
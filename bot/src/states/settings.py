@@ -6,6 +6,7 @@ class SettingsStates(StatesGroup):
     waiting_for_staff_id = State()
     waiting_for_remove_admin_id = State()
     waiting_for_remove_staff_id = State()
+    waiting_for_staff_zone = State()
     
     # Управление меню
     waiting_for_menu_category = State()
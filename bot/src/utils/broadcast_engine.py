@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Optional, Union
+
+from src.utils.config import settings
+from src.utils.telegram_sender import (
+    TokenBucket, classify_delivery_error,
+    ERROR_BLOCKED, ERROR_CHAT_NOT_FOUND, ERROR_RATE_LIMITED, ERROR_TRANSIENT
+)
+
+logger = logging.getLogger(__name__)
+
+# Результаты доставки (статусы broadcast_deliveries)
+DELIVERY_SENT = 'sent'
+DELIVERY_FAILED = 'failed'
+DELIVERY_BLOCKED = 'blocked'
+DELIVERY_NOT_FOUND = 'not_found'
+
+# Повторная попытка после сетевой ошибки: 1, 2, 4... секунд, не больше
+TRANSIENT_RETRY_MAX_DELAY = 10
+
+async def _iterate(recipients: Iterable[int]) -> AsyncIterator[int]:
+    for user_id in recipients:
+        yield user_id
+
+@dataclass
+class BroadcastProgress:
+    """Текущее состояние рассылки"""
+    total: int
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0  # недоступные: заблокировали бота или чат не найден
+    flood_waits: int = 0
+    # Сколько было обработано до запуска (продолжение рассылки после перезапуска)
+    resumed_from: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+    @property
+    def remaining(self) -> int:
+        return max(self.total - self.processed, 0)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """Сообщений в секунду с начала (продолжения) рассылки"""
+        elapsed = self.elapsed
+        return (self.processed - self.resumed_from) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени в секундах"""
+        rate = self.rate
+        return self.remaining / rate if rate > 0 else None
+
+class BroadcastEngine:
+    """
+    Рассылка с несколькими параллельными отправителями.
+
+    Лимиты Telegram соблюдает OutboundDispatcher, через который send отправляет
+    сообщения (полоса рассылок). Если передан bucket, каждое сообщение дополнительно
+    забирает из него токен, а TelegramRetryAfter приостанавливает всю корзину.
+    После RetryAfter сообщение уходит повторно.
+    Ошибки разбираются classify_delivery_error: сетевые повторяются с паузой,
+    недоступные пользователи (blocked, not_found) сразу отдаются в on_result.
+    Прогресс сообщается не чаще раза в progress_interval секунд.
+
+    pause() дает отправителям закончить текущие сообщения и останавливает их,
+    cancel() завершает рассылку, не трогая оставшихся получателей.
+    """
+
+    def __init__(self, concurrency: int = None, bucket: TokenBucket = None,
+                 progress_interval: float = None, max_retries: int = 3):
+        self.concurrency = concurrency or settings.BROADCAST_CONCURRENCY
+        self.bucket = bucket
+        self.progress_interval = progress_interval or settings.BROADCAST_PROGRESS_INTERVAL
+        self.max_retries = max_retries
+        self.cancelled = False
+        self._running = asyncio.Event()
+        self._running.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._running.set()  # будим остановленных отправителей, чтобы они завершились
+
+    async def run(self, recipients: Union[Iterable[int], AsyncIterable[int]], total: int,
+                  send: Callable[[int], Awaitable[bool]],
+                  on_progress: Callable[[BroadcastProgress], Awaitable[None]] = None,
+                  on_result: Callable[[int, str], None] = None,
+                  progress: BroadcastProgress = None) -> BroadcastProgress:
+        """
+        Отправка всем recipients - списку или асинхронному потоку user_id
+        (страницы из БД читаются по мере отправки). send(user_id) возвращает True при успехе
+        и может выбросить TelegramRetryAfter - тогда сообщение будет отправлено повторно.
+        on_result(user_id, status) вызывается после каждой доставки.
+        progress - счетчики продолжаемой рассылки (иначе начинаются с нуля)
+        """
+        progress = progress or BroadcastProgress(total=total)
+        if hasattr(recipients, '__aiter__'):
+            pending = recipients.__aiter__()
+        else:
+            pending = _iterate(recipients)
+        fetch_lock = asyncio.Lock()
+        finished = asyncio.Event()
+
+        reporter = None
+        if on_progress:
+            reporter = asyncio.create_task(self._report(progress, on_progress, finished))
+
+        workers = [
+            asyncio.create_task(self._worker(pending, fetch_lock, send, progress, on_result))
+            for _ in range(max(1, min(self.concurrency, total)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            finished.set()
+            if reporter:
+                await reporter
+            if hasattr(pending, 'aclose'):
+                await pending.aclose()
+
+        return progress
+
+    async def _worker(self, pending: AsyncIterator[int], fetch_lock: asyncio.Lock,
+                      send: Callable[[int], Awaitable[bool]], progress: BroadcastProgress,
+                      on_result: Callable[[int, str], None] = None):
+        # Общий поток: каждый получатель достается ровно одному отправителю.
+        # Асинхронный генератор нельзя продвигать из нескольких задач сразу, поэтому под блокировкой
+        while True:
+            await self._running.wait()
+            if self.cancelled:
+                return
+            async with fetch_lock:
+                user_id = await anext(pending, None)
+            if user_id is None:
+                return
+
+            status = await self._deliver(user_id, send, progress)
+            if status == DELIVERY_SENT:
+                progress.sent += 1
+            elif status in (DELIVERY_BLOCKED, DELIVERY_NOT_FOUND):
+                progress.blocked += 1
+            else:
+                progress.failed += 1
+            if on_result:
+                on_result(user_id, status)
+
+    async def _deliver(self, user_id: int, send: Callable[[int], Awaitable[bool]], progress: BroadcastProgress) -> str:
+        for attempt in range(self.max_retries + 1):
+            if self.bucket:
+                await self.bucket.acquire()
+            try:
+                return DELIVERY_SENT if await send(user_id) else DELIVERY_FAILED
+            except Exception as e:
+                error, error_class = e, classify_delivery_error(e)
+
+            if error_class == ERROR_BLOCKED:
+                return DELIVERY_BLOCKED
+            if error_class == ERROR_CHAT_NOT_FOUND:
+                return DELIVERY_NOT_FOUND
+            if error_class == ERROR_RATE_LIMITED:
+                progress.flood_waits += 1
+                logger.warning(f"⏳ Broadcast flood control: retry after {error.retry_after}s")
+                if self.bucket:
+                    self.bucket.pause(error.retry_after)
+            elif error_class == ERROR_TRANSIENT and attempt < self.max_retries:
+                logger.warning(f"⚠️ Transient error sending broadcast to {user_id}, retrying: {error}")
+                await asyncio.sleep(min(2 ** attempt, TRANSIENT_RETRY_MAX_DELAY))
+            else:
+                logger.error(f"❌ Failed to send broadcast to {user_id} ({error_class}): {error}")
+                return DELIVERY_FAILED
+
+        logger.error(f"❌ Broadcast to {user_id} dropped after {self.max_retries} retries")
+        return DELIVERY_FAILED
+
+    async def _report(self, progress: BroadcastProgress, on_progress: Callable[[BroadcastProgress], Awaitable[None]],
+                      finished: asyncio.Event):
+        while not finished.is_set():
+            try:
+                await asyncio.wait_for(finished.wait(), timeout=self.progress_interval)
+            except asyncio.TimeoutError:
+                try:
+                    await on_progress(progress)
+                except Exception as e:
+                    logger.error(f"❌ Broadcast progress callback failed: {e}")
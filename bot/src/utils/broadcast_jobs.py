@@ -0,0 +1,460 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from src.database.db_manager import DatabaseManager
+from src.utils.config import settings
+from src.utils.broadcast_engine import BroadcastEngine, BroadcastProgress, DELIVERY_BLOCKED, DELIVERY_NOT_FOUND
+from src.utils.telegram_sender import (
+    classify_delivery_error, dispatch_message, dispatch_photo, ERROR_PERMANENT, ERROR_TRANSIENT, PRIORITY_BROADCAST
+)
+
+logger = logging.getLogger(__name__)
+
+async def send_broadcast_content(bot: Bot, user_id: int, message_type: str,
+                                 text: str, image_file_id: str = None) -> bool:
+    """
+    Отправка сообщения рассылки пользователю в зависимости от типа.
+    Ошибки Telegram пробрасываются движку рассылки: он решает, повторять ли
+    отправку и отмечать ли пользователя недоступным. Отправка идет в полосе
+    рассылок диспетчера, поэтому уведомления персонала и заказы уходят раньше
+    """
+    if message_type == "image":
+        if not image_file_id:
+            logger.error(f"❌ No image_file_id for image broadcast to {user_id}")
+            # Fallback to text only
+            await dispatch_message(bot, user_id, text, PRIORITY_BROADCAST, parse_mode="HTML")
+            return True
+
+        try:
+            # Ограничиваем длину подписи для фото
+            caption = text[:1024] if len(text) > 1024 else text
+            await dispatch_photo(bot, user_id, image_file_id, PRIORITY_BROADCAST, caption=caption, parse_mode="HTML")
+            return True
+        except Exception as photo_error:
+            # Текстом отправляем только если проблема в самом фото, а не в пользователе или сети
+            if classify_delivery_error(photo_error) not in (ERROR_PERMANENT, ERROR_TRANSIENT):
+                raise
+            logger.error(f"❌ Failed to send photo to {user_id}: {photo_error}")
+            # Fallback to text only
+            await dispatch_message(
+                bot, user_id,
+                f"🖼️ {text}",  # Добавляем эмодзи чтобы показать, что должно было быть изображение
+                PRIORITY_BROADCAST,
+                parse_mode="HTML"
+            )
+            return True
+
+    # Текст (и fallback для неизвестного типа)
+    await dispatch_message(bot, user_id, text, PRIORITY_BROADCAST, parse_mode="HTML")
+    return True
+
+def get_broadcast_control_keyboard(broadcast_id: int, paused: bool = False) -> InlineKeyboardMarkup:
+    """Кнопки управления запущенной рассылкой"""
+    if paused:
+        toggle = InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"broadcast_resume_{broadcast_id}")
+    else:
+        toggle = InlineKeyboardButton(text="⏸ Пауза", callback_data=f"broadcast_pause_{broadcast_id}")
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        toggle,
+        InlineKeyboardButton(text="⛔ Отменить", callback_data=f"broadcast_abort_{broadcast_id}")
+    ]])
+
+def get_scheduled_broadcast_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+    """Кнопка отмены запланированной рассылки"""
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="⛔ Отменить", callback_data=f"broadcast_abort_{broadcast_id}")
+    ]])
+
+def get_broadcast_timings(broadcast: Dict) -> Dict[str, Optional[float]]:
+    """
+    Задержка старта относительно scheduled_at и длительность отправки (секунды).
+    Длительность считается до текущего момента
+    """
+    started_at = broadcast.get('started_at')
+    scheduled_at = broadcast.get('scheduled_at')
+    now = datetime.now(timezone.utc)
+    return {
+        'start_lag': (started_at - scheduled_at).total_seconds() if started_at and scheduled_at else None,
+        'duration': (now - started_at).total_seconds() if started_at else None
+    }
+
+def format_broadcast_progress(progress: BroadcastProgress, paused: bool = False) -> str:
+    """Текст сообщения с прогрессом рассылки"""
+    title = "⏸ <b>РАССЫЛКА НА ПАУЗЕ</b>" if paused else "📤 <b>РАССЫЛКА В ПРОЦЕССЕ</b>"
+    text = (
+        f"{title}\n\n"
+        f"✅ Отправлено: {progress.sent}\n"
+        f"❌ Ошибок: {progress.failed}\n"
+        f"🚫 Недоступны: {progress.blocked}\n"
+        f"⏳ Осталось: {progress.remaining}"
+    )
+    if not paused:
+        text += f"\n⚡ Скорость: {progress.rate:.1f} сообщ./сек"
+        if progress.eta is not None:
+            text += f"\n🕐 Примерно еще: {int(progress.eta // 60)} мин {int(progress.eta % 60)} сек"
+    if progress.flood_waits:
+        text += f"\n🐢 Пауз по лимиту Telegram: {progress.flood_waits}"
+    return text
+
+def format_broadcast_report(broadcast: Dict, progress: BroadcastProgress, cancelled: bool = False) -> str:
+    """Итоговый отчет по рассылке"""
+    title = "⛔ <b>РАССЫЛКА ОТМЕНЕНА</b>" if cancelled else "✅ <b>РАССЫЛКА ЗАВЕРШЕНА</b>"
+    text = (
+        f"{title}\n\n"
+        f"📊 <b>Итоги:</b>\n"
+        f"• ✅ Успешно: {progress.sent}\n"
+        f"• ❌ Ошибок: {progress.failed}\n"
+        f"• 🚫 Недоступны (заблокировали бота, чат удален): {progress.blocked}\n"
+    )
+    if broadcast.get('pruned_count'):
+        text += f"• ✂️ Исключены заранее как недоступные: {broadcast['pruned_count']}\n"
+    if cancelled:
+        text += f"• ⏳ Не отправлено: {progress.remaining}\n"
+    text += f"• 📈 Эффективность: {progress.sent/max(1, progress.total)*100:.1f}%\n"
+    timings = get_broadcast_timings(broadcast)
+    if timings['duration'] is not None:
+        text += f"• ⏱ Длительность: {int(timings['duration'] // 60)} мин {int(timings['duration'] % 60)} сек\n"
+    if timings['start_lag'] is not None:
+        text += f"• 🕒 Запуск по расписанию, задержка: {int(timings['start_lag'])} сек\n"
+    text += (
+        f"\n🎨 <b>Тип:</b> {broadcast['message_type']}\n"
+        f"🆔 <b>ID рассылки:</b> {broadcast['id']}"
+    )
+    if broadcast['message_type'] == "image":
+        text += f"\n🖼️ <b>Изображение:</b> {'✅' if broadcast['image_file_id'] else '❌'}"
+    return text
+
+class BroadcastJob:
+    """Запущенная рассылка: движок, фоновая задача и неподтвержденные в журнале результаты"""
+
+    def __init__(self, broadcast: Dict, engine: BroadcastEngine):
+        self.broadcast = broadcast
+        self.engine = engine
+        self.task: Optional[asyncio.Task] = None
+        self.results: List[Tuple[int, str]] = []
+        self.progress: Optional[BroadcastProgress] = None
+        self.last_text: Optional[str] = None
+        self.stopping = False  # остановка бота: рассылка продолжится после перезапуска
+
+class BroadcastJobManager:
+    """
+    Фоновые рассылки по журналу broadcast_deliveries.
+
+    Получатели заносятся в журнал со статусом queued до начала отправки,
+    результаты пишутся пакетами при каждом обновлении прогресса. После
+    перезапуска рассылки в статусе sending продолжаются с оставшихся
+    queued получателей, поэтому уже получившим сообщение оно не придет повторно.
+
+    Запланированные рассылки (status scheduled) забирает планировщик: раз в
+    BROADCAST_SCHEDULER_INTERVAL секунд claim_due_broadcasts захватывает наступившие
+    с FOR UPDATE SKIP LOCKED, так что при нескольких экземплярах бота каждую
+    рассылку запускает только один из них.
+
+    Отправку ведет экземпляр, захвативший аренду рассылки (broadcasts.lease_owner):
+    start() берет ее атомарно, планировщик продлевает, а по завершении или остановке
+    бота она снимается. Прерванную рассылку продолжает один экземпляр, и только
+    когда прежний владелец ее отпустил или его аренда истекла.
+    """
+
+    def __init__(self, bot: Bot, db_manager: DatabaseManager):
+        self.bot = bot
+        self.db_manager = db_manager
+        self.jobs: Dict[int, BroadcastJob] = {}
+        self.scheduler_task: Optional[asyncio.Task] = None
+        # Идентификатор экземпляра бота - владельца аренды рассылок
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def start(self, broadcast_id: int) -> bool:
+        """Запуск (или продолжение) рассылки в фоне"""
+        if broadcast_id in self.jobs:
+            return False
+
+        # Запускается только рассылка с заполненным журналом доставки (sending или paused):
+        # черновик без журнала завершился бы без отправки, запланированную запускает планировщик.
+        # Рассылку, которую ведет другой экземпляр бота, захватить не удастся
+        broadcast = await self.db_manager.claim_broadcast(broadcast_id, self.owner, settings.BROADCAST_LEASE_TTL)
+        if not broadcast or broadcast_id in self.jobs:
+            return False
+        if broadcast['status'] != 'sending':
+            await self.db_manager.set_broadcast_status(broadcast_id, 'sending')
+
+        job = BroadcastJob(broadcast, BroadcastEngine())
+        self.jobs[broadcast_id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return True
+
+    async def resume_interrupted(self):
+        """Продолжение рассылок, прерванных остановкой или падением экземпляра бота"""
+        for broadcast in await self.db_manager.get_broadcasts_by_status('sending'):
+            if broadcast['id'] in self.jobs:
+                continue
+            if await self.start(broadcast['id']):
+                logger.info(f"🔄 Resuming broadcast #{broadcast['id']}")
+
+    def start_scheduler(self):
+        if self.scheduler_task is None:
+            self.scheduler_task = asyncio.create_task(self._schedule_loop())
+
+    async def _schedule_loop(self):
+        """Запуск запланированных рассылок, время которых наступило"""
+        while True:
+            try:
+                await self.renew_leases()
+                await self.resume_interrupted()
+                await self.run_due_broadcasts()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Broadcast scheduler error: {e}")
+            await asyncio.sleep(settings.BROADCAST_SCHEDULER_INTERVAL)
+
+    async def renew_leases(self):
+        """Продление аренды своих рассылок. Отмененные или перехваченные рассылки останавливаются"""
+        if not self.jobs:
+            return
+        renewed = await self.db_manager.renew_broadcast_leases(
+            list(self.jobs), self.owner, settings.BROADCAST_LEASE_TTL
+        )
+        if renewed is None:
+            return
+        for broadcast_id, job in list(self.jobs.items()):
+            if broadcast_id in renewed or job.engine.cancelled:
+                continue
+            logger.warning(f"⚠️ Broadcast #{broadcast_id} is no longer owned by this instance, stopping")
+            job.stopping = True
+            job.engine.cancel()
+
+    async def run_due_broadcasts(self) -> int:
+        claimed = await self.db_manager.claim_due_broadcasts(
+            settings.BROADCAST_SCHEDULER_BATCH, self.owner, settings.BROADCAST_LEASE_TTL
+        )
+        for broadcast_id in claimed:
+            if await self.start(broadcast_id):
+                timings = get_broadcast_timings(self.jobs[broadcast_id].broadcast)
+                logger.info(f"🕒 Scheduled broadcast #{broadcast_id} started, "
+                            f"{timings['start_lag'] or 0:.0f}s after scheduled time")
+        return len(claimed)
+
+    async def queue(self, broadcast_id: int, segment_key: str, segment_expression: str = None) -> Optional[int]:
+        """Заполнение журнала доставки с арендой рассылки этим экземпляром (запуск - start)"""
+        return await self.db_manager.queue_broadcast_deliveries(
+            broadcast_id, segment_key, segment_expression, self.owner, settings.BROADCAST_LEASE_TTL
+        )
+
+    async def pause(self, broadcast_id: int) -> bool:
+        job = self.jobs.get(broadcast_id)
+        if not job or job.engine.paused:
+            return False
+
+        job.engine.pause()
+        await self.db_manager.set_broadcast_status(broadcast_id, 'paused')
+        if job.progress:
+            await self._show_progress(job, job.progress)
+        logger.info(f"⏸ Broadcast #{broadcast_id} paused")
+        return True
+
+    async def resume(self, broadcast_id: int) -> bool:
+        job = self.jobs.get(broadcast_id)
+        if job is None:
+            # Рассылка была на паузе во время перезапуска бота
+            return await self.start(broadcast_id)
+        if not job.engine.paused:
+            return False
+
+        await self.db_manager.set_broadcast_status(broadcast_id, 'sending')
+        job.engine.resume()
+        logger.info(f"▶️ Broadcast #{broadcast_id} resumed")
+        return True
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        if not await self.db_manager.set_broadcast_status(broadcast_id, 'cancelled'):
+            return False
+
+        job = self.jobs.get(broadcast_id)
+        if job:
+            job.engine.cancel()  # итоговый отчет отправит _run
+        else:
+            # Рассылка стояла на паузе с прошлого запуска бота
+            broadcast = await self.db_manager.get_broadcast(broadcast_id)
+            if broadcast and broadcast['progress_chat_id']:
+                job = BroadcastJob(broadcast, BroadcastEngine())
+                await self._edit_progress_message(
+                    job, f"⛔ <b>РАССЫЛКА ОТМЕНЕНА</b>\n\n🆔 <b>ID рассылки:</b> {broadcast_id}"
+                )
+        logger.info(f"⛔ Broadcast #{broadcast_id} cancelled")
+        return True
+
+    async def stop(self):
+        """Остановка бота: дописываем журнал, рассылки продолжатся при следующем запуске"""
+        if self.scheduler_task:
+            self.scheduler_task.cancel()
+            try:
+                await self.scheduler_task
+            except asyncio.CancelledError:
+                pass
+            self.scheduler_task = None
+
+        jobs = list(self.jobs.values())
+        for job in jobs:
+            job.stopping = True
+            job.engine.cancel()
+        await asyncio.gather(*(job.task for job in jobs), return_exceptions=True)
+
+    async def _run(self, job: BroadcastJob):
+        broadcast = job.broadcast
+        broadcast_id = broadcast['id']
+        try:
+            # Получатели читаются из журнала страницами по мере отправки
+            recipients = self.db_manager.iter_queued_broadcast_recipients(
+                broadcast_id, batch_size=settings.BROADCAST_FETCH_BATCH_SIZE
+            )
+            done_before = broadcast['sent_count'] + broadcast['failed_count'] + broadcast['blocked_count']
+            remaining = max(broadcast['total_count'] - done_before, 0)
+            job.progress = BroadcastProgress(
+                total=broadcast['total_count'],
+                sent=broadcast['sent_count'],
+                failed=broadcast['failed_count'],
+                blocked=broadcast['blocked_count'],
+                resumed_from=done_before
+            )
+
+            async def send(user_id: int) -> bool:
+                return await send_broadcast_content(
+                    self.bot, user_id, broadcast['message_type'], broadcast['message_text'], broadcast['image_file_id']
+                )
+
+            async def on_progress(progress: BroadcastProgress):
+                await self._flush(job)
+                await self._show_progress(job, progress)
+
+            def on_result(user_id: int, status: str):
+                job.results.append((user_id, status))
+
+            try:
+                await job.engine.run(recipients, remaining, send, on_progress, on_result, job.progress)
+            finally:
+                await self._flush(job)
+
+            if job.stopping:
+                logger.info(f"💾 Broadcast #{broadcast_id} interrupted, {job.progress.remaining} recipients left")
+                return
+
+            cancelled = job.engine.cancelled
+            if not cancelled:
+                await self.db_manager.set_broadcast_status(broadcast_id, 'completed')
+            await self._show_report(job, cancelled)
+            timings = get_broadcast_timings(broadcast)
+
+            if broadcast['progress_chat_id']:
+                await self.db_manager.add_user_action(
+                    user_id=broadcast['progress_chat_id'],
+                    action_type='broadcast_cancelled' if cancelled else 'broadcast_completed',
+                    action_data={
+                        'broadcast_id': broadcast_id,
+                        'segment': broadcast['segment_key'],
+                        'sent_count': job.progress.sent,
+                        'failed_count': job.progress.failed,
+                        'blocked_count': job.progress.blocked,
+                        'content_type': broadcast['message_type'],
+                        'has_image': bool(broadcast['image_file_id']),
+                        'scheduled': broadcast['scheduled_at'] is not None,
+                        'start_lag_seconds': timings['start_lag'],
+                        'duration_seconds': timings['duration']
+                    }
+                )
+
+            logger.info(f"✅ Broadcast #{broadcast_id} {'cancelled' if cancelled else 'completed'}: "
+                        f"{job.progress.sent} sent, {job.progress.failed} failed, {job.progress.blocked} blocked "
+                        f"in {timings['duration'] or 0:.0f}s")
+
+        except Exception as e:
+            logger.error(f"❌ Broadcast #{broadcast_id} failed: {e}")
+        finally:
+            self.jobs.pop(broadcast_id, None)
+            # Прерванную рассылку сразу может продолжить другой экземпляр
+            await self.db_manager.release_broadcasts(self.owner, [broadcast_id])
+
+    async def _flush(self, job: BroadcastJob):
+        """Пакетная запись накопленных результатов в журнал"""
+        if not job.results:
+            return
+        results, job.results = job.results, []
+        if not await self.db_manager.record_broadcast_deliveries(job.broadcast['id'], results):
+            # Не записалось - повторим при следующем обновлении прогресса
+            job.results = results + job.results
+            return
+
+        # Недоступные пользователи исключаются из следующих рассылок
+        unreachable = [
+            (user_id, 'blocked' if status == DELIVERY_BLOCKED else 'chat_not_found')
+            for user_id, status in results
+            if status in (DELIVERY_BLOCKED, DELIVERY_NOT_FOUND)
+        ]
+        if unreachable:
+            await self.db_manager.mark_users_unreachable(unreachable)
+
+    async def _edit_progress_message(self, job: BroadcastJob, text: str, reply_markup: InlineKeyboardMarkup = None):
+        broadcast = job.broadcast
+        if not broadcast['progress_chat_id'] or text == job.last_text:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text,
+                chat_id=broadcast['progress_chat_id'],
+                message_id=broadcast['progress_message_id'],
+                reply_markup=reply_markup,
+                parse_mode="HTML"
+            )
+            job.last_text = text
+        except Exception as e:
+            logger.error(f"❌ Failed to update progress of broadcast #{broadcast['id']}: {e}")
+
+    async def _show_progress(self, job: BroadcastJob, progress: BroadcastProgress):
+        paused = job.engine.paused
+        await self._edit_progress_message(
+            job,
+            format_broadcast_progress(progress, paused),
+            get_broadcast_control_keyboard(job.broadcast['id'], paused)
+        )
+
+    async def _show_report(self, job: BroadcastJob, cancelled: bool):
+        await self._edit_progress_message(job, format_broadcast_report(job.broadcast, job.progress, cancelled))
+
+# Глобальный экземпляр
+broadcast_jobs: Optional[BroadcastJobManager] = None
+
+async def start_broadcast_jobs(bot: Bot, db_manager: DatabaseManager):
+    """Запуск менеджера рассылок, продолжение прерванных рассылок и планировщика"""
+    global broadcast_jobs
+    broadcast_jobs = BroadcastJobManager(bot, db_manager)
+    await broadcast_jobs.resume_interrupted()
+    broadcast_jobs.start_scheduler()
+
+async def stop_broadcast_jobs():
+    if broadcast_jobs:
+        await broadcast_jobs.stop()
+
+async def queue_broadcast(broadcast_id: int, segment_key: str, segment_expression: str = None) -> Optional[int]:
+    if not broadcast_jobs:
+        return None
+    return await broadcast_jobs.queue(broadcast_id, segment_key, segment_expression)
+
+async def start_broadcast(broadcast_id: int) -> bool:
+    return bool(broadcast_jobs) and await broadcast_jobs.start(broadcast_id)
+
+async def pause_broadcast(broadcast_id: int) -> bool:
+    return bool(broadcast_jobs) and await broadcast_jobs.pause(broadcast_id)
+
+async def resume_broadcast(broadcast_id: int) -> bool:
+    return bool(broadcast_jobs) and await broadcast_jobs.resume(broadcast_id)
+
+async def cancel_broadcast(broadcast_id: int) -> bool:
+    return bool(broadcast_jobs) and await broadcast_jobs.cancel(broadcast_id)
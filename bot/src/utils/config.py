@@ -1,6 +1,8 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List, Optional
 
+from src.database.role_cache import role_cache
+
 class Settings(BaseSettings):
     BOT_TOKEN: str
     ADMIN_IDS: str
@@ -29,17 +31,15 @@ class Settings(BaseSettings):
         """Проверка прав администратора через базу данных"""
         if db_manager:
             return await db_manager.is_admin(user_id)
-        # Fallback: проверка через статический список
-        admin_ids = [int(admin_id.strip()) for admin_id in self.ADMIN_IDS.split(",")]
-        return user_id in admin_ids
+        # Fallback: проверка через кэш ролей (засеян из ADMIN_IDS до загрузки из БД)
+        return role_cache.is_admin(user_id)
 
     async def is_staff(self, user_id: int, db_manager = None) -> bool:
         """Проверка прав персонала через базу данных"""
         if db_manager:
             return await db_manager.is_staff(user_id)
-        # Fallback: проверка через статический список
-        staff_ids = [int(staff_id.strip()) for staff_id in self.STAFF_IDS.split(",")]
-        return user_id in staff_ids
+        # Fallback: проверка через кэш ролей (засеян из STAFF_IDS до загрузки из БД)
+        return role_cache.is_staff(user_id)
 
     def can_receive_staff_notifications(self, user_id: int) -> bool:
         """Проверяет, может ли пользователь получать уведомления (админы + стафф)"""
@@ -56,9 +56,51 @@ class Settings(BaseSettings):
     ENABLE_FILE_LOGGING: bool = True
     DATABASE_URL: Optional[str] = None
 
+    # Кэш ролей (админы/персонал)
+    ROLE_CACHE_TTL: int = 300
+    # Синхронизация кэшей (роли, меню доставки) нескольких процессов через LISTEN/NOTIFY
+    CACHE_NOTIFY_LISTEN: bool = False
+
+    # Пакетная запись аналитики
+    ANALYTICS_FLUSH_INTERVAL_MS: int = 1000
+    ANALYTICS_BATCH_SIZE: int = 500
+    ANALYTICS_MAX_QUEUE_SIZE: int = 10000
+
+    # Отправка сообщений: общий лимит бота в Telegram (сообщений в секунду)
+    TELEGRAM_GLOBAL_RATE_LIMIT: int = 25
+    # Одновременных запросов к Telegram у диспетчера исходящих сообщений
+    OUTBOUND_CONCURRENCY: int = 16
+    # Сколько сообщений персоналу о вызове отправляется (редактируется) одновременно
+    STAFF_NOTIFY_CONCURRENCY: int = 10
+    # Сколько лучших официантов (по зоне стола и загрузке) получают вызов первыми, 0 - весь персонал
+    STAFF_CALL_ROUTING_CANDIDATES: int = 2
+    # За какой период (секунды) учитываются принятые вызовы при оценке загрузки официанта
+    STAFF_CALL_LOAD_WINDOW: int = 14400
+    # Эскалация непринятого вызова (секунды после уведомления персонала):
+    # вызов получает остальной персонал, повторное уведомление всем, затем администраторам
+    STAFF_CALL_WIDEN_AFTER: int = 30
+    STAFF_CALL_REPING_AFTER: int = 60
+    STAFF_CALL_ESCALATE_AFTER: int = 180
+    # Более старые непринятые вызовы при запуске не эскалируются
+    STAFF_CALL_ESCALATION_MAX_AGE: int = 3600
+    BROADCAST_CONCURRENCY: int = 10
+    # Размер страницы получателей, читаемой из БД во время рассылки
+    BROADCAST_FETCH_BATCH_SIZE: int = 1000
+    # Как часто обновлять сообщение с прогрессом рассылки (секунды)
+    BROADCAST_PROGRESS_INTERVAL: float = 3.0
+    # Как часто проверять запланированные рассылки (секунды) и сколько забирать за раз
+    BROADCAST_SCHEDULER_INTERVAL: float = 30.0
+    BROADCAST_SCHEDULER_BATCH: int = 5
+    # Аренда рассылки экземпляром бота (секунды): продлевается планировщиком, после
+    # падения экземпляра его рассылки продолжит другой, когда аренда истечет
+    BROADCAST_LEASE_TTL: int = 120
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8"
     )
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
+
+role_cache.ttl = settings.ROLE_CACHE_TTL
+role_cache.seed(settings.admin_ids_list, settings.staff_ids_list)
\ No newline at end of file
@@ -36,7 +36,10 @@ class HealthMonitor:
             self._check_memory_usage,
             self._check_disk_usage,
             self._check_bot_connection,
-            self._check_background_tasks
+            self._check_background_tasks,
+            self._check_reminder_delivery,
+            self._check_outbound_queue,
+            self._check_notify_listener
         ]
         
         results = []
@@ -266,6 +269,119 @@ class HealthMonitor:
                 timestamp=datetime.now()
             )
     
+    async def _check_reminder_delivery(self) -> HealthCheckResult:
+        """Проверка отправки напоминаний: ошибки и задержки последней пачки"""
+        from src.utils import reminders
+        
+        system = reminders.reminder_system
+        if system is None or not system.is_running:
+            return HealthCheckResult(
+                component="reminder_delivery",
+                status=HealthStatus.DEGRADED,
+                message="Reminder system is not running",
+                response_time=0,
+                timestamp=datetime.now()
+            )
+        
+        stats = system.get_stats()
+        last_tick = stats['last_tick']
+        if last_tick is None:
+            return HealthCheckResult(
+                component="reminder_delivery",
+                status=HealthStatus.HEALTHY,
+                message=f"No reminders sent yet, scheduled: {stats['scheduled']}",
+                response_time=0,
+                timestamp=datetime.now()
+            )
+        
+        attempted = last_tick['sent'] + last_tick['failed']
+        failure_ratio = last_tick['failed'] / attempted if attempted else 0
+        if failure_ratio > 0.5:
+            status = HealthStatus.UNHEALTHY
+        elif failure_ratio > 0.2:
+            status = HealthStatus.DEGRADED
+        else:
+            status = HealthStatus.HEALTHY
+        
+        return HealthCheckResult(
+            component="reminder_delivery",
+            status=status,
+            message=(
+                f"Last batch: sent {last_tick['sent']}, failed {last_tick['failed']}, "
+                f"avg {last_tick['avg_latency'] * 1000:.0f}ms, max {last_tick['max_latency'] * 1000:.0f}ms; "
+                f"total sent {stats['sent']}, failed {stats['failed']}, scheduled {stats['scheduled']}"
+            ),
+            response_time=last_tick['avg_latency'],
+            timestamp=datetime.now()
+        )
+    
+    async def _check_outbound_queue(self) -> HealthCheckResult:
+        """Проверка очереди исходящих сообщений: задержка вызовов персонала и глубина очереди"""
+        from src.utils import telegram_sender
+        
+        dispatcher = telegram_sender.outbound_dispatcher
+        if dispatcher is None:
+            return HealthCheckResult(
+                component="outbound_queue",
+                status=HealthStatus.DEGRADED,
+                message="Outbound dispatcher is not running",
+                response_time=0,
+                timestamp=datetime.now()
+            )
+        
+        lanes = dispatcher.get_stats()
+        staff_calls = lanes['staff_calls']
+        # Вызов персонала должен уходить сразу, остальные полосы могут подождать
+        if staff_calls['p95_latency'] > 10:
+            status = HealthStatus.UNHEALTHY
+        elif staff_calls['p95_latency'] > 3 or dispatcher.pending > 5000:
+            status = HealthStatus.DEGRADED
+        else:
+            status = HealthStatus.HEALTHY
+        
+        return HealthCheckResult(
+            component="outbound_queue",
+            status=status,
+            message="; ".join(
+                f"{name}: queued {lane['queued']}, p95 {lane['p95_latency'] * 1000:.0f}ms, "
+                f"failed {lane['failed']}, 429 {lane['retry_after']}"
+                for name, lane in lanes.items()
+            ),
+            response_time=staff_calls['avg_latency'],
+            timestamp=datetime.now()
+        )
+    
+    async def _check_notify_listener(self) -> HealthCheckResult:
+        """Проверка LISTEN-соединения синхронизации кэшей (с переподключением)"""
+        start_time = datetime.now()
+        if not self.db_manager.notify_listen_enabled:
+            return HealthCheckResult(
+                component="cache_notify",
+                status=HealthStatus.HEALTHY,
+                message="Cache notifications are disabled",
+                response_time=0,
+                timestamp=datetime.now()
+            )
+        
+        was_connected = self.db_manager.notify_listener_connected
+        connected = await self.db_manager.ensure_notify_listener()
+        response_time = (datetime.now() - start_time).total_seconds()
+        
+        if not connected:
+            status, message = HealthStatus.DEGRADED, "Listener is down, caches refresh only by TTL"
+        elif not was_connected:
+            status, message = HealthStatus.DEGRADED, "Listener was down and has been reconnected"
+        else:
+            status, message = HealthStatus.HEALTHY, "Listening for roles_changed, menu_changed, tables_changed"
+        
+        return HealthCheckResult(
+            component="cache_notify",
+            status=status,
+            message=message,
+            response_time=response_time,
+            timestamp=datetime.now()
+        )
+    
     def _result_to_dict(self, result: HealthCheckResult) -> Dict[str, Any]:
         """Конвертирует результат в словарь"""
         return {
@@ -1,28 +1,81 @@
 import asyncio
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+import heapq
+from time import monotonic
+from typing import Dict, List, Tuple
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime, timedelta, date, time
 from src.database.db_manager import DatabaseManager
+from src.utils.telegram_sender import OutboundDispatcher, OutgoingMessage, PRIORITY_REMINDER, get_outbound_dispatcher
 from aiogram import Bot
 
+# За сколько до брони отправляется напоминание
+REMINDER_OFFSETS = {
+    '24h': timedelta(hours=24),
+    '3h': timedelta(hours=3),
+}
+# Опоздавшее напоминание (бот был выключен) еще отправляется в течение этого времени
+REMINDER_GRACE = timedelta(minutes=30)
+REMINDER_TEMPLATES = {
+    '24h': """
+🔔 <b>Напоминание о бронировании!</b>
+
+Через 24 часа у вас бронь в нашем ресторане.
+
+📅 Дата: {date}
+🕐 Время: {time}
+👥 Гости: {guests}
+
+Если планы изменились, вы можете отменить бронь:
+""",
+    '3h': """
+⏰ <b>Скоро встреча!</b>
+
+Через 3 часа у вас бронь в нашем ресторане.
+
+📅 Дата: {date}
+🕐 Время: {time}
+👥 Гости: {guests}
+
+Если не успеваете, отмените бронь:
+""",
+}
+# Как часто закрывать прошедшие брони и сверять расписание с БД
+MAINTENANCE_INTERVAL = 3600
+
 class ReminderSystem:
-    def __init__(self, bot: Bot, db_manager: DatabaseManager):
+    """
+    Планировщик напоминаний о бронях.
+
+    Подтвержденные брони загружаются одним запросом по окну времени начала, напоминания
+    лежат в куче по времени отправки, и цикл спит ровно до ближайшего из них.
+    Подтверждение и отмена брони перепланируют напоминания сразу (reschedule / unschedule).
+    Факт отправки хранится в reservations.reminder_*_sent_at и переживает перезапуск.
+    """
+
+    def __init__(self, bot: Bot, db_manager: DatabaseManager, dispatcher: OutboundDispatcher = None):
         self.bot = bot
         self.db_manager = db_manager
+        self.dispatcher = dispatcher or get_outbound_dispatcher(bot)
         self.is_running = False
-        self.sent_reminders_24h = set()
-        self.sent_reminders_3h = set()
+        
+        self.queue: List[Tuple[datetime, int, str]] = []  # куча (время отправки, id брони, тип)
+        self.scheduled: Dict[Tuple[int, str], datetime] = {}  # актуальные записи кучи
+        self.reservations: Dict[int, dict] = {}
+        self.messages: Dict[Tuple[int, str], OutgoingMessage] = {}  # отрендеренные напоминания
+        self._wakeup = asyncio.Event()
+        self._last_maintenance = None
+        self.stats = {'ticks': 0, 'sent': 0, 'failed': 0, 'last_tick': None}
     
     async def start(self):
         """Запуск системы напоминаний"""
         self.is_running = True
         while self.is_running:
             try:
-                # Сначала обновляем прошедшие брони
-                await self.db_manager.update_expired_reservations()
+                if self._last_maintenance is None or monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+                    await self.maintenance()
                 
-                # Затем проверяем напоминания
-                await self.check_reminders()
-                await asyncio.sleep(300)  # Проверяем каждые 5 минут
+                await self.send_due_reminders()
+                await self._sleep_until_next()
             except Exception as e:
                 print(f"Reminder system error: {e}")
                 await asyncio.sleep(60)
@@ -30,158 +83,145 @@ class ReminderSystem:
     async def stop(self):
         """Остановка системы напоминаний"""
         self.is_running = False
+        self._wakeup.set()
     
-    async def check_reminders(self):
-        """Проверка и отправка напоминаний"""
+    async def maintenance(self):
+        """Закрытие прошедших броней и сверка расписания с БД"""
+        self._last_maintenance = monotonic()
+        await self.db_manager.update_expired_reservations()
+        
+        # Брони, напоминание по которым может наступить до следующего обслуживания
         now = datetime.now()
+        reservations = await self.db_manager.get_upcoming_confirmed_reservations(
+            now + min(REMINDER_OFFSETS.values()) - REMINDER_GRACE,
+            now + max(REMINDER_OFFSETS.values()) + timedelta(seconds=MAINTENANCE_INTERVAL)
+        )
+        if reservations is None:
+            return
         
-        # Напоминание за 24 часа
-        tomorrow_date = (now + timedelta(days=1)).strftime("%d.%m.%Y")
-        tomorrow_reservations = await self.db_manager.get_reservations_for_date(tomorrow_date)
+        self.queue.clear()
+        self.scheduled.clear()
+        self.messages.clear()
+        self.reservations.clear()
+        for reservation in reservations:
+            self.reschedule(reservation)
         
-        for reservation in tomorrow_reservations:
-            if (reservation['status'] == 'confirmed' and 
-                reservation['id'] not in self.sent_reminders_24h):
-                
-                reservation_date = reservation['reservation_date']
-                reservation_time = reservation['reservation_time']
-                
-                if isinstance(reservation_date, date) and isinstance(reservation_time, time):
-                    reservation_datetime = datetime.combine(reservation_date, reservation_time)
-                    time_until_reservation = reservation_datetime - now
-                    
-                    # Отправляем напоминание за 23.5-24.5 часа до брони
-                    if timedelta(hours=23, minutes=30) <= time_until_reservation <= timedelta(hours=24, minutes=30):
-                        await self.send_24h_reminder(reservation)
-                        self.sent_reminders_24h.add(reservation['id'])
-        
-        # Напоминание за 3 часа
-        today_date = now.strftime("%d.%m.%Y")
-        today_reservations = await self.db_manager.get_reservations_for_date(today_date)
-        
-        for reservation in today_reservations:
-            if (reservation['status'] == 'confirmed' and 
-                reservation['id'] not in self.sent_reminders_3h):
-                
-                reservation_date = reservation['reservation_date']
-                reservation_time = reservation['reservation_time']
-                
-                if isinstance(reservation_date, date) and isinstance(reservation_time, time):
-                    reservation_datetime = datetime.combine(reservation_date, reservation_time)
-                    time_until_reservation = reservation_datetime - now
-                    
-                    # Отправляем напоминание за 2.5-3.5 часа до брони
-                    if timedelta(hours=2, minutes=30) <= time_until_reservation <= timedelta(hours=3, minutes=30):
-                        await self.send_3h_reminder(reservation)
-                        self.sent_reminders_3h.add(reservation['id'])
-        
-        # Очищаем старые записи из кэша напоминаний
-        self._cleanup_old_reminders()
-    
-    def _cleanup_old_reminders(self):
-        """Очистка старых напоминаний из кэша"""
-        # Удаляем ID броней, которые уже прошли (старше 2 дней)
-        current_ids_24h = set()
-        current_ids_3h = set()
-        
-        # В реальном приложении здесь нужно проверять актуальность ID в базе
-        # Пока просто ограничим размер множеств
-        if len(self.sent_reminders_24h) > 100:
-            self.sent_reminders_24h.clear()
-        if len(self.sent_reminders_3h) > 100:
-            self.sent_reminders_3h.clear()
+        print(f"⏰ Reminder schedule loaded: {len(self.scheduled)} reminders for {len(self.reservations)} reservations")
     
-    async def send_24h_reminder(self, reservation):
-        """Отправка напоминания за 24 часа"""
-        # Форматируем дату для отображения
-        reservation_date = reservation['reservation_date']
-        if isinstance(reservation_date, date):
-            formatted_date = reservation_date.strftime("%d.%m.%Y")
-        else:
-            formatted_date = str(reservation_date)
+    def reschedule(self, reservation):
+        """Постановка (или снятие) напоминаний брони по ее текущему статусу"""
+        reservation = dict(reservation)
+        self.unschedule(reservation['id'])
+        
+        if reservation['status'] != 'confirmed':
+            return
         
-        # Форматируем время для отображения
+        reservation_date = reservation['reservation_date']
         reservation_time = reservation['reservation_time']
-        if isinstance(reservation_time, time):
-            formatted_time = reservation_time.strftime("%H:%M")
-        else:
-            formatted_time = str(reservation_time)
-
-        # Создаем клавиатуру с кнопкой отмены
-        keyboard = InlineKeyboardBuilder()
-        keyboard.button(
-            text="❌ Отменить бронь", 
-            callback_data=f"cancel_reservation_{reservation['id']}"
+        if not (isinstance(reservation_date, date) and isinstance(reservation_time, time)):
+            return
+        
+        reservation_datetime = datetime.combine(reservation_date, reservation_time)
+        now = datetime.now()
+        
+        for kind, offset in REMINDER_OFFSETS.items():
+            due_at = reservation_datetime - offset
+            if reservation.get(f'reminder_{kind}_sent_at') or due_at + REMINDER_GRACE < now:
+                continue
+            self.scheduled[(reservation['id'], kind)] = due_at
+            self.messages[(reservation['id'], kind)] = self.render_reminder(reservation, kind)
+            heapq.heappush(self.queue, (due_at, reservation['id'], kind))
+        
+        if reservation_datetime > now:
+            self.reservations[reservation['id']] = reservation
+        self._wakeup.set()
+    
+    def unschedule(self, reservation_id: int):
+        """Снятие напоминаний брони (записи в куче отбрасываются при извлечении)"""
+        for kind in REMINDER_OFFSETS:
+            self.scheduled.pop((reservation_id, kind), None)
+            self.messages.pop((reservation_id, kind), None)
+        self.reservations.pop(reservation_id, None)
+    
+    async def send_due_reminders(self):
+        """Отправка всех напоминаний, время которых наступило"""
+        now = datetime.now()
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            due_at, reservation_id, kind = heapq.heappop(self.queue)
+            
+            # Устаревшая запись: бронь отменена или перепланирована
+            if self.scheduled.get((reservation_id, kind)) != due_at:
+                continue
+            del self.scheduled[(reservation_id, kind)]
+            
+            if (reservation_id, kind) in self.messages:
+                due.append((reservation_id, kind))
+        
+        if not due:
+            return
+        
+        # Отмечаем всю пачку одним UPDATE до отправки: отправляем только то,
+        # что еще не отметил другой процесс. Если БД недоступна - отправляем все
+        marked = await self.db_manager.mark_reminders_sent(due)
+        if marked is not None:
+            due = [reminder for reminder in due if reminder in marked]
+        
+        report = await self.dispatcher.send_many(
+            (self.messages.pop(reminder) for reminder in due), PRIORITY_REMINDER
         )
         
-        message_text = f"""
-🔔 <b>Напоминание о бронировании!</b>
-
-Через 24 часа у вас бронь в нашем ресторане.
-
-📅 Дата: {formatted_date}
-🕐 Время: {formatted_time}
-👥 Гости: {reservation['guests_count']}
-
-Если планы изменились, вы можете отменить бронь:
-"""
+        self.stats['ticks'] += 1
+        self.stats['sent'] += report.sent
+        self.stats['failed'] += report.failed
+        self.stats['last_tick'] = {
+            'at': now,
+            'sent': report.sent,
+            'failed': report.failed,
+            'duration': report.duration,
+            'avg_latency': report.avg_latency,
+            'max_latency': report.max_latency,
+        }
+        print(f"📨 Reminders sent: {report.sent}, failed: {report.failed}, "
+              f"tick {report.duration:.2f}s, avg latency {report.avg_latency:.3f}s")
+    
+    async def _sleep_until_next(self):
+        """Сон до ближайшего напоминания, обслуживания или изменения расписания"""
+        timeout = MAINTENANCE_INTERVAL - (monotonic() - self._last_maintenance)
+        if self.queue:
+            timeout = min(timeout, (self.queue[0][0] - datetime.now()).total_seconds())
         
+        self._wakeup.clear()
+        if timeout <= 0:
+            return
         try:
-            await self.bot.send_message(
-                reservation['user_id'], 
-                message_text, 
-                reply_markup=keyboard.as_markup(),
-                parse_mode="HTML"  # Добавляем HTML для форматирования
-            )
-            print(f"📨 Sent 24h reminder for reservation #{reservation['id']} to user {reservation['user_id']}")
-        except Exception as e:
-            print(f"❌ Failed to send 24h reminder: {e}")
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
     
-    async def send_3h_reminder(self, reservation):
-        """Отправка напоминания за 3 часа"""
-        # Форматируем дату для отображения
+    def render_reminder(self, reservation: dict, kind: str) -> OutgoingMessage:
+        """Готовое сообщение напоминания: текст по шаблону и клавиатура с отменой"""
         reservation_date = reservation['reservation_date']
-        if isinstance(reservation_date, date):
-            formatted_date = reservation_date.strftime("%d.%m.%Y")
-        else:
-            formatted_date = str(reservation_date)
-        
-        # Форматируем время для отображения
         reservation_time = reservation['reservation_time']
-        if isinstance(reservation_time, time):
-            formatted_time = reservation_time.strftime("%H:%M")
-        else:
-            formatted_time = str(reservation_time)
-
-        # Создаем клавиатуру с кнопкой отмены
-        keyboard = InlineKeyboardBuilder()
-        keyboard.button(
-            text="❌ Отменить бронь", 
-            callback_data=f"cancel_reservation_{reservation['id']}"
-        )
         
-        message_text = f"""
-⏰ <b>Скоро встреча!</b>
-
-Через 3 часа у вас бронь в нашем ресторане.
-
-📅 Дата: {formatted_date}
-🕐 Время: {formatted_time}
-👥 Гости: {reservation['guests_count']}
-
-Если не успеваете, отмените бронь:
-"""
+        text = REMINDER_TEMPLATES[kind].format(
+            date=reservation_date.strftime("%d.%m.%Y") if isinstance(reservation_date, date) else reservation_date,
+            time=reservation_time.strftime("%H:%M") if isinstance(reservation_time, time) else reservation_time,
+            guests=reservation['guests_count']
+        )
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="❌ Отменить бронь", callback_data=f"cancel_reservation_{reservation['id']}")
+        ]])
         
-        try:
-            await self.bot.send_message(
-                reservation['user_id'],
-                message_text, 
-                reply_markup=keyboard.as_markup(),
-                parse_mode="HTML"  # Добавляем HTML для форматирования
-            )
-            print(f"📨 Sent 3h reminder for reservation #{reservation['id']} to user {reservation['user_id']}")
-        except Exception as e:
-            print(f"❌ Failed to send 3h reminder: {e}")
+        return OutgoingMessage(reservation['user_id'], text, {"reply_markup": keyboard, "parse_mode": "HTML"})
+    
+    def get_stats(self) -> dict:
+        """Метрики отправки для мониторинга"""
+        return {
+            **self.stats,
+            'scheduled': len(self.scheduled),
+            'reservations': len(self.reservations),
+        }
 
 # Глобальный экземпляр системы напоминаний
 reminder_system = None
@@ -196,4 +236,14 @@ async def stop_reminder_system():
     """Остановка системы напоминаний"""
     global reminder_system
     if reminder_system:
-        await reminder_system.stop()
\ No newline at end of file
+        await reminder_system.stop()
+
+def reschedule_reservation_reminders(reservation):
+    """Перепланирование напоминаний после смены статуса брони"""
+    if reminder_system:
+        reminder_system.reschedule(reservation)
+
+def unschedule_reservation_reminders(reservation_id: int):
+    """Снятие напоминаний отмененной брони"""
+    if reminder_system:
+        reminder_system.unschedule(reservation_id)
\ No newline at end of file
@@ -0,0 +1,233 @@
+import asyncio
+import html
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from src.database.db_manager import DatabaseManager
+from src.utils.config import settings
+from src.utils.time_utils import format_restaurant_time
+from src.utils.telegram_sender import dispatch, dispatch_message, fan_out, PRIORITY_STAFF_CALL
+
+logger = logging.getLogger(__name__)
+
+# Уровни эскалации (staff_calls.escalation_level)
+ESCALATION_NONE = 0
+ESCALATION_WIDEN = 1    # вызов получает персонал, которого не было среди первых кандидатов
+ESCALATION_REPING = 2   # повторное уведомление всего персонала
+ESCALATION_ADMINS = 3   # сообщение администраторам
+
+class StaffCallEscalation:
+    """
+    Эскалация вызовов персонала, которые никто не принял.
+
+    На каждый непринятый вызов - таймер (задача), ключ - id вызова. Сначала вызов получают
+    только лучшие кандидаты (staff_call_routing); через STAFF_CALL_WIDEN_AFTER секунд
+    его получает остальной персонал, через STAFF_CALL_REPING_AFTER - весь персонал повторно
+    (старое сообщение удаляется, чтобы у официанта оставалась одна кнопка «Принять»),
+    через STAFF_CALL_ESCALATE_AFTER - администраторы получают отдельное предупреждение.
+    Принятие или отмена вызова снимает таймер (cancel).
+
+    Достигнутый уровень хранится в staff_calls.escalation_level и повышается атомарно,
+    поэтому после перезапуска (rebuild) и при нескольких процессах ступень не повторяется.
+    """
+
+    def __init__(self, bot: Bot, db_manager: DatabaseManager):
+        self.bot = bot
+        self.db_manager = db_manager
+        self.timers: Dict[int, asyncio.Task] = {}
+        self.stages: List[Tuple[int, int]] = [
+            (ESCALATION_WIDEN, settings.STAFF_CALL_WIDEN_AFTER),
+            (ESCALATION_REPING, settings.STAFF_CALL_REPING_AFTER),
+            (ESCALATION_ADMINS, settings.STAFF_CALL_ESCALATE_AFTER),
+        ]
+        self.stats = {'scheduled': 0, 'cancelled': 0, 'widen': 0, 'reping': 0, 'admins': 0}
+
+    async def rebuild(self) -> int:
+        """Восстановление таймеров по непринятым вызовам из БД"""
+        calls = await self.db_manager.get_pending_staff_calls(settings.STAFF_CALL_ESCALATION_MAX_AGE)
+        if calls is None:
+            return 0
+        for call in calls:
+            self.schedule(call['id'], call['notified_at'], call['escalation_level'])
+        logger.info(f"⏰ Staff call escalation restored for {len(calls)} pending calls")
+        return len(calls)
+
+    def schedule(self, call_id: int, notified_at: datetime = None, level: int = ESCALATION_NONE):
+        """Постановка таймера вызова. notified_at - когда персонал был уведомлен (по умолчанию сейчас)"""
+        self.cancel(call_id, count=False)
+        if level >= self.stages[-1][0]:
+            return
+        notified_at = notified_at or datetime.now(timezone.utc)
+        self.timers[call_id] = asyncio.create_task(self._run(call_id, notified_at, level))
+        self.stats['scheduled'] += 1
+
+    def cancel(self, call_id: int, count: bool = True):
+        """Снятие таймера: вызов принят, завершен или отменен"""
+        task = self.timers.pop(call_id, None)
+        if task:
+            task.cancel()
+            if count:
+                self.stats['cancelled'] += 1
+
+    async def stop(self):
+        """Остановка всех таймеров (состояние восстановится из БД при запуске)"""
+        tasks = list(self.timers.values())
+        self.timers.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, call_id: int, notified_at: datetime, level: int):
+        try:
+            stages = [stage for stage in self.stages if stage[0] > level]
+            for index, (stage_level, delay) in enumerate(stages):
+                now = datetime.now(timezone.utc)
+                # Пропущенные за время простоя ступени не отправляются, если уже наступила следующая
+                if index + 1 < len(stages) and (now - notified_at).total_seconds() >= stages[index + 1][1]:
+                    continue
+                wait = delay - (now - notified_at).total_seconds()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                # Принятие вызова во время отправки не обрывает ее: escalate сам увидит,
+                # что вызов принят, и уберет кнопку из новых сообщений
+                if not await asyncio.shield(self.escalate(call_id, stage_level)):
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Staff call #{call_id} escalation failed: {e}", exc_info=True)
+        finally:
+            if self.timers.get(call_id) is asyncio.current_task():
+                del self.timers[call_id]
+
+    async def escalate(self, call_id: int, level: int) -> bool:
+        """Отправка ступени эскалации. False - вызов уже не ждет (принят, отменен, эскалирован)"""
+        call = await self.db_manager.claim_staff_call_escalation(call_id, level)
+        if not call:
+            return False
+
+        message_ids = call.get('message_ids') or {}
+        if isinstance(message_ids, str):
+            message_ids = json.loads(message_ids)
+
+        if level == ESCALATION_ADMINS:
+            recipients = [admin['user_id'] for admin in await self.db_manager.get_admins()]
+        elif level == ESCALATION_WIDEN:
+            # Первые кандидаты уже получили вызов, остальным - впервые
+            recipients = [staff_id for staff_id in await self._staff_ids() if str(staff_id) not in message_ids]
+        else:
+            recipients = await self._staff_ids()
+
+        if not recipients:
+            # Некого уведомлять (весь персонал уже получил вызов, нет администраторов):
+            # ступень пройдена без отправки и в статистику не попадает
+            logger.debug(f"Staff call #{call_id}: escalation level {level} has no recipients")
+            return True
+
+        text = self.render(call, level)
+        markup = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="✅ Принять вызов", callback_data=f"accept_call_{call_id}")
+        ]])
+
+        async def notify(staff_id: int):
+            message = await dispatch_message(
+                self.bot, staff_id, text, PRIORITY_STAFF_CALL, reply_markup=markup, parse_mode="HTML"
+            )
+            previous_id = message_ids.get(str(staff_id))
+            if previous_id:
+                try:
+                    await dispatch(
+                        staff_id,
+                        lambda: self.bot.delete_message(chat_id=staff_id, message_id=previous_id),
+                        PRIORITY_STAFF_CALL
+                    )
+                except Exception as e:
+                    logger.debug(f"Could not delete previous call message for {staff_id}: {e}")
+            return message
+
+        report = await fan_out(recipients, notify, settings.STAFF_NOTIFY_CONCURRENCY)
+        for staff_id, error in report.errors.items():
+            logger.error(f"❌ Ошибка эскалации вызова #{call_id} для {staff_id}: {error}")
+
+        new_ids = {staff_id: message.message_id for staff_id, message in report.results.items()}
+        if new_ids and not await self.db_manager.merge_call_message_ids(call_id, new_ids):
+            # Вызов приняли, пока шла отправка: убираем кнопку из новых сообщений
+            await fan_out(new_ids, lambda staff_id: dispatch(
+                staff_id,
+                lambda: self.bot.edit_message_reply_markup(chat_id=staff_id, message_id=new_ids[staff_id]),
+                PRIORITY_STAFF_CALL
+            ), settings.STAFF_NOTIFY_CONCURRENCY)
+            return False
+
+        self.stats[{ESCALATION_WIDEN: 'widen', ESCALATION_REPING: 'reping'}.get(level, 'admins')] += 1
+        logger.info(f"🔔 Вызов #{call_id} эскалирован (уровень {level}): "
+                    f"уведомлено {len(new_ids)} из {len(recipients)}")
+        return True
+
+    async def _staff_ids(self) -> List[int]:
+        """Весь персонал: официанты и администраторы"""
+        staff_users = await self.db_manager.get_staff()
+        admin_users = await self.db_manager.get_admins()
+        return list({user['user_id'] for user in staff_users + admin_users})
+
+    @staticmethod
+    def render(call: Dict, level: int) -> str:
+        """Текст повторного уведомления или предупреждения администраторам"""
+        waiting = datetime.now(timezone.utc) - call['created_at']
+        minutes = max(int(waiting.total_seconds() // 60), 1)
+        client = html.escape(call.get('user_name') or "Клиент")
+        if call.get('user_username'):
+            client += f" (@{call['user_username']})"
+
+        if level == ESCALATION_ADMINS:
+            header = "🚨 <b>ВЫЗОВ НЕ ПРИНЯТ</b>"
+            footer = f"<i>Никто из персонала не принял вызов за {minutes} мин</i>"
+        elif level == ESCALATION_WIDEN:
+            header = "🆘 <b>ВЫЗОВ ПЕРСОНАЛА</b>"
+            footer = "<i>Официанты зоны не ответили - кто первый успеет, того и клиент!</i>"
+        else:
+            header = "🔁 <b>ПОВТОРНЫЙ ВЫЗОВ ПЕРСОНАЛА</b>"
+            footer = "<i>Клиент все еще ждет!</i>"
+
+        return (
+            f"{header}\n\n"
+            f"🪑 <b>Стол:</b> #{call['table_number']}\n"
+            f"👤 <b>Клиент:</b> {client}\n"
+            f"⏰ <b>Время вызова:</b> {format_restaurant_time(call['created_at'])}\n"
+            f"⏳ <b>Ожидает:</b> {minutes} мин\n"
+            f"🆔 <b>ID вызова:</b> {call['id']}\n\n"
+            f"{footer}"
+        )
+
+    def get_stats(self) -> dict:
+        """Метрики для мониторинга"""
+        return {**self.stats, 'active_timers': len(self.timers)}
+
+# Глобальный экземпляр эскалации вызовов
+staff_call_escalation: Optional[StaffCallEscalation] = None
+
+async def start_staff_call_escalation(bot: Bot, db_manager: DatabaseManager):
+    """Запуск эскалации и восстановление таймеров непринятых вызовов"""
+    global staff_call_escalation
+    staff_call_escalation = StaffCallEscalation(bot, db_manager)
+    await staff_call_escalation.rebuild()
+
+async def stop_staff_call_escalation():
+    """Остановка таймеров эскалации"""
+    if staff_call_escalation:
+        await staff_call_escalation.stop()
+
+def schedule_call_escalation(call_id: int):
+    """Таймер эскалации для только что уведомленного вызова"""
+    if staff_call_escalation:
+        staff_call_escalation.schedule(call_id)
+
+def cancel_call_escalation(call_id: int):
+    """Снятие таймера эскалации принятого или отмененного вызова"""
+    if staff_call_escalation:
+        staff_call_escalation.cancel(call_id)
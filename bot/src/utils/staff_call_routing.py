@@ -0,0 +1,66 @@
+"""
+Маршрутизация вызовов персонала.
+
+Вместо «кто первый успеет» вызов сначала получают 1-2 лучших официанта:
+закрепленные за зоной стола (staff_users.zone), с наименьшим числом принятых
+и не завершенных вызовов. Остальной персонал подключается эскалацией
+(staff_call_escalation), если вызов не приняли вовремя.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from src.database.db_manager import DatabaseManager
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StaffCandidate:
+    """Официант и его загрузка на момент вызова"""
+    user_id: int
+    zone: Optional[str] = None
+    table_zone: Optional[str] = None
+    open_calls: int = 0
+    zone_calls: int = 0
+    last_accepted_at: Optional[datetime] = None
+
+    @property
+    def zone_rank(self) -> int:
+        """0 - зона стола (или у стола нет зоны), 1 - официант без зоны, 2 - другая зона"""
+        if not self.table_zone or self.zone == self.table_zone:
+            return 0
+        return 1 if self.zone is None else 2
+
+    def sort_key(self) -> tuple:
+        # Зона, затем меньше открытых вызовов, затем кто уже работал в этой зоне,
+        # затем кто дольше не принимал вызовов
+        idle_since = self.last_accepted_at.timestamp() if self.last_accepted_at else 0.0
+        return (self.zone_rank, self.open_calls, -self.zone_calls, idle_since)
+
+def rank_staff_candidates(candidates: List[StaffCandidate]) -> List[StaffCandidate]:
+    """Официанты от лучшего кандидата к худшему"""
+    return sorted(candidates, key=StaffCandidate.sort_key)
+
+async def route_staff_call(db_manager: DatabaseManager, table_number: int, limit: int = None) -> List[int]:
+    """
+    ID официантов, которые получают вызов первыми.
+    Пустой список - маршрутизация выключена или недоступна, уведомляется весь персонал
+    """
+    limit = settings.STAFF_CALL_ROUTING_CANDIDATES if limit is None else limit
+    if limit <= 0:
+        return []
+
+    rows = await db_manager.get_staff_call_candidates(table_number, settings.STAFF_CALL_LOAD_WINDOW)
+    if not rows:
+        return []
+
+    ranked = rank_staff_candidates([StaffCandidate(**row) for row in rows])
+    chosen = ranked[:limit]
+    logger.info(
+        f"🧭 Стол #{table_number} (зона {chosen[0].table_zone or '-'}): "
+        + ", ".join(f"{c.user_id} [зона {c.zone or '-'}, открытых {c.open_calls}]" for c in chosen)
+    )
+    return [candidate.user_id for candidate in chosen]
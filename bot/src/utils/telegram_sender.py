@@ -0,0 +1,387 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+)
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Классы ошибок доставки
+ERROR_BLOCKED = 'blocked'                # пользователь заблокировал бота или удалил аккаунт
+ERROR_CHAT_NOT_FOUND = 'chat_not_found'  # чата с пользователем не существует
+ERROR_RATE_LIMITED = 'rate_limited'      # flood control, повтор после retry_after
+ERROR_TRANSIENT = 'transient'            # сеть или сервер Telegram, можно повторить
+ERROR_PERMANENT = 'permanent'            # ошибка в самом сообщении, повтор не поможет
+
+# Полосы исходящих сообщений: меньше - важнее. Рассылка не задерживает вызов персонала
+PRIORITY_STAFF_CALL = 0
+PRIORITY_ORDER = 1
+PRIORITY_REMINDER = 2
+PRIORITY_BROADCAST = 3
+LANE_NAMES = {
+    PRIORITY_STAFF_CALL: 'staff_calls',
+    PRIORITY_ORDER: 'orders',
+    PRIORITY_REMINDER: 'reminders',
+    PRIORITY_BROADCAST: 'broadcasts',
+}
+# Сколько последних задержек хранится для метрик полосы
+LATENCY_WINDOW = 500
+
+CHAT_NOT_FOUND_MARKERS = ('chat not found', 'user not found', 'peer_id_invalid')
+
+def classify_delivery_error(error: Exception) -> str:
+    """Класс ошибки отправки: от него зависит, повторять ли отправку и доступен ли пользователь"""
+    if isinstance(error, TelegramRetryAfter):
+        return ERROR_RATE_LIMITED
+    if isinstance(error, TelegramForbiddenError):
+        return ERROR_BLOCKED
+    if isinstance(error, TelegramBadRequest):
+        message = error.message.lower()
+        if any(marker in message for marker in CHAT_NOT_FOUND_MARKERS):
+            return ERROR_CHAT_NOT_FOUND
+        return ERROR_PERMANENT
+    if isinstance(error, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)):
+        return ERROR_TRANSIENT
+    return ERROR_TRANSIENT
+
+class TokenBucket:
+    """Корзина токенов: не больше rate операций в секунду, всплеск до capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов (Telegram ответил RetryAfter) и сбросить накопленный запас"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    self.updated_at = time.monotonic()
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+_global_bucket: Optional[TokenBucket] = None
+
+def get_global_bucket() -> TokenBucket:
+    """Общая корзина всех отправок бота: лимит Telegram считается на бота, а не на рассылку"""
+    global _global_bucket
+    if _global_bucket is None:
+        _global_bucket = TokenBucket(settings.TELEGRAM_GLOBAL_RATE_LIMIT)
+    return _global_bucket
+
+@dataclass
+class OutgoingMessage:
+    """Готовое к отправке сообщение (текст и клавиатура собраны заранее)"""
+    chat_id: int
+    text: str
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class SendReport:
+    """Итог отправки пачки сообщений"""
+    sent: int = 0
+    failed: int = 0
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+
+    @property
+    def avg_latency(self) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    @property
+    def max_latency(self) -> float:
+        return max(self.latencies, default=0.0)
+
+@dataclass
+class FanOutReport:
+    """Итог отправки одного события многим получателям"""
+    results: Dict[int, Any] = field(default_factory=dict)          # chat_id -> ответ Telegram
+    errors: Dict[int, Exception] = field(default_factory=dict)
+    latencies: Dict[int, float] = field(default_factory=dict)      # chat_id -> секунд с начала до доставки
+    duration: float = 0.0
+
+    @property
+    def last_latency(self) -> float:
+        """Через сколько получил сообщение последний получатель"""
+        return max(self.latencies.values(), default=0.0)
+
+async def fan_out(chat_ids: Iterable[int], call: Callable[[int], Awaitable[Any]],
+                  concurrency: int = 10) -> FanOutReport:
+    """
+    Параллельный вызов call(chat_id) для всех получателей, не больше concurrency одновременно.
+    Ответы и задержки собираются за один проход, ошибка одного получателя не мешает остальным
+    """
+    report = FanOutReport()
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+
+    async def deliver(chat_id: int):
+        async with semaphore:
+            try:
+                report.results[chat_id] = await call(chat_id)
+                report.latencies[chat_id] = time.monotonic() - started
+            except Exception as e:
+                report.errors[chat_id] = e
+
+    await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids))
+    report.duration = time.monotonic() - started
+    return report
+
+@dataclass(order=True)
+class _OutboundRequest:
+    """Вызов Telegram API в очереди диспетчера (порядок: полоса, затем время постановки)"""
+    priority: int
+    seq: int
+    chat_id: int = field(compare=False)
+    call: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+@dataclass
+class LaneStats:
+    """Метрики полосы: глубина очереди, результаты и задержка от постановки до отправки"""
+    queued: int = 0
+    sent: int = 0
+    failed: int = 0
+    retry_after: int = 0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            'queued': self.queued,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retry_after': self.retry_after,
+            'avg_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+            'p95_latency': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            'max_latency': latencies[-1] if latencies else 0.0,
+        }
+
+class OutboundDispatcher:
+    """
+    Единая очередь исходящих вызовов Telegram API.
+
+    Вызовы ставятся в полосы по приоритету (вызов персонала > заказы > напоминания > рассылки)
+    и уходят с общей корзиной токенов бота и не чаще раза в per_chat_interval в один чат.
+    Следующим всегда отправляется самый важный готовый вызов, поэтому рассылка
+    не задерживает уведомления персонала дольше одного токена корзины.
+    TelegramRetryAfter приостанавливает корзину и возвращает вызов в очередь.
+    """
+
+    def __init__(self, bot: Bot, concurrency: int = None, bucket: TokenBucket = None,
+                 per_chat_interval: float = 1.0, max_retries: int = 3):
+        self.bot = bot
+        self.bucket = bucket or get_global_bucket()
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.lanes: Dict[int, LaneStats] = {priority: LaneStats() for priority in LANE_NAMES}
+        self._slots = asyncio.Semaphore(concurrency or settings.OUTBOUND_CONCURRENCY)
+        self._seq = itertools.count()
+        self._chat_next_send: Dict[int, float] = {}
+        self._in_flight: Set[asyncio.Task] = set()
+        self._delayed: Set[asyncio.TimerHandle] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self, timeout: float = 5.0):
+        """Остановка: ждем отправки очереди не дольше timeout, остальное отменяем"""
+        deadline = time.monotonic() + timeout
+        while (self.pending or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for handle in self._delayed:
+            handle.cancel()
+        self._delayed.clear()
+        while not self.queue.empty():
+            self.queue.get_nowait().future.cancel()
+        for task in list(self._in_flight):
+            task.cancel()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    @property
+    def pending(self) -> int:
+        """Вызовов в очереди, включая ожидающие свободного чата"""
+        return sum(lane.queued for lane in self.lanes.values())
+
+    def submit(self, chat_id: int, call: Callable[[], Awaitable[Any]],
+               priority: int = PRIORITY_ORDER) -> asyncio.Future:
+        """Постановка вызова в очередь. Future получает результат вызова или его исключение"""
+        request = _OutboundRequest(
+            priority, next(self._seq), chat_id, call,
+            asyncio.get_running_loop().create_future(), time.monotonic()
+        )
+        self.lanes[priority].queued += 1
+        self.queue.put_nowait(request)
+        return request.future
+
+    async def call(self, chat_id: int, call: Callable[[], Awaitable[Any]], priority: int = PRIORITY_ORDER) -> Any:
+        return await self.submit(chat_id, call, priority)
+
+    async def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_ORDER, **kwargs):
+        return await self.call(chat_id, lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs), priority)
+
+    async def send_photo(self, chat_id: int, photo: str, priority: int = PRIORITY_ORDER, **kwargs):
+        return await self.call(chat_id, lambda: self.bot.send_photo(chat_id=chat_id, photo=photo, **kwargs), priority)
+
+    async def send_many(self, messages: Iterable[OutgoingMessage], priority: int) -> SendReport:
+        """Отправка пачки готовых сообщений в одной полосе"""
+        report = SendReport()
+        started = time.monotonic()
+
+        async def send(message: OutgoingMessage) -> Optional[float]:
+            try:
+                await self.send_message(message.chat_id, message.text, priority, **message.kwargs)
+                return time.monotonic() - started
+            except Exception as e:
+                logger.error(f"❌ Failed to send message to {message.chat_id}: {e}")
+                return None
+
+        results = await asyncio.gather(*(send(message) for message in messages))
+        for latency in results:
+            if latency is None:
+                report.failed += 1
+            else:
+                report.sent += 1
+                report.latencies.append(latency)
+
+        report.duration = time.monotonic() - started
+        return report
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Метрики по полосам для мониторинга"""
+        return {LANE_NAMES[priority]: lane.snapshot() for priority, lane in self.lanes.items()}
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._slots.acquire()
+            request = await self.queue.get()
+            if request.future.done():  # вызывающий перестал ждать
+                self.lanes[request.priority].queued -= 1
+                self._slots.release()
+                continue
+
+            # Чат еще не готов - вызов вернется в очередь к своему времени, не занимая отправителя
+            ready_at = self._chat_next_send.get(request.chat_id, 0.0)
+            now = time.monotonic()
+            if ready_at > now:
+                self._slots.release()
+                self._requeue_later(request, ready_at - now)
+                continue
+
+            await self.bucket.acquire()
+            self._chat_next_send[request.chat_id] = time.monotonic() + self.per_chat_interval
+            self.lanes[request.priority].queued -= 1
+            task = asyncio.create_task(self._execute(request))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+            if len(self._chat_next_send) > 10000:
+                self._forget_idle_chats()
+
+    def _requeue_later(self, request: _OutboundRequest, delay: float):
+        def put_back():
+            self._delayed.discard(handle)
+            self.queue.put_nowait(request)
+        handle = asyncio.get_running_loop().call_later(delay, put_back)
+        self._delayed.add(handle)
+
+    async def _execute(self, request: _OutboundRequest):
+        lane = self.lanes[request.priority]
+        try:
+            result = await request.call()
+        except TelegramRetryAfter as e:
+            lane.retry_after += 1
+            logger.warning(f"⏳ Telegram flood control: retry after {e.retry_after}s "
+                           f"({LANE_NAMES[request.priority]}, chat {request.chat_id})")
+            self.bucket.pause(e.retry_after)
+            if request.attempts < self.max_retries:
+                request.attempts += 1
+                lane.queued += 1
+                self.queue.put_nowait(request)
+            else:
+                lane.failed += 1
+                if not request.future.done():
+                    request.future.set_exception(e)
+        except Exception as e:
+            lane.failed += 1
+            if not request.future.done():
+                request.future.set_exception(e)
+        else:
+            lane.sent += 1
+            lane.latencies.append(time.monotonic() - request.enqueued_at)
+            if not request.future.done():
+                request.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def _forget_idle_chats(self):
+        """Чаты, в которые давно не писали, больше не ограничивают отправку"""
+        now = time.monotonic()
+        self._chat_next_send = {
+            chat_id: next_send for chat_id, next_send in self._chat_next_send.items() if next_send > now
+        }
+
+# Глобальный диспетчер исходящих сообщений
+outbound_dispatcher: Optional[OutboundDispatcher] = None
+
+def get_outbound_dispatcher(bot: Bot) -> OutboundDispatcher:
+    """Глобальный диспетчер (запускается при первом обращении)"""
+    global outbound_dispatcher
+    if outbound_dispatcher is None:
+        outbound_dispatcher = OutboundDispatcher(bot)
+        outbound_dispatcher.start()
+    return outbound_dispatcher
+
+def start_outbound_dispatcher(bot: Bot) -> OutboundDispatcher:
+    return get_outbound_dispatcher(bot)
+
+async def stop_outbound_dispatcher():
+    global outbound_dispatcher
+    if outbound_dispatcher:
+        await outbound_dispatcher.stop()
+        outbound_dispatcher = None
+
+async def dispatch(chat_id: int, call: Callable[[], Awaitable[Any]], priority: int = PRIORITY_ORDER) -> Any:
+    """Вызов Telegram API через диспетчер (напрямую, если диспетчер не запущен)"""
+    if outbound_dispatcher is None:
+        return await call()
+    return await outbound_dispatcher.call(chat_id, call, priority)
+
+async def dispatch_message(bot: Bot, chat_id: int, text: str, priority: int = PRIORITY_ORDER, **kwargs):
+    return await dispatch(chat_id, lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs), priority)
+
+async def dispatch_photo(bot: Bot, chat_id: int, photo: str, priority: int = PRIORITY_ORDER, **kwargs):
+    return await dispatch(chat_id, lambda: bot.send_photo(chat_id=chat_id, photo=photo, **kwargs), priority)
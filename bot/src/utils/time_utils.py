@@ -1,4 +1,4 @@
-from datetime import date, datetime, time
+from datetime import date, datetime, time, timedelta
 import pytz
 from src.utils.logger import get_logger
 
@@ -64,4 +64,38 @@ def parse_reservation_datetime(date_str, time_str):
         
     except Exception as e:
         logger.error(f"❌ Error parsing reservation datetime: date_str={date_str}, time_str={time_str}, error={e}")
-        return None
\ No newline at end of file
+        return None
+
+def parse_schedule_time(text, now=None):
+    """
+    Время запуска отложенной рассылки по времени ресторана:
+    "ЧЧ:ММ" (сегодня, а если время прошло - завтра), "ДД.ММ ЧЧ:ММ" (в этом году,
+    а если дата прошла - в следующем) или "ДД.ММ.ГГГГ ЧЧ:ММ".
+    Возвращает datetime в UTC или None, если формат не распознан
+    """
+    now = get_restaurant_time(now)
+    try:
+        parts = text.strip().split()
+        hour, minute = map(int, parts[-1].split(':'))
+        if len(parts) == 1:
+            scheduled = RESTAURANT_TIMEZONE.localize(datetime(now.year, now.month, now.day, hour, minute))
+            if scheduled <= now:
+                scheduled = RESTAURANT_TIMEZONE.localize(
+                    datetime.combine(now.date() + timedelta(days=1), time(hour, minute))
+                )
+        elif len(parts) == 2:
+            date_parts = list(map(int, parts[0].split('.')))
+            day, month = date_parts[0], date_parts[1]
+            if len(date_parts) > 2:
+                scheduled = RESTAURANT_TIMEZONE.localize(datetime(date_parts[2], month, day, hour, minute))
+            else:
+                # Без года - ближайшая такая дата: прошедшая в этом году переносится на следующий
+                scheduled = RESTAURANT_TIMEZONE.localize(datetime(now.year, month, day, hour, minute))
+                if scheduled <= now:
+                    scheduled = RESTAURANT_TIMEZONE.localize(datetime(now.year + 1, month, day, hour, minute))
+        else:
+            return None
+    except (ValueError, IndexError):
+        return None
+    
+    return scheduled.astimezone(pytz.utc)